@@ -2,17 +2,20 @@
 
 import argparse
 
-from ucca.ioutil import write_passage, get_passages_with_progress_bar
-from ucca.textutil import annotate_all, is_annotated
+from ucca.ioutil import PassageWriter, get_passages_with_progress_bar
+from ucca.textutil import annotate_all, is_annotated, AnnotationCache
 
 desc = """Read UCCA standard format in XML or binary pickle, and write back with POS tags and dependency parse."""
 
 
 def main(args):
-    for passage in annotate_all(get_passages_with_progress_bar(args.filenames, desc="Annotating"),
-                                replace=True, as_array=args.as_array, verbose=args.verbose):
-        assert is_annotated(passage, args.as_array), "Passage %s is not annotated" % passage.ID
-        write_passage(passage, outdir=args.out_dir, verbose=args.verbose)
+    with PassageWriter(outdir=args.out_dir, verbose=args.verbose, workers=args.workers) as writer:
+        for passage in annotate_all(get_passages_with_progress_bar(args.filenames, desc="Annotating"),
+                                    replace=True, as_array=args.as_array, verbose=args.verbose,
+                                    n_process=args.n_process, batch_size=args.batch_size,
+                                    cache=AnnotationCache(args.cache) if args.cache else None):
+            assert is_annotated(passage, args.as_array), "Passage %s is not annotated" % passage.ID
+            writer.write(passage)
 
 
 if __name__ == '__main__':
@@ -21,4 +24,8 @@ if __name__ == '__main__':
     argparser.add_argument("-o", "--out-dir", default=".", help="directory to write annotated files to")
     argparser.add_argument("-a", "--as-array", action="store_true", help="save annotations as array in passage level")
     argparser.add_argument("-v", "--verbose", action="store_true", help="print tagged text for each passage")
+    argparser.add_argument("-j", "--workers", type=int, help="number of processes to serialize passages in")
+    argparser.add_argument("-n", "--n-process", type=int, help="number of processes for spaCy to annotate in")
+    argparser.add_argument("-b", "--batch-size", type=int, help="number of paragraphs for spaCy to annotate at a time")
+    argparser.add_argument("-c", "--cache", help="directory of annotation cache, to reuse annotation of the same text")
     main(argparser.parse_args())
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+from glob import glob
+from itertools import cycle, islice
+from timeit import timeit
+
+from ucca.convert import file2passage, split2sentences, join_passages
+
+desc = """Measures the speed of joining per-sentence passages into documents, and of splitting them back."""
+
+
+def main(args):
+    sentences = [s for f in args.filenames for s in split2sentences(file2passage(f))]
+    sentences = list(islice(cycle(sentences), args.sentences))
+    document = join_passages(sentences)
+    print("sentences,terminals,join_passages,split2sentences")
+    print(",".join(map(str, (len(sentences), len(document.layer("0").all)))) + "," + ",".join(
+        "%.3fs" % (timeit(f, number=args.number) / args.number) for f in (
+            lambda: join_passages(sentences),
+            lambda: split2sentences(document))))
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description=desc)
+    argparser.add_argument("filenames", nargs="*", default=sorted(glob(os.path.join("test_files", "standard3*.xml"))),
+                           help="passage files to take sentences from (repeated as needed)")
+    argparser.add_argument("-s", "--sentences", type=int, default=1000, help="number of sentences per document")
+    argparser.add_argument("-n", "--number", type=int, default=3, help="number of repetitions per measurement")
+    main(argparser.parse_args())
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+import argparse
+import time
+
+from ucca import core, layer0, layer1
+from ucca.ioutil import get_passages
+from ucca.textutil import break2sentences, SENTENCE_SPLITTERS
+
+desc = """Compares the speed of the sentence splitters used for passages without annotation, and their agreement with
+a reference: either another splitter (by default the spaCy parser), or the sentences according to the annotation."""
+
+ANNOTATION = "annotation"
+
+
+def strip_annotation(passage):
+    """Copy just the terminals of the passage, so that break2sentences uses a sentence splitter"""
+    other = core.Passage(passage.ID, attrib=passage.attrib.copy())
+    l0 = layer0.Layer0(other)
+    layer1.Layer1(other)
+    for terminal in passage.layer(layer0.LAYER_ID).all:
+        l0.add_terminal(text=terminal.text, punct=terminal.punct, paragraph=terminal.paragraph)
+    return other
+
+
+def main(args):
+    passages = [(p, strip_annotation(p)) for p in get_passages(args.filenames)]
+    splitters = [args.reference] + [s for s in args.splitters if s != args.reference]
+    ends = {}
+    times = {}
+    for splitter in splitters:
+        started = time.time()
+        if splitter == ANNOTATION:
+            ends[splitter] = [break2sentences(p, lang=args.lang) for p, _ in passages]
+        else:
+            ends[splitter] = [break2sentences(p, lang=args.lang, splitter=splitter) for _, p in passages]
+        times[splitter] = time.time() - started
+    print("splitter,time,sentences,precision,recall,f1")
+    reference = [set(e[:-1]) for e in ends[args.reference]]  # The end of the passage is always a sentence end
+    for splitter in splitters:
+        predicted = [set(e[:-1]) for e in ends[splitter]]
+        correct = sum(len(p & r) for p, r in zip(predicted, reference))
+        n_predicted = sum(map(len, predicted))
+        n_reference = sum(map(len, reference))
+        precision = correct / n_predicted if n_predicted else 1.0
+        recall = correct / n_reference if n_reference else 1.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        print("%s,%.3fs,%d,%.3f,%.3f,%.3f" % (splitter, times[splitter], sum(map(len, ends[splitter])),
+                                              precision, recall, f1))
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description=desc)
+    argparser.add_argument("filenames", nargs="+", help="passage files or directories to split")
+    argparser.add_argument("-s", "--splitters", nargs="+", default=list(SENTENCE_SPLITTERS),
+                           choices=list(SENTENCE_SPLITTERS) + [ANNOTATION], help="sentence splitters to compare")
+    argparser.add_argument("-r", "--reference", default="parser", choices=list(SENTENCE_SPLITTERS) + [ANNOTATION],
+                           help="sentence splitter to measure agreement with")
+    argparser.add_argument("-l", "--lang", default="en", help="two-letter language code")
+    main(argparser.parse_args())
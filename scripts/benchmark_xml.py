@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import tempfile
+from glob import glob
+from timeit import timeit
+
+from ucca import convert
+from ucca.convert import get_xml_backend, xml2passage, passage2file, from_site, to_site, to_standard, XML_BACKENDS
+
+desc = """Compares the speed of the available XML backends for reading and writing standard and site XML files.
+Writing standard XML files directly, without any backend, is timed as well."""
+
+
+def main(args):
+    standard_files = [f for f in args.filenames if not os.path.basename(f).startswith("site")]
+    site_files = [f for f in args.filenames if os.path.basename(f).startswith("site")]
+    passages = [xml2passage(f, backend=convert.ETREE) for f in standard_files]
+    backends = [b for b in XML_BACKENDS if b == convert.ETREE or convert.LET is not None]
+    with tempfile.TemporaryDirectory() as tmp:
+        outfile = os.path.join(tmp, "passage.xml")
+        print("Writing directly: passage2file=%.3fms" % (
+            1000 * timeit(lambda: [passage2file(p, outfile) for p in passages], number=args.number) / args.number))
+        print("backend,from_standard,to_standard,passage2file,from_site,to_site")
+        for backend in backends:
+            etree = get_xml_backend(backend)
+            site_roots = [etree.parse(f).getroot() for f in site_files]
+            site_passages = [from_site(r) for r in site_roots]
+            timings = [
+                lambda: [xml2passage(f, backend=backend) for f in standard_files],
+                lambda: [to_standard(p, backend=backend) for p in passages],
+                lambda: [passage2file(p, outfile, backend=backend) for p in passages],
+                lambda: [from_site(r) for r in site_roots],
+                lambda: [to_site(p, backend=backend) for p in site_passages],
+            ]
+            print(",".join([backend] + ["%.3fms" % (1000 * timeit(f, number=args.number) / args.number)
+                                        for f in timings]))
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description=desc)
+    argparser.add_argument("filenames", nargs="*", default=sorted(glob(os.path.join("test_files", "*.xml"))),
+                           help="standard and site (\"site*.xml\") XML files to benchmark on")
+    argparser.add_argument("-n", "--number", type=int, default=20, help="number of repetitions per measurement")
+    main(argparser.parse_args())
@@ -1,35 +1,156 @@
 #!/usr/bin/env python3
 """The evaluation script for UCCA layer 1."""
 import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
 from itertools import repeat
+from xml.etree import ElementTree
 
-from argparse import ArgumentParser
+from argparse import ArgumentParser, Namespace
 
-from ucca import evaluation, constructions, ioutil
+from ucca import evaluation, constructions, ioutil, bootstrap
 
 
 def main(args):
-    guessed, ref, ref_yield_tags = [None if x is None else ioutil.read_files_and_dirs((x,))
-                                    for x in (args.guessed, args.ref, args.ref_yield_tags)]
-    if args.match_by_id:
-        guessed = match_by_id(guessed, ref)
-        ref_yield_tags = match_by_id(ref_yield_tags, ref)
-    results = []
+    eval_type = evaluation.UNLABELED if args.unlabeled else evaluation.LABELED
+    results = evaluate_passages(args)
+    passage_counts = []
+    if args.bootstrap:
+        results = collect_counts(results, passage_counts)
+    summarize(args, results, eval_type=eval_type)
+    if args.bootstrap:
+        resample(args, passage_counts)
+
+
+def evaluate_passages(args):
+    """
+    :return: generator of Scores, one for each pair of passages from args.guessed and args.ref
+    """
+    if args.jobs > 1:
+        yield from evaluate_parallel(args)
+        return
+    with ExitStack() as stack:  # Archives are closed once all passages are evaluated
+        guessed, ref, ref_yield_tags = [
+            None if x is None else stack.enter_context(ioutil.PassageArchive(x)) if ioutil.is_archive(x) else
+            ioutil.read_files_and_dirs((x,)) for x in (args.guessed, args.ref, args.ref_yield_tags)]
+        n = len(guessed)
+        if args.match_by_id:
+            guessed = match_by_id(guessed, ref)
+            ref_yield_tags = match_by_id(ref_yield_tags, ref)
+        yield from evaluate_all(args, guessed, ref, ref_yield_tags, n)
+
+
+def evaluate_options(args, n):
+    return dict(constructions=args.constructions, units=args.units, fscore=args.fscore, errors=args.errors,
+                verbose=args.verbose or n == 1, normalize=args.normalize,
+                eval_type=evaluation.UNLABELED if args.unlabeled else None, copy=False)  # Passages are not reused
+
+
+def evaluate_all(args, guessed, ref, ref_yield_tags, n):
     eval_type = evaluation.UNLABELED if args.unlabeled else evaluation.LABELED
     for g, r, ryt in zip(guessed, ref, ref_yield_tags or repeat(None)):
-        if len(guessed) > 1:
+        if n > 1:
             sys.stdout.write("\rEvaluating %s%s" % (g.ID, ":" if args.verbose else "..."))
             sys.stdout.flush()
         if args.verbose:
             print()
-        result = evaluation.evaluate(g, r, constructions=args.constructions, units=args.units, fscore=args.fscore,
-                                     errors=args.errors, verbose=args.verbose or len(guessed) == 1,
-                                     normalize=args.normalize, ref_yield_tags=ryt,
-                                     eval_type=evaluation.UNLABELED if args.unlabeled else None)
+        result = evaluation.evaluate(g, r, ref_yield_tags=ryt, **evaluate_options(args, n))
         if args.verbose:
             print_f1(result, eval_type)
-        results.append(result)
-    summarize(args, results, eval_type=eval_type)
+        yield result
+
+
+def evaluate_parallel(args):
+    """
+    Evaluate passage pairs in worker processes. The passages are indexed here, and each worker process loads the
+    passages it evaluates from the files by itself, returning just the counts of the results (see Scores.counts).
+    The results are returned in the same order as by evaluate_all, with at most 2 * args.jobs pairs pending at a time.
+    The passages are not printed, even with --verbose, since the output of the worker processes would be interleaved.
+    """
+    eval_type = evaluation.UNLABELED if args.unlabeled else evaluation.LABELED
+    executor = ProcessPoolExecutor(max_workers=args.jobs)
+    pending = deque()
+    try:
+        pairs = index_pairs(args, executor)
+        if len(pairs) == 1:  # Nothing to parallelize, but print the results like evaluate_all
+            yield from evaluate_all(args, *[[_load_entry(e)] for e in pairs[0]], n=1)
+            return
+        options = dict(evaluate_options(args, len(pairs)), verbose=False)
+        pairs = iter(pairs)
+        while True:
+            for pair in pairs:
+                pending.append(executor.submit(_evaluate_entries, pair, options))
+                if len(pending) >= 2 * args.jobs:
+                    break
+            if not pending:
+                return
+            passage_id, counts = pending.popleft().result()
+            sys.stdout.write("\rEvaluated %s%s" % (passage_id, ":\n" if args.verbose else "..."))
+            sys.stdout.flush()
+            result = evaluation.Scores.from_counts(counts)
+            if args.verbose:
+                print_f1(result, eval_type)
+            yield result
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown()
+
+
+def index_pairs(args, executor):
+    """
+    :return: list of triples of the locations (PassageEntry) of the guessed passage, the reference passage and the
+             reference passage for fine-grained evaluation (or None), for each pair of passages to evaluate
+    """
+    guessed, ref, ref_yield_tags = [None if x is None else ioutil.read_files_and_dirs((x,), index=True).entries
+                                    for x in (args.guessed, args.ref, args.ref_yield_tags)]
+    if args.match_by_id and len(guessed) > 1:
+        ids = list(executor.map(_entry_id, ref, chunksize=16))
+        guessed = match_entries_by_id(guessed, ids, executor)
+        ref_yield_tags = match_entries_by_id(ref_yield_tags, ids, executor)
+    return list(zip(guessed, ref, ref_yield_tags or repeat(None)))
+
+
+def match_entries_by_id(entries, ids, executor):
+    if entries is None:
+        return None
+    if len(entries) != len(ids):
+        raise ValueError("Number of passages to compare does not match: %d != %d" % (len(entries), len(ids)))
+    entries_by_id = dict(zip(executor.map(_entry_id, entries, chunksize=16), entries))
+    missing = [i for i in ids if i not in entries_by_id]
+    if missing:
+        raise ValueError("Passage IDs do not match: %s" % ", ".join(missing))
+    return [entries_by_id[i] for i in ids]
+
+
+_loader = None
+
+
+def _load_entry(entry):
+    global _loader
+    if _loader is None:  # One per process, keeping archives open
+        _loader = ioutil.LazyLoadedPassages(())
+    return None if entry is None else _loader.load_entry(entry)
+
+
+def _entry_id(entry):
+    """ Run in worker processes: find the ID of the passage at the given location, without loading it if possible """
+    if entry.key is not None and entry.number is None:  # Passage in an archive, where the key is the ID
+        return entry.key
+    if entry.key is None and entry.file.endswith(".xml"):
+        try:
+            for _, element in ElementTree.iterparse(entry.file, events=("start",)):
+                return element.get("passageID")  # The root element
+        except ElementTree.ParseError:
+            pass
+    return _load_entry(entry).ID
+
+
+def _evaluate_entries(entries, options):
+    """ Run in worker processes: load a pair of passages (and the fine-grained evaluation reference) and evaluate """
+    guessed, ref, ref_yield_tags = map(_load_entry, entries)
+    return guessed.ID, evaluation.evaluate(guessed, ref, ref_yield_tags=ref_yield_tags, **options).counts()
 
 
 def match_by_id(guessed, ref):
@@ -37,13 +158,18 @@ def match_by_id(guessed, ref):
         return None
     if len(guessed) != len(ref):
         raise ValueError("Number of passages to compare does not match: %d != %d" % (len(guessed), len(ref)))
+    ids = ref.ids() if isinstance(ref, ioutil.PassageArchive) else [p.ID for p in ref]
+    if isinstance(guessed, ioutil.PassageArchive):  # Random access: load each passage only when evaluating it
+        missing = [i for i in ids if i not in guessed]
+        if missing:
+            raise ValueError("Passage IDs do not match: %s" % ", ".join(missing))
+        return map(guessed.__getitem__, ids)
     if len(guessed) > 1:
         guessed_by_id = {}
         for g in guessed:
             sys.stdout.write("\rReading %s..." % g.ID)
             sys.stdout.flush()
             guessed_by_id[g.ID] = g
-        ids = [p.ID for p in ref]
         try:
             return [guessed_by_id[i] for i in ids]
         except KeyError as e:
@@ -56,8 +182,18 @@ def print_f1(result, eval_type):
 
 
 def summarize(args, results, eval_type):
-    summary = evaluation.Scores.aggregate(results)
-    if len(results) > 1:
+    """
+    Aggregate the scores one by one, keeping only the fields of each result for the CSV output
+    :param results: iterable of Scores, consumed once
+    """
+    accumulator = evaluation.ScoresAccumulator()
+    fields = []
+    for result in results:
+        accumulator.add(result)
+        if args.out_file:
+            fields.append(result.fields(eval_type=eval_type))
+    summary = accumulator.scores()
+    if accumulator.num_scores > 1:
         if args.verbose:
             print("Aggregated scores:")
         else:
@@ -72,8 +208,8 @@ def summarize(args, results, eval_type):
     if args.out_file:
         with open(args.out_file, "w", encoding="utf-8") as f:
             print(",".join(summary.titles(eval_type=eval_type)), file=f)
-            for result in results:
-                print(",".join(result.fields(eval_type=eval_type)), file=f)
+            for result_fields in fields:
+                print(",".join(result_fields), file=f)
         print("Wrote '%s'" % args.out_file)
     for filename, counts in ((args.summary_file, False), (args.counts_file, True)):
         if filename:
@@ -87,11 +223,43 @@ def summarize(args, results, eval_type):
         print("Wrote '%s'" % args.errors_file)
 
 
+def collect_counts(results, passage_counts):
+    for result in results:
+        passage_counts.append(bootstrap.scores_counts(result))
+        yield result
+
+
+def resample(args, passage_counts):
+    """
+    Bootstrap confidence intervals for the scores, and if there is a baseline, for the difference from its scores
+    :param passage_counts: list of counts of each evaluated passage, see bootstrap.scores_counts
+    """
+    other_counts = []
+    if args.baseline:
+        baseline_args = Namespace(**dict(vars(args), guessed=args.baseline, verbose=False))
+        other_counts = [bootstrap.scores_counts(result) for result in evaluate_passages(baseline_args)]
+        if len(other_counts) != len(passage_counts):
+            raise ValueError("Number of passages to compare to the baseline does not match: %d != %d" % (
+                len(passage_counts), len(other_counts)))
+    columns, counts = bootstrap.counts_array(passage_counts + other_counts)
+    results = bootstrap.bootstrap(counts[:len(passage_counts)], counts[len(passage_counts):] if other_counts else None,
+                                  columns=columns, samples=args.bootstrap, seed=args.seed)
+    if not args.quiet:
+        print(end="\r")
+        bootstrap.print_results(results)
+    if args.bootstrap_file:
+        with open(args.bootstrap_file, "w", encoding="utf-8") as f:
+            bootstrap.print_results(results, file=f)
+        print("Wrote '%s'" % args.bootstrap_file)
+
+
 def check_args(args):
     if args.out_file or args.summary_file:
         args.fscore = True
     if args.errors_file:
         args.errors = True
+    if args.baseline and not args.bootstrap:
+        args.bootstrap = bootstrap.DEFAULT_SAMPLES
     if not (args.units or args.fscore or args.errors):
         argparser.error("At least one of -u, -f or -e is required.")
     return args
@@ -119,6 +287,14 @@ if __name__ == "__main__":
     argparser.add_argument("--summary-file", help="file to write aggregated scores to, in CSV format")
     argparser.add_argument("--counts-file", help="file to write aggregated counts to, in CSV format")
     argparser.add_argument("--errors-file", help="file to write aggregated confusion matrix to, in CSV format")
+    argparser.add_argument("-j", "--jobs", type=int, default=1,
+                           help="number of worker processes to load and evaluate passages in")
+    argparser.add_argument("-b", "--bootstrap", type=int, metavar="N",
+                           help="number of bootstrap samples for confidence intervals of F1 (and p-values with -B)")
+    argparser.add_argument("-B", "--baseline", help="xml/pickle file name for the guessed annotation of another system "
+                                                    "to compare to by paired bootstrap, or directory of files")
+    argparser.add_argument("--bootstrap-file", help="file to write bootstrap results to, in CSV format")
+    argparser.add_argument("--seed", type=int, help="random seed for bootstrap samples")
     group = argparser.add_mutually_exclusive_group()
     group.add_argument("-v", "--verbose", action="store_true",
                        help="prints the results for every single pair (always true if there is only one pair)")
@@ -2,13 +2,37 @@
 
 import argparse
 
-from ucca.textutil import get_word_vectors
+import numpy as np
 
-desc = """Load word vectors file to make sure it works."""
+from ucca.textutil import get_word_vectors, read_word_vectors, save_word_vectors_cache, load_word_vectors_cache
+
+desc = """Load word vectors file to make sure it works, optionally converting it to a binary cache for fast loading."""
+
+
+def verify(filename):
+    cache = load_word_vectors_cache(filename)
+    if cache is None:
+        return "no up-to-date cache"
+    matrix, words = cache
+    it = read_word_vectors(None, None, filename)
+    next(it)
+    count = 0
+    for i, (word, vector) in enumerate(it):
+        if i >= len(words) or words[i] != word or not np.array_equal(matrix[i], vector):
+            return "mismatch at row %d (%s)" % (i, word)
+        count += 1
+    if count != len(words):
+        return "%d vectors in text file but %d in cache" % (count, len(words))
+    return None
 
 
 def main(args):
     for filename in args.filenames:
+        if args.cache:
+            print("Wrote %s" % ", ".join(save_word_vectors_cache(filename)))
+        if args.verify:
+            error = verify(filename)
+            print("Cache of %s: %s" % (filename, error or "OK"))
         vectors, dim = get_word_vectors(size=args.rows, dim=args.dim, filename=filename)
         print("Loaded %d rows, dim=%d" % (len(vectors), dim))
 
@@ -18,4 +42,6 @@ if __name__ == '__main__':
     argparser.add_argument("filenames", nargs="+", help="word vector files to load")
     argparser.add_argument("-r", "--rows", type=int, help="maximum number of word vectors")
     argparser.add_argument("-d", "--dim", type=int, help="maximum dimension of word vectors")
+    argparser.add_argument("-c", "--cache", action="store_true", help="convert to binary cache, used on later loads")
+    argparser.add_argument("-V", "--verify", action="store_true", help="check the cache against the text file")
     main(argparser.parse_args())
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+import sys
+
+import argparse
+import os
+from tqdm import tqdm
+
+from ucca.convert import COMPRESSIONS, GZIP
+from ucca.ioutil import get_passages, passage2file, write_archive, PassageArchive, external_write_mode, \
+    ARCHIVE_SUFFIX
+
+desc = """Packs UCCA passages from any files (or directories) into a single archive file with random access by ID,
+or unpacks an archive into XML/pickle files."""
+
+
+def pack(args):
+    passages = get_passages(args.filenames)
+    if args.verbose:
+        passages = tqdm(passages, desc="Packing", unit=" passages")
+    n = write_archive(passages, args.out, compression=None if args.compression == "none" else args.compression)
+    print("Wrote %d passages to '%s'" % (n, args.out), file=sys.stderr)
+
+
+def unpack(args):
+    os.makedirs(args.outdir, exist_ok=True)
+    for filename in args.filenames:
+        with PassageArchive(filename) as archive:
+            for passage in tqdm(archive, desc="Unpacking %s" % filename, unit=" passages", total=len(archive)):
+                outfile = os.path.join(args.outdir, passage.ID + (".pickle" if args.binary else ".xml"))
+                if args.verbose:
+                    with external_write_mode():
+                        print("Writing file '%s'..." % outfile, file=sys.stderr)
+                passage2file(passage, outfile, binary=args.binary)
+
+
+def main(args):
+    if args.unpack:
+        unpack(args)
+    else:
+        if not args.out:
+            argparser.error("-o/--out is required for packing")
+        if not args.out.endswith(ARCHIVE_SUFFIX):
+            argparser.error("Archive file name must end with '%s'" % ARCHIVE_SUFFIX)
+        pack(args)
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description=desc)
+    argparser.add_argument('filenames', nargs='+', help="passage files or directories to pack, or archives to unpack")
+    argparser.add_argument('-o', '--out', help="archive file name to pack to (ending with %s)" % ARCHIVE_SUFFIX)
+    argparser.add_argument('-u', '--unpack', action="store_true", help="unpack archives instead of packing")
+    argparser.add_argument('-d', '--outdir', default='.', help="output directory for unpacking")
+    argparser.add_argument('-b', '--binary', action="store_true", help="unpack to pickle files instead of XML")
+    argparser.add_argument('-c', '--compression', choices=[c or "none" for c in COMPRESSIONS], default=GZIP,
+                           help="compression for each passage in the archive")
+    argparser.add_argument('-v', '--verbose', action="store_true", help="verbose output")
+    main(argparser.parse_args())
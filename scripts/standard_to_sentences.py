@@ -1,13 +1,11 @@
 #!/usr/bin/env python3
 
-import sys
 from itertools import count
 
 import argparse
-import os
 
 from ucca.convert import split2sentences, split_passage
-from ucca.ioutil import passage2file, get_passages_with_progress_bar, external_write_mode
+from ucca.ioutil import get_passages_with_progress_bar, PassageWriter, ARCHIVE_SUFFIX, JSONL_SUFFIX
 from ucca.normalization import normalize
 from ucca.textutil import extract_terminals
 
@@ -53,18 +51,16 @@ class Splitter:
 
 def main(args):
     splitter = Splitter.read_file(args.sentences, enum=args.enumerate)
-    os.makedirs(args.outdir, exist_ok=True)
     i = 0
-    for passage in get_passages_with_progress_bar(args.filenames, "Splitting"):
-        for sentence in splitter.split(passage) if splitter else split2sentences(
-                passage, remarks=args.remarks, lang=args.lang, ids=map(str, count(i)) if args.enumerate else None):
-            i += 1
-            outfile = os.path.join(args.outdir, args.prefix + sentence.ID + (".pickle" if args.binary else ".xml"))
-            with external_write_mode():
-                print("Writing passage file for sentence '%s'..." % outfile, file=sys.stderr)
-            if args.normalize:
-                normalize(sentence)
-            passage2file(sentence, outfile, binary=args.binary)
+    with PassageWriter(outdir=args.outdir, binary=args.binary, prefix=args.prefix, verbose=args.verbose,
+                       output=args.output, workers=args.workers) as writer:
+        for passage in get_passages_with_progress_bar(args.filenames, "Splitting"):
+            for sentence in splitter.split(passage) if splitter else split2sentences(
+                    passage, remarks=args.remarks, lang=args.lang, ids=map(str, count(i)) if args.enumerate else None):
+                i += 1
+                if args.normalize:
+                    normalize(sentence)
+                writer.write(sentence)
 
 
 if __name__ == "__main__":
@@ -79,4 +75,8 @@ if __name__ == "__main__":
     argparser.add_argument("-e", "--enumerate", action="store_true", help="set each output sentence ID by global order")
     argparser.add_argument("-N", "--no-normalize", dest="normalize", action="store_false",
                            help="do not normalize passages after splitting")
+    argparser.add_argument("-a", "--output", help="write all sentences to one archive (%s) or JSON lines (%s) file" % (
+        ARCHIVE_SUFFIX, JSONL_SUFFIX))
+    argparser.add_argument("-j", "--workers", type=int, help="number of processes to serialize sentences in")
+    argparser.add_argument("-v", "--verbose", action="store_true", help="print the name of each file written")
     main(argparser.parse_args())
@@ -0,0 +1,140 @@
+"""
+Paired bootstrap resampling of evaluated passages, for confidence intervals of F1 scores, and for the significance of
+the difference in F1 between two systems evaluated on the same passages.
+Rather than re-running the evaluation, the scores of each bootstrap sample are computed from the per-passage counts
+(matches, only guessed, only in reference): for each sample, passages are drawn with replacement and counted, and the
+counts of all samples in a batch are then summed by a single matrix product of these weights and the passage counts.
+"""
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+from ucca.evaluation import EVAL_TYPES
+
+AVERAGE = "average"  # Column of the sum of the counts over the default constructions (primary and remote)
+DEFAULT_SAMPLES = 1000
+DEFAULT_CONFIDENCE = 0.95
+MAX_BATCH_SIZE = 1 << 22  # Maximum number of passage weights to draw at once: samples in a batch times passages
+
+BootstrapResult = namedtuple("BootstrapResult", ("eval_type", "construction", "f1", "low", "high",
+                                                 "other_f1", "other_low", "other_high",
+                                                 "difference", "difference_low", "difference_high", "p_value"))
+BootstrapResult.__doc__ = """
+F1 of a column (evaluation type and construction) on all passages, and the bounds of its confidence interval, for one
+system and (if given) for another system, with the difference between the systems (first minus other) and the
+p-value of the difference. Fields for the other system are None if there is just one.
+"""
+
+
+def scores_counts(scores):
+    """
+    :param scores: Scores object of one passage
+    :return: dict: (eval_type, construction name) -> (matches, only guessed, only in reference), including the column
+             (eval_type, AVERAGE), whose F1 is Scores.average_f1(eval_type)
+    """
+    counts = OrderedDict()
+    for eval_type, evaluator_results in scores.evaluators.items():
+        for construction, stats in [(AVERAGE, evaluator_results.aggregate_default())] + \
+                list(evaluator_results.results.items()):
+            counts[(eval_type, str(construction))] = (stats.num_matches, stats.num_only_guessed, stats.num_only_ref)
+    return counts
+
+
+def counts_array(passage_counts, columns=None):
+    """
+    :param passage_counts: sequence of dicts returned by scores_counts, one per passage
+    :param columns: list of (eval_type, construction name) to include; by default, all that appear in passage_counts
+    :return: list of columns, and int array of shape (passages, columns, 3), with zeros for columns a passage lacks
+    """
+    if columns is None:
+        columns = list(OrderedDict.fromkeys(c for counts in passage_counts for c in counts))
+        columns.sort(key=lambda c: EVAL_TYPES.index(c[0]) if c[0] in EVAL_TYPES else len(EVAL_TYPES))
+    array = np.zeros((len(passage_counts), len(columns), 3), dtype=np.int64)
+    for i, counts in enumerate(passage_counts):
+        for j, column in enumerate(columns):
+            array[i, j] = counts.get(column, (0, 0, 0))
+    return columns, array
+
+
+def f1(counts):
+    """
+    :param counts: array whose last axis has the number of matches, only guessed and only in reference
+    :return: array of F1 scores, with the shape of counts except the last axis, as calculated by SummaryStatistics
+    """
+    matches, only_guessed, only_ref = np.moveaxis(np.asarray(counts, dtype=np.float64), -1, 0)
+    guessed = matches + only_guessed
+    ref = matches + only_ref
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = np.where(guessed == 0, 1.0, matches / guessed)
+        r = np.where(ref == 0, 1.0, matches / ref)
+        return np.where((p == 0) | (r == 0), 0.0, 2 * p * r / (p + r))
+
+
+def resample(counts, samples=DEFAULT_SAMPLES, seed=None):
+    """
+    Draw bootstrap samples of passages with replacement, the same samples for all systems
+    :param counts: sequence of arrays of shape (passages, columns, 3), one per system, with the same passages in order
+    :param samples: number of bootstrap samples
+    :param seed: random seed, for reproducible samples
+    :return: array of F1 scores of shape (samples, systems, columns)
+    """
+    counts = np.stack(counts)
+    num_systems, num_passages, num_columns = counts.shape[:3]
+    if not num_passages:
+        raise ValueError("Cannot resample without passages")
+    # Passage -> counts of all systems and columns, as floats (exact for any realistic count) for a fast matrix product
+    flat = np.moveaxis(counts, 1, 0).reshape(num_passages, -1).astype(np.float64)
+    random = np.random.RandomState(seed)
+    batch_size = max(1, MAX_BATCH_SIZE // num_passages)
+    scores = []
+    for start in range(0, samples, batch_size):
+        size = min(batch_size, samples - start)
+        drawn = random.randint(num_passages, size=(size, num_passages)) + num_passages * np.arange(size)[:, None]
+        weights = np.bincount(drawn.ravel(), minlength=size * num_passages).reshape(size, num_passages)
+        scores.append(f1(weights.astype(np.float64).dot(flat).reshape(size, num_systems, num_columns, 3)))
+    return np.concatenate(scores) if scores else np.empty((0, num_systems, num_columns))
+
+
+def bootstrap(counts, other_counts=None, columns=None, samples=DEFAULT_SAMPLES, confidence=DEFAULT_CONFIDENCE,
+              seed=None):
+    """
+    Find percentile bootstrap confidence intervals of F1 for each column, and if other_counts is given, of the
+    difference between the systems, with the p-value of a paired two-sided test for it: the fraction of samples where
+    the difference deviates from the observed difference by at least as much as the observed difference deviates from 0
+    :param counts: array of shape (passages, columns, 3), as returned by counts_array
+    :param other_counts: array of the same shape for another system, evaluated on the same passages in the same order
+    :param columns: list of (eval_type, construction name) for the columns, as returned by counts_array
+    :param samples: number of bootstrap samples
+    :param confidence: confidence level of the intervals
+    :param seed: random seed, for reproducible samples
+    :return: list of BootstrapResult, one per column
+    """
+    systems = [counts] if other_counts is None else [counts, other_counts]
+    if columns is None:
+        columns = [(None, str(i)) for i in range(np.shape(counts)[1])]
+    observed = f1(np.sum(systems, axis=1))  # (systems, columns)
+    sampled = resample(systems, samples=samples, seed=seed)  # (samples, systems, columns)
+    quantiles = [(1 - confidence) / 2, (1 + confidence) / 2]
+    low, high = np.percentile(sampled, [100 * q for q in quantiles], axis=0)  # Each (systems, columns)
+    none = [None] * len(columns)
+    other_f1, other_low, other_high, difference, difference_low, difference_high, p_value = 7 * [none]
+    if other_counts is not None:
+        other_f1, other_low, other_high = observed[1], low[1], high[1]
+        difference = observed[0] - observed[1]
+        sampled_difference = sampled[:, 0] - sampled[:, 1]
+        difference_low, difference_high = np.percentile(sampled_difference, [100 * q for q in quantiles], axis=0)
+        p_value = np.mean(np.abs(sampled_difference - difference) >= np.abs(difference), axis=0)
+    return [BootstrapResult(eval_type, construction, *(None if v is None else float(v) for v in values))
+            for (eval_type, construction), *values in zip(columns, observed[0], low[0], high[0], other_f1, other_low,
+                                                          other_high, difference, difference_low, difference_high,
+                                                          p_value)]
+
+
+def print_results(results, sep=",", **kwargs):
+    """
+    :param results: list of BootstrapResult
+    :param sep: separator between fields
+    """
+    print(sep.join(BootstrapResult._fields), **kwargs)
+    for result in results:
+        print(sep.join("" if v is None else v if isinstance(v, str) else "%.4f" % v for v in result), **kwargs)
@@ -52,20 +52,61 @@ def create_category_construction(tag):
     return Construction(tag, CATEGORY_DESCRIPTIONS.get(tag, tag), criterion=None)
 
 
+def get_yield_bits(node, spans=None):
+    """
+    Find the terminal yield of a node (excluding remote children) as bitsets: ints where bit i is set iff the
+    terminal in position i is in the yield. Computed bottom-up, so each node is visited once per passage.
+    :param node: Node object from layer 0 or layer 1
+    :param spans: dict of node ID -> yields, to share between calls for nodes of the same passage
+    :return: pair of ints: yield including punctuation, yield excluding punctuation
+    """
+    if spans is None:
+        spans = {}
+    ret = spans.get(node.ID)
+    if ret is None:
+        spans[node.ID] = (0, 0)  # Avoid infinite recursion in case of a cycle
+        if node.layer.ID == layer0.LAYER_ID:
+            bit = 1 << node.position
+            ret = (bit, 0 if node.punct else bit)
+        else:
+            bits = bits_no_punct = 0
+            for edge in node:
+                if not edge.attrib.get("remote"):
+                    child_bits, child_bits_no_punct = get_yield_bits(edge.child, spans)
+                    bits |= child_bits
+                    bits_no_punct |= child_bits_no_punct
+            ret = (bits, 0 if node.tag == NodeTags.Punctuation else bits_no_punct)
+        spans[node.ID] = ret
+    return ret
+
+
+def yield_positions(bits):
+    """
+    :param bits: terminal yield as returned by get_yield_bits
+    :return: list of the terminal positions in the yield, in ascending order
+    """
+    return [i for i in range(bits.bit_length()) if bits >> i & 1]
+
+
 class Candidate:
-    def __init__(self, edge, reference=None, reference_yield_tags=None, verbose=False):
+    def __init__(self, edge, reference=None, reference_yield_tags=None, verbose=False, spans=None):
         self.edge = edge
         self.out_tags = {e.tag for e in edge.child}
         self.reference = reference
         self.reference_yield_tags = reference_yield_tags
         self.verbose = verbose
-        self.terminals = self.edge.child.get_terminals()
-        self.terminal_yield, self.terminal_yield_no_punct = [frozenset(t.position for t in ts) for ts in (
-            self.terminals, self.edge.child.get_terminals(punct=False))]
-        if self.reference is not None:
-            self.terminals = [self.reference.by_id(t.ID) for t in self.terminals]
+        self.terminal_yield, self.terminal_yield_no_punct = get_yield_bits(self.edge.child, spans)
+        self._terminals = None
         self.extra = {}
 
+    @property
+    def terminals(self):
+        if self._terminals is None:
+            self._terminals = self.edge.child.get_terminals()
+            if self.reference is not None:
+                self._terminals = [self.reference.by_id(t.ID) for t in self._terminals]
+        return self._terminals
+
     def _annotate(self, attr=None):
         passage = self.edge.parent.root
         if not passage.extra.get("annotated"):
@@ -202,10 +243,11 @@ def verify_terminals_match(passage, reference):
 
 
 def get_candidates(passage, reference=None, reference_yield_tags=None, verbose=False):
+    spans = {}
     for node in passage.layer(layer1.LAYER_ID).all:
         for edge in node:
             yield Candidate(edge, reference=reference or passage, reference_yield_tags=reference_yield_tags,
-                            verbose=verbose)
+                            verbose=verbose, spans=spans)
 
 
 def extract_candidates(passage, constructions=None, reference=None, reference_yield_tags=None, verbose=False):
@@ -215,7 +257,7 @@ def extract_candidates(passage, constructions=None, reference=None, reference_yi
     :param constructions: list of constructions to include or None for all
     :param reference: Passage object to get POS tags from, and categories for fine-grained scores (default: `passage')
     :param reference_yield_tags: yield tags from reference passage for fine-grained evaluation:
-                   dict: set of terminal indices (excluding punctuation) ->
+                   dict: bitset of terminal indices (excluding punctuation) ->
                    list of edges of the Construction whose yield (excluding remotes and punctuation) is that set
     :param verbose: whether to print tagged text
     :return: dict of Construction -> list of corresponding Candidates
@@ -244,7 +286,7 @@ def extract_edges(passage, constructions=None, reference=None, reference_yield_t
     :param constructions: list of constructions to include or None for all
     :param reference: Passage object to get POS tags from (default: `passage')
     :param reference_yield_tags: yield tags from reference passage for fine-grained evaluation:
-                   dict: set of terminal indices (excluding punctuation) ->
+                   dict: bitset of terminal indices (excluding punctuation) ->
                    list of edges of the Construction whose yield (excluding remotes and punctuation) is that set
     :param verbose: whether to print tagged text
     :return: dict of Construction -> list of corresponding edges
@@ -259,7 +301,7 @@ def create_passage_yields(p, *args, punct=False, **kwargs):
     :param p: passage to find terminal yields of
     :param punct: whether to include punctuation in terminal yield
     :returns dict: Construction ->
-                   dict: set of terminal indices (excluding punctuation) ->
+                   dict: bitset of terminal indices (excluding punctuation), see get_yield_bits ->
                          list of edges of the Construction whose yield (excluding remotes and punctuation) is that set
     """
     yield_tags = OrderedDict()
@@ -12,13 +12,16 @@ The possible other formats are:
 """
 
 import sys
-from collections import defaultdict
-from itertools import repeat, groupby
+from collections import defaultdict, deque
+from contextlib import ExitStack
+from itertools import repeat, groupby, chain
 
+import gzip
 import json
 import os
 import pickle
 import re
+import struct
 import xml.etree.ElementTree as ET
 import xml.sax.saxutils
 from operator import attrgetter, itemgetter
@@ -33,11 +36,46 @@ try:
 except ImportError:
     from json.decoder import JSONDecodeError
 
+try:
+    # noinspection PyPackageRequirements
+    from lxml import etree as LET
+except ImportError:
+    LET = None
+
+try:
+    # noinspection PyPackageRequirements
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ETREE = "etree"
+LXML = "lxml"
+XML_BACKENDS = (LXML, ETREE)
+DEFAULT_XML_BACKEND = ETREE if LET is None else LXML  # The fastest one installed
+
 
 class SiteXMLUnknownElement(core.UCCAError):
     pass
 
 
+def get_xml_backend(backend=None):
+    """Get the ElementTree-compatible module used for parsing and creating XML elements.
+
+    :param backend: one of XML_BACKENDS, or None for the fastest one installed (lxml if available)
+
+    :return either the lxml.etree module or the xml.etree.ElementTree module
+    """
+    if backend is None:
+        backend = DEFAULT_XML_BACKEND
+    if backend == LXML:
+        if LET is None:
+            raise ImportError("XML backend '%s' requested but lxml is not installed" % LXML)
+        return LET
+    if backend == ETREE:
+        return ET
+    raise ValueError("Unknown XML backend: '%s' (should be one of %s)" % (backend, ", ".join(XML_BACKENDS)))
+
+
 class SiteCfg:
     """Contains static configuration for conversion to/from the site XML."""
 
@@ -187,11 +225,10 @@ def _from_site_terminals(elem, passage, elem2node):
     for para_num, paragraph in enumerate(elem.iterfind(
             SiteCfg.Paths.Paragraphs)):
         words = list(paragraph.iter(SiteCfg.Tags.Terminal))
-        wrappers = []
-        for word in words:
-            # the list added has only one element, because XML is hierarchical
-            wrappers += [x for x in paragraph.iter(SiteCfg.Tags.Unit)
-                         if word in list(x)]
+        # each word has only one wrapper, because XML is hierarchical
+        wrapper_by_word = {word: unit for unit in paragraph.iter(SiteCfg.Tags.Unit)
+                           for word in unit if word.tag == SiteCfg.Tags.Terminal}
+        wrappers = [wrapper_by_word[word] for word in words if word in wrapper_by_word]
         for word, wrapper in zip(words, wrappers):
             punct = (wrapper.get(SiteCfg.Attr.ElemTag) == SiteCfg.Types.Punct)
             text = SiteUtil.unescape(word.text)
@@ -205,15 +242,16 @@ def _from_site_terminals(elem, passage, elem2node):
 def _parse_site_units(elem, parent, passage, groups, elem2node):
     """Parses the given element in the site annotation.
 
-    The parser works recursively by determining how to parse the current XML
-    element, then adding it with a core.Edge object to the parent given.
-    After creating (or retrieving) the current node, which corresponds to the
-    XML element given, we iterate its subelements and parse them recursively.
+    The parser works iteratively, keeping a stack of (XML element, parent) pairs
+    to parse, so that they are parsed in document order. It determines how to
+    parse the current XML element, then adds it with a core.Edge object to the
+    parent. After creating (or retrieving) the current node, which corresponds
+    to the XML element, its subelements are pushed with the node as parent.
 
     :param elem: the XML element to parse
     :param parent: layer1.FoundationalNode parent of the current XML element
     :param passage: the core.Passage we are converting to
-    :param groups: the main XML element of the discontiguous units (unitGroups)
+    :param groups: dict of site ID to XML element of the discontiguous units (unitGroups)
     :param elem2node: mapping between site IDs and Nodes, updated here
 
     :return a list of (parent, elem) pairs which weren't process, as they should
@@ -234,9 +272,7 @@ def _parse_site_units(elem, parent, passage, groups, elem2node):
     def _get_work_elem(node_elem):
         """Given XML element, return either itself or its discontiguous unit."""
         gid = node_elem.get(SiteCfg.Attr.GroupID)
-        return (node_elem if gid is None
-                else [group_elem for group_elem in groups
-                      if group_elem.get(SiteCfg.Attr.SiteID) == gid][0])
+        return node_elem if gid is None else groups[gid]
 
     def _fill_attributes(node_elem, target_node):
         """Fills in node the remarks and uncertain attributes from XML elem."""
@@ -248,60 +284,64 @@ def _parse_site_units(elem, parent, passage, groups, elem2node):
 
     l1 = passage.layer(layer1.LAYER_ID)
     tbd = []
+    to_parse = [(elem, parent)]
+    while to_parse:
+        elem, parent = to_parse.pop()
+        node = None
+        subelems = []
+
+        # Unit tag means its a regular, hierarchically built unit
+        if elem.tag == SiteCfg.Tags.Unit:
+            node = _get_node(elem)
+
+            # Only nodes created by now are the terminals, or discontiguous units
+            if node is not None:
+
+                if node.tag == layer0.NodeTags.Word:
+                    parent.add(EdgeTags.Terminal, node)
+                elif node.tag == layer0.NodeTags.Punct:
+                    SiteUtil.set_node(elem, l1.add_punct(parent, node), elem2node)
+                else:
+                    # if we got here, we are the second (or later) chunk of a
+                    # discontiguous unit, whose node was already created.
+                    # So, we don't need to create the node, just keep processing
+                    # our subelements (as subelements of the discontiguous unit)
 
-    # Unit tag means its a regular, hierarchically built unit
-    if elem.tag == SiteCfg.Tags.Unit:
-        node = _get_node(elem)
-
-        # Only nodes created by now are the terminals, or discontiguous units
-        if node is not None:
+                    # Added by Omri to address cases where remote units direct at the chunks of discontiguous units
+                    SiteUtil.set_node(elem, node, elem2node)
 
-            if node.tag == layer0.NodeTags.Word:
-                parent.add(EdgeTags.Terminal, node)
-            elif node.tag == layer0.NodeTags.Punct:
-                SiteUtil.set_node(elem, l1.add_punct(parent, node), elem2node)
+                    subelems = list(elem)
             else:
-                # if we got here, we are the second (or later) chunk of a
-                # discontiguous unit, whose node was already created.
-                # So, we don't need to create the node, just keep processing
-                # our subelements (as subelements of the discontiguous unit)
+                # Creating a new node, either regular or discontiguous.
+                # Note that for discontiguous units we have a different work_elem,
+                # because all the data on them are stored outside the hierarchy
+                work_elem = _get_work_elem(elem)
+                edge_tag = SiteCfg.TagConversion[work_elem.get(
+                    SiteCfg.Attr.ElemTag)]
+                node = l1.add_fnode(parent, edge_tag)
+                SiteUtil.set_node(work_elem, node, elem2node)
 
                 # Added by Omri to address cases where remote units direct at the chunks of discontiguous units
                 SiteUtil.set_node(elem, node, elem2node)
 
-                for subelem in elem:
-                    tbd += _parse_site_units(subelem, node, passage,
-                                             groups, elem2node)
-        else:
-            # Creating a new node, either regular or discontiguous.
-            # Note that for discontiguous units we have a different work_elem,
-            # because all the data on them are stored outside the hierarchy
-            work_elem = _get_work_elem(elem)
-            edge_tag = SiteCfg.TagConversion[work_elem.get(
-                SiteCfg.Attr.ElemTag)]
-            node = l1.add_fnode(parent, edge_tag)
-            SiteUtil.set_node(work_elem, node, elem2node)
-
-            # Added by Omri to address cases where remote units direct at the chunks of discontiguous units
+                _fill_attributes(work_elem, node)
+                # For iterating the subelements, we don't use work_elem, as it may
+                # out of the current XML hierarchy we are processing (discont...)
+                for parent_elem in [elem] if elem is work_elem else [elem, work_elem]:
+                    subelems += list(parent_elem)
+        # Implicit units have their own tag, and aren't recursive, but nonetheless
+        # are treated the same as regular units
+        elif elem.tag == SiteCfg.Tags.Implicit:
+            edge_tag = SiteCfg.TagConversion[elem.get(SiteCfg.Attr.ElemTag)]
+            node = l1.add_fnode(parent, edge_tag, implicit=True)
             SiteUtil.set_node(elem, node, elem2node)
+            _fill_attributes(elem, node)
+        # non-unit, probably remote or linkage, which should be created in the end
+        else:
+            tbd.append((parent, elem))
 
-            _fill_attributes(work_elem, node)
-            # For iterating the subelements, we don't use work_elem, as it may
-            # out of the current XML hierarchy we are processing (discont...)
-            for parent_elem in [elem] if elem is work_elem else [elem, work_elem]:
-                for subelem in parent_elem:
-                    tbd += _parse_site_units(subelem, node, passage,
-                                             groups, elem2node)
-    # Implicit units have their own tag, and aren't recursive, but nonetheless
-    # are treated the same as regular units
-    elif elem.tag == SiteCfg.Tags.Implicit:
-        edge_tag = SiteCfg.TagConversion[elem.get(SiteCfg.Attr.ElemTag)]
-        node = l1.add_fnode(parent, edge_tag, implicit=True)
-        SiteUtil.set_node(elem, node, elem2node)
-        _fill_attributes(elem, node)
-    # non-unit, probably remote or linkage, which should be created in the end
-    else:
-        tbd.append((parent, elem))
+        # Reversed, so that the first subelement is popped (and its subtree parsed) first
+        to_parse += [(subelem, node) for subelem in reversed(subelems)]
 
     return tbd
 
@@ -323,10 +363,12 @@ def _from_site_annotation(elem, passage, elem2node):
     l1 = layer1.Layer1(passage)
     l1head = l1.heads[0]
     groups_root = elem.find(SiteCfg.Paths.Discontiguous)
+    groups = {} if groups_root is None else {group_elem.get(SiteCfg.Attr.SiteID): group_elem
+                                             for group_elem in reversed(groups_root)}  # First one wins, as before
 
     # this takes care of the hierarchical annotation
     for subelem in elem.iterfind(SiteCfg.Paths.Annotation):
-        tbd += _parse_site_units(subelem, l1head, passage, groups_root,
+        tbd += _parse_site_units(subelem, l1head, passage, groups,
                                  elem2node)
 
     # Handling remotes and linkages, which usually contain IDs from all over
@@ -359,18 +401,21 @@ def from_site(elem):
     pid = elem.find(SiteCfg.Paths.Main).get(SiteCfg.Attr.PassageID)
     passage = core.Passage(pid)
     elem2node = {}
-    _from_site_terminals(elem, passage, elem2node)
-    _from_site_annotation(elem, passage, elem2node)
+    with passage.bulk_mode():
+        _from_site_terminals(elem, passage, elem2node)
+        _from_site_annotation(elem, passage, elem2node)
     return passage
 
 
-def to_site(passage):
+def to_site(passage, backend=ETREE):
     """Converts a passage to the site XML format.
 
     :param passage: the passage to convert
+    :param backend: XML backend to create the elements with, out of XML_BACKENDS (default: xml.etree)
 
-    :return the root element of the standard XML structure
+    :return the root element of the site XML structure
     """
+    etree = get_xml_backend(backend)
 
     class _State:
         def __init__(self):
@@ -391,14 +436,14 @@ def to_site(passage):
 
     def _word(terminal):
         tag = SiteCfg.Types.Punct if terminal.punct else SiteCfg.TBD
-        word = ET.Element(SiteCfg.Tags.Terminal,
-                          {SiteCfg.Attr.SiteID: state.get_id()})
+        word = etree.Element(SiteCfg.Tags.Terminal,
+                             {SiteCfg.Attr.SiteID: state.get_id()})
         word.text = terminal.text
-        word_elem = ET.Element(SiteCfg.Tags.Unit,
-                               {SiteCfg.Attr.ElemTag: tag,
-                                SiteCfg.Attr.SiteID: state.get_id(),
-                                SiteCfg.Attr.Unanalyzable: SiteCfg.FALSE,
-                                SiteCfg.Attr.Uncertain: SiteCfg.FALSE})
+        word_elem = etree.Element(SiteCfg.Tags.Unit,
+                                  {SiteCfg.Attr.ElemTag: tag,
+                                   SiteCfg.Attr.SiteID: state.get_id(),
+                                   SiteCfg.Attr.Unanalyzable: SiteCfg.FALSE,
+                                   SiteCfg.Attr.Uncertain: SiteCfg.FALSE})
         word_elem.append(word)
         state.update(word_elem, terminal)
         return word_elem
@@ -415,12 +460,12 @@ def to_site(passage):
                 for e in node)
             else SiteCfg.FALSE)
         elem_tag = SiteCfg.EdgeConversion[node.ftag]
-        cunit_elem = ET.Element(SiteCfg.Tags.Unit,
-                                {SiteCfg.Attr.ElemTag: elem_tag,
-                                 SiteCfg.Attr.SiteID: state.get_id(),
-                                 SiteCfg.Attr.Unanalyzable: unanalyzable,
-                                 SiteCfg.Attr.Uncertain: uncertain,
-                                 SiteCfg.Attr.Suggestion: suggestion})
+        cunit_elem = etree.Element(SiteCfg.Tags.Unit,
+                                   {SiteCfg.Attr.ElemTag: elem_tag,
+                                    SiteCfg.Attr.SiteID: state.get_id(),
+                                    SiteCfg.Attr.Unanalyzable: unanalyzable,
+                                    SiteCfg.Attr.Uncertain: uncertain,
+                                    SiteCfg.Attr.Suggestion: suggestion})
         if cunit_subelem is not None:
             cunit_elem.append(cunit_subelem)
         # When we add chunks of discontiguous units, we don't want them to
@@ -434,13 +479,13 @@ def to_site(passage):
                      else SiteCfg.FALSE)
         suggestion = (SiteCfg.TRUE if edge.child.attrib.get('suggest')
                       else SiteCfg.FALSE)
-        remote_elem = ET.Element(SiteCfg.Tags.Remote,
-                                 {SiteCfg.Attr.ElemTag:
-                                  SiteCfg.EdgeConversion[edge.tag],
-                                  SiteCfg.Attr.SiteID: state.mapping[edge.child.ID],
-                                  SiteCfg.Attr.Unanalyzable: SiteCfg.FALSE,
-                                  SiteCfg.Attr.Uncertain: uncertain,
-                                  SiteCfg.Attr.Suggestion: suggestion})
+        remote_elem = etree.Element(SiteCfg.Tags.Remote,
+                                    {SiteCfg.Attr.ElemTag:
+                                     SiteCfg.EdgeConversion[edge.tag],
+                                     SiteCfg.Attr.SiteID: state.mapping[edge.child.ID],
+                                     SiteCfg.Attr.Unanalyzable: SiteCfg.FALSE,
+                                     SiteCfg.Attr.Uncertain: uncertain,
+                                     SiteCfg.Attr.Suggestion: suggestion})
         state.elems[edge.parent.ID].insert(0, remote_elem)
 
     def _implicit(node):
@@ -448,19 +493,19 @@ def to_site(passage):
                      else SiteCfg.FALSE)
         suggestion = (SiteCfg.TRUE if node.attrib.get('suggest')
                       else SiteCfg.FALSE)
-        implicit_elem = ET.Element(SiteCfg.Tags.Implicit,
-                                   {SiteCfg.Attr.ElemTag:
-                                    SiteCfg.EdgeConversion[node.ftag],
-                                    SiteCfg.Attr.SiteID: state.get_id(),
-                                    SiteCfg.Attr.Unanalyzable: SiteCfg.FALSE,
-                                    SiteCfg.Attr.Uncertain: uncertain,
-                                    SiteCfg.Attr.Suggestion: suggestion})
+        implicit_elem = etree.Element(SiteCfg.Tags.Implicit,
+                                      {SiteCfg.Attr.ElemTag:
+                                       SiteCfg.EdgeConversion[node.ftag],
+                                       SiteCfg.Attr.SiteID: state.get_id(),
+                                       SiteCfg.Attr.Unanalyzable: SiteCfg.FALSE,
+                                       SiteCfg.Attr.Uncertain: uncertain,
+                                       SiteCfg.Attr.Suggestion: suggestion})
         state.elems[node.fparent.ID].insert(0, implicit_elem)
 
     def _linkage(link):
         args = [str(state.mapping[x.ID]) for x in link.arguments]
         linker_elem = state.elems[link.relation.ID]
-        linkage_elem = ET.Element(SiteCfg.Tags.Linkage, {'args': ','.join(args)})
+        linkage_elem = etree.Element(SiteCfg.Tags.Linkage, {'args': ','.join(args)})
         linker_elem.insert(0, linkage_elem)
 
     def _fparent(node):
@@ -509,7 +554,7 @@ def to_site(passage):
         # paragraph element, if it exists
         if parent is None:
             if term.para_pos == 1:  # need to add paragraph element
-                para_elems.append(ET.Element(
+                para_elems.append(etree.Element(
                     SiteCfg.Tags.Unit,
                     {SiteCfg.Attr.ElemTag: SiteCfg.TBD,
                      SiteCfg.Attr.SiteID: state.get_id()}))
@@ -556,68 +601,130 @@ def to_site(passage):
         _linkage(linkage)
 
     # Creating the XML tree
-    root = ET.Element('root', {'schemeVersion': SiteCfg.SchemeVersion})
-    groups = ET.SubElement(root, 'unitGroups')
+    root = etree.Element('root', {'schemeVersion': SiteCfg.SchemeVersion})
+    groups = etree.SubElement(root, 'unitGroups')
     groups.extend(unit_groups)
-    units = ET.SubElement(root, 'units', {SiteCfg.Attr.PassageID: passage.ID})
-    units0 = ET.SubElement(units, SiteCfg.Tags.Unit,
-                           {SiteCfg.Attr.ElemTag: SiteCfg.TBD,
-                            SiteCfg.Attr.SiteID: '0',
-                            SiteCfg.Attr.Unanalyzable: SiteCfg.FALSE,
-                            SiteCfg.Attr.Uncertain: SiteCfg.FALSE})
+    units = etree.SubElement(root, 'units', {SiteCfg.Attr.PassageID: passage.ID})
+    units0 = etree.SubElement(units, SiteCfg.Tags.Unit,
+                              {SiteCfg.Attr.ElemTag: SiteCfg.TBD,
+                               SiteCfg.Attr.SiteID: '0',
+                               SiteCfg.Attr.Unanalyzable: SiteCfg.FALSE,
+                               SiteCfg.Attr.Uncertain: SiteCfg.FALSE})
     units0.extend(para_elems)
-    ET.SubElement(root, 'LRUunits')
-    ET.SubElement(root, 'hiddenUnits')
+    etree.SubElement(root, 'LRUunits')
+    etree.SubElement(root, 'hiddenUnits')
 
     return root
 
 
-def to_standard(passage):
+# This utility stringifies the Unit's attributes for proper XML
+# we don't need to escape the character - the serializer of the XML element
+# will do it (e.g. tostring())
+def _dumps(dic):
+    return {str(k): str(v) if type(v) in (str, bool) else json.dumps(v) for k, v in dic.items()}
+
+
+def to_standard(passage, backend=ETREE):
     """Converts a Passage object to a standard XML root element.
 
     The standard XML specification is not contained here, but it uses a very
     shallow structure with attributes to create hierarchy.
 
     :param passage: the passage to convert
+    :param backend: XML backend to create the elements with, out of XML_BACKENDS (default: xml.etree)
 
     :return the root element of the standard XML structure
     """
-
-    # This utility stringifies the Unit's attributes for proper XML
-    # we don't need to escape the character - the serializer of the XML element
-    # will do it (e.g. tostring())
-    def _dumps(dic):
-        return {str(k): str(v) if type(v) in (str, bool) else json.dumps(v) for k, v in dic.items()}
+    etree = get_xml_backend(backend)
 
     # Utility to add an extra element if exists in the object
     def _add_extra(obj, elem):
-        return obj.extra and ET.SubElement(elem, 'extra', _dumps(obj.extra))
+        return obj.extra and etree.SubElement(elem, 'extra', _dumps(obj.extra))
 
     # Adds attributes element (even if empty)
     def _add_attrib(obj, elem):
-        return ET.SubElement(elem, 'attributes', _dumps(obj.attrib))
+        return etree.SubElement(elem, 'attributes', _dumps(obj.attrib))
 
-    root = ET.Element('root', passageID=str(passage.ID), annotationID='0')
+    root = etree.Element('root', passageID=str(passage.ID), annotationID='0')
     _add_attrib(passage, root)
     _add_extra(passage, root)
 
     for layer in sorted(passage.layers, key=attrgetter('ID')):
-        layer_elem = ET.SubElement(root, 'layer', layerID=layer.ID)
+        layer_elem = etree.SubElement(root, 'layer', layerID=layer.ID)
         _add_attrib(layer, layer_elem)
         _add_extra(layer, layer_elem)
         for node in layer.all:
-            node_elem = ET.SubElement(layer_elem, 'node',
-                                      ID=node.ID, type=node.tag)
+            node_elem = etree.SubElement(layer_elem, 'node',
+                                         ID=node.ID, type=node.tag)
             _add_attrib(node, node_elem)
             _add_extra(node, node_elem)
             for edge in node:
-                edge_elem = ET.SubElement(node_elem, 'edge',
-                                          toID=edge.child.ID, type=edge.tag)
+                edge_elem = etree.SubElement(node_elem, 'edge',
+                                             toID=edge.child.ID, type=edge.tag)
                 _add_attrib(edge, edge_elem)
                 _add_extra(edge, edge_elem)
     return root
 
 
+def write_standard(passage, f, indent=True):
+    """Writes a Passage object to a file in standard XML format.
+
+    Unlike to_standard, the XML element tree is never built: each node is
+    serialized and written as soon as it is reached. The output is identical
+    to serializing the to_standard root element with xml.etree and indenting
+    it with textutil.indent_xml.
+
+    :param passage: the passage to write
+    :param f: file object opened for writing text
+    :param indent: whether to indent each line
+    """
+    tabs = 0
+
+    def _write(chunk):  # chunk must consist of whole tags
+        nonlocal tabs
+        chunk = chunk.encode("ascii", "xmlcharrefreplace").decode()  # Like xml.etree's default "us-ascii" encoding
+        if not indent:
+            f.write(chunk)
+            return
+        lines = []
+        for line in chunk.replace('><', '>\n<').splitlines():  # Same as textutil.indent_xml
+            if line.startswith('</'):
+                tabs -= 1
+            lines.append(("  " * tabs) + line + '\n')
+            if not (line.endswith('/>') or line.startswith('</')):
+                tabs += 1
+        f.write("".join(lines))
+
+    def _tag(tag, attrib, empty=False):
+        # noinspection PyProtectedMember
+        return "<%s%s%s>" % (tag, "".join(' %s="%s"' % (k, ET._escape_attrib(v)) for k, v in attrib.items()),
+                             " /" if empty else "")
+
+    def _attrib_and_extra(obj):
+        return _tag('attributes', _dumps(obj.attrib), empty=True) + \
+            (_tag('extra', _dumps(obj.extra), empty=True) if obj.extra else "")
+
+    _write(_tag('root', dict(passageID=str(passage.ID), annotationID='0')) + _attrib_and_extra(passage))
+    for layer in sorted(passage.layers, key=attrgetter('ID')):
+        _write(_tag('layer', dict(layerID=layer.ID)) + _attrib_and_extra(layer))
+        for node in layer.all:
+            _write("".join([_tag('node', dict(ID=node.ID, type=node.tag)), _attrib_and_extra(node)] +
+                           [_tag('edge', dict(toID=edge.child.ID, type=edge.tag)) + _attrib_and_extra(edge) +
+                            '</edge>' for edge in node] + ['</node>']))
+        _write('</layer>')
+    _write('</root>')
+
+
+LAYER_OBJS = {layer0.LAYER_ID: layer0.Layer0,
+              layer1.LAYER_ID: layer1.Layer1}
+
+NODE_OBJS = {layer0.NodeTags.Word: layer0.Terminal,
+             layer0.NodeTags.Punct: layer0.Terminal,
+             layer1.NodeTags.Foundational: layer1.FoundationalNode,
+             layer1.NodeTags.Linkage: layer1.Linkage,
+             layer1.NodeTags.Punctuation: layer1.PunctNode}
+
+
 def from_standard(root, extra_funcs=None):
     def _str2bool(x):
         return x == "True"
@@ -638,15 +745,6 @@ def from_standard(root, extra_funcs=None):
         except JSONDecodeError:
             return x
 
-    layer_objs = {layer0.LAYER_ID: layer0.Layer0,
-                  layer1.LAYER_ID: layer1.Layer1}
-
-    node_objs = {layer0.NodeTags.Word: layer0.Terminal,
-                 layer0.NodeTags.Punct: layer0.Terminal,
-                 layer1.NodeTags.Foundational: layer1.FoundationalNode,
-                 layer1.NodeTags.Linkage: layer1.Linkage,
-                 layer1.NodeTags.Punctuation: layer1.PunctNode}
-
     def _get_attrib(elem):
         try:
             return {k: attribute_converters.get(k, str)(v)
@@ -655,49 +753,304 @@ def from_standard(root, extra_funcs=None):
             raise core.UCCAError("Element %s has no attributes" % elem.get("ID"))
 
     def _add_extra(obj, elem):
-        if elem.find('extra') is not None:
-            for k, v in elem.find('extra').items():
+        extra_elem = elem.find('extra')
+        if extra_elem is not None:
+            for k, v in extra_elem.items():
                 obj.extra[k] = (extra_funcs or {}).get(k, _loads)(v)
 
     passage = core.Passage(root.get('passageID'), attrib=_get_attrib(root))
     _add_extra(passage, root)
     edge_elems = []
-    for layer_elem in root.findall('layer'):
-        layer_id = layer_elem.get('layerID')
-        layer = layer_objs[layer_id](passage, attrib=_get_attrib(layer_elem))
-        _add_extra(layer, layer_elem)
-        # some nodes are created automatically, skip creating them when found
-        # in the XML (they should have 'constant' IDs) but take their edges
-        # and attributes/extra from the XML (may have changed from the default)
-        created_nodes = {x.ID: x for x in layer.all}
-        for node_elem in layer_elem.findall('node'):
-            node_id = node_elem.get('ID')
-            tag = node_elem.get('type')
-            node = created_nodes.get(node_id)
-            if node is None:
-                node = node_objs[tag](root=passage, ID=node_id, tag=tag, attrib=_get_attrib(node_elem))
-            else:
-                for key, value in _get_attrib(node_elem).items():
-                    node.attrib[key] = value
-            _add_extra(node, node_elem)
-            edge_elems += [(node, x) for x in node_elem.findall('edge')]
+    with passage.bulk_mode():
+        for layer_elem in root.iterfind('layer'):
+            layer_id = layer_elem.get('layerID')
+            layer = LAYER_OBJS[layer_id](passage, attrib=_get_attrib(layer_elem))
+            _add_extra(layer, layer_elem)
+            # some nodes are created automatically, skip creating them when found
+            # in the XML (they should have 'constant' IDs) but take their edges
+            # and attributes/extra from the XML (may have changed from the default)
+            created_nodes = {x.ID: x for x in layer.all}
+            for node_elem in layer_elem.iterfind('node'):
+                node_id = node_elem.get('ID')
+                tag = node_elem.get('type')
+                node = created_nodes.get(node_id)
+                if node is None:
+                    node = NODE_OBJS[tag](root=passage, ID=node_id, tag=tag, attrib=_get_attrib(node_elem))
+                else:
+                    for key, value in _get_attrib(node_elem).items():
+                        node.attrib[key] = value
+                _add_extra(node, node_elem)
+                edge_elems += [(node, x) for x in node_elem.iterfind('edge')]
+
+        # Adding edges (must have all nodes before doing so)
+        for from_node, edge_elem in edge_elems:
+            to_node = passage.by_id(edge_elem.get('toID'))
+            tag = edge_elem.get('type')
+            edge = from_node.add(tag, to_node, edge_attrib=_get_attrib(edge_elem))
+            _add_extra(edge, edge_elem)
+
+    return passage
+
+
+BINARY_MAGIC = b"UCCA"
+BINARY_VERSION = 1
+BINARY_SUFFIX = ".ucca.bin"
+NO_COMPRESSION = None
+GZIP = "gzip"
+ZSTD = "zstd"
+COMPRESSIONS = (NO_COMPRESSION, GZIP, ZSTD)
+_BINARY_HEADER = struct.Struct("<4sBB")  # magic, version, compression
+_FLOAT = struct.Struct("<d")
+_NONE, _FALSE, _TRUE, _INT, _STR, _FLOAT_VALUE, _JSON = range(7)  # value type codes
+
 
-    # Adding edges (must have all nodes before doing so)
-    for from_node, edge_elem in edge_elems:
-        to_node = passage.nodes[edge_elem.get('toID')]
-        tag = edge_elem.get('type')
-        edge = from_node.add(tag, to_node, edge_attrib=_get_attrib(edge_elem))
-        _add_extra(edge, edge_elem)
+class BinaryFormatError(core.UCCAError):
+    pass
+
+
+def _compressor(compression):
+    """Get the module implementing compress/decompress for the given compression.
+
+    :param compression: one of COMPRESSIONS
+
+    :return gzip module, zstandard-based wrapper, or None for no compression
+    """
+    if compression == GZIP:
+        return gzip
+    if compression == ZSTD:
+        if zstandard is None:
+            raise ImportError("Compression '%s' requested but zstandard is not installed" % ZSTD)
+        return zstandard
+    if compression is not None:
+        raise ValueError("Unknown compression: '%s' (should be one of %s)" % (
+            compression, ", ".join(map(str, COMPRESSIONS))))
+
+
+# Raised when decoding truncated or corrupt data: by the reader, the decompressors, or when looking up IDs and tags
+_BINARY_DECODE_ERRORS = (IndexError, KeyError, struct.error, UnicodeDecodeError, ValueError, EOFError, OSError) + (
+    () if zstandard is None else (zstandard.ZstdError,))
+
+
+class _BinaryWriter:
+    """Collects varint-encoded values for to_binary, interning all strings in a string table."""
+
+    def __init__(self):
+        self.strings = {}
+        self.buf = bytearray()
+
+    def varint(self, n):
+        while n > 0x7F:
+            self.buf.append(n & 0x7F | 0x80)
+            n >>= 7
+        self.buf.append(n)
+
+    def string(self, s):
+        index = self.strings.get(s)
+        if index is None:
+            index = self.strings[s] = len(self.strings)
+        self.varint(index)
+
+    def value(self, v):
+        if v is None:
+            self.buf.append(_NONE)
+        elif v is False:
+            self.buf.append(_FALSE)
+        elif v is True:
+            self.buf.append(_TRUE)
+        elif isinstance(v, int):
+            self.buf.append(_INT)
+            self.varint(v << 1 if v >= 0 else (-v << 1) - 1)  # zigzag encoding
+        elif isinstance(v, str):
+            self.buf.append(_STR)
+            self.string(v)
+        elif isinstance(v, float):
+            self.buf.append(_FLOAT_VALUE)
+            self.buf += _FLOAT.pack(v)
+        else:
+            self.buf.append(_JSON)
+            self.string(json.dumps(v))
+
+    def dict(self, d):
+        self.varint(len(d))
+        for key, value in d.items():
+            self.string(key)
+            self.value(value)
+
+    def getvalue(self):
+        table = _BinaryWriter()
+        table.varint(len(self.strings))
+        for s in self.strings:  # dict order is index order
+            encoded = s.encode("utf-8")
+            table.varint(len(encoded))
+            table.buf += encoded
+        return bytes(table.buf + self.buf)
+
+
+class _BinaryReader:
+    """Decodes the values written by _BinaryWriter."""
+
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+        self.strings = []
+        for _ in range(self.varint()):
+            length = self.varint()
+            self.strings.append(str(data[self.pos:self.pos + length], "utf-8"))
+            self.pos += length
+
+    def varint(self):
+        data, pos = self.data, self.pos
+        n = shift = 0
+        while True:
+            b = data[pos]
+            pos += 1
+            n |= (b & 0x7F) << shift
+            if b < 0x80:
+                self.pos = pos
+                return n
+            shift += 7
+
+    def string(self):
+        return self.strings[self.varint()]
+
+    def value(self):
+        code = self.data[self.pos]
+        self.pos += 1
+        if code == _NONE:
+            return None
+        if code == _FALSE:
+            return False
+        if code == _TRUE:
+            return True
+        if code == _INT:
+            n = self.varint()
+            return -((n + 1) >> 1) if n & 1 else n >> 1
+        if code == _STR:
+            return self.string()
+        if code == _FLOAT_VALUE:
+            v, = _FLOAT.unpack_from(self.data, self.pos)
+            self.pos += _FLOAT.size
+            return v
+        if code == _JSON:
+            return json.loads(self.string())
+        raise BinaryFormatError("Unknown value type code %d at position %d" % (code, self.pos - 1))
+
+    def dict(self):
+        return {self.string(): self.value() for _ in range(self.varint())}
+
+
+def to_binary(passage, compression=NO_COMPRESSION):
+    """ Converts a Passage object to the compact binary format.
+
+    The format is a header (magic bytes, version and compression) followed by the (optionally compressed) body:
+    a length-prefixed string table for all IDs, tags, attribute keys and string values, and then the layers, each
+    with its table of nodes, each with its table of outgoing edges. All numbers are encoded as varints.
+    Unlike pickle, loading it executes no arbitrary code and does not depend on the class definitions.
+
+    :param passage: the Passage object to convert
+    :param compression: one of COMPRESSIONS
+
+    :return bytes object
+    """
+    compressor = _compressor(compression)
+    w = _BinaryWriter()
+    w.string(passage.ID)
+    w.dict(passage.attrib)
+    w.dict(passage.extra)
+    layers = sorted(passage.layers, key=attrgetter("ID"))
+    w.varint(len(layers))
+    for layer in layers:
+        w.string(layer.ID)
+        w.dict(layer.attrib)
+        w.dict(layer.extra)
+        w.varint(len(layer.all))
+        for node in layer.all:
+            w.string(node.ID)
+            w.string(node.tag)
+            w.dict(node.attrib)
+            w.dict(node.extra)
+            w.varint(len(node))
+            for edge in node:
+                w.string(edge.child.ID)
+                w.string(edge.tag)
+                w.dict(edge.attrib)
+                w.dict(edge.extra)
+    body = w.getvalue()
+    header = _BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, COMPRESSIONS.index(compression))
+    return header + (body if compressor is None else compressor.compress(body))
+
+
+def from_binary(data):
+    """ Converts from the compact binary format (created by to_binary) to a Passage object.
+
+    :param data: bytes-like object to read from
+
+    :return a Passage object
+    :raise BinaryFormatError: if the data is not in the binary format, of an unsupported version, truncated or corrupt
+    """
+    try:
+        magic, version, compression = _BINARY_HEADER.unpack_from(data)
+    except struct.error as e:
+        raise BinaryFormatError("Data too short for a binary UCCA passage") from e
+    if magic != BINARY_MAGIC:
+        raise BinaryFormatError("Not a binary UCCA passage: %r" % bytes(magic))
+    if version > BINARY_VERSION:
+        raise BinaryFormatError("Unsupported binary format version %d (latest supported: %d)" % (
+            version, BINARY_VERSION))
+    try:
+        compressor = _compressor(COMPRESSIONS[compression])
+    except IndexError as e:
+        raise BinaryFormatError("Unknown compression code %d" % compression) from e
+    body = memoryview(data)[_BINARY_HEADER.size:]
+    try:
+        return _read_binary(_BinaryReader(body if compressor is None else compressor.decompress(body)))
+    except _BINARY_DECODE_ERRORS as e:
+        raise BinaryFormatError("Truncated or corrupt binary UCCA passage: %s" % e) from e
+
+
+def _read_binary(r):
+    """Reads the body of a binary passage (after the header and decompression), as written by to_binary.
+
+    :param r: _BinaryReader of the body
+
+    :return a Passage object
+    """
+    passage = core.Passage(r.string(), attrib=r.dict())
+    passage.extra.update(r.dict())
+    edges = []
+    with passage.bulk_mode():
+        for _ in range(r.varint()):
+            layer = LAYER_OBJS[r.string()](passage, attrib=r.dict())
+            layer.extra.update(r.dict())
+            created_nodes = {x.ID: x for x in layer.all}  # created automatically, as in from_standard
+            for _ in range(r.varint()):
+                node_id = r.string()
+                tag = r.string()
+                attrib = r.dict()
+                node = created_nodes.get(node_id)
+                if node is None:
+                    node = NODE_OBJS[tag](root=passage, ID=node_id, tag=tag, attrib=attrib)
+                else:
+                    node.attrib.update(attrib)
+                node.extra.update(r.dict())
+                edges += [(node, r.string(), r.string(), r.dict(), r.dict()) for _ in range(r.varint())]
+
+        # Adding edges (must have all nodes before doing so)
+        for from_node, to_id, tag, attrib, extra in edges:
+            edge = from_node.add(tag, passage.by_id(to_id), edge_attrib=attrib)
+            edge.extra.update(extra)
 
     return passage
 
 
-def from_text(text, passage_id="1", tokenized=False, one_per_line=False, extra_format=None, lang="en", *args, **kwargs):
+def from_text(text, passage_id="1", tokenized=False, one_per_line=False, extra_format=None, lang="en", first_index=0,
+              *args, **kwargs):
     """Converts from tokenized strings to a Passage object.
 
     :param text: a multi-line string or a sequence of strings:
                  each line will be a new paragraph, and blank lines separate passages
     :param passage_id: prefix of ID to set for returned passages
+    :param first_index: number to give the first passage in its ID, if the text is the rest of a longer text
     :param tokenized: whether the text is already given as a list of tokens
     :param one_per_line: each line will be a new passage rather than just a new paragraph
     :param extra_format: value to set in passage.extra["format"]
@@ -711,7 +1064,7 @@ def from_text(text, passage_id="1", tokenized=False, one_per_line=False, extra_f
     if tokenized:
         text = (text,)  # text is a list of tokens, not list of lines
     p = l0 = paragraph = None
-    i = 0
+    i = first_index
     for line in text:
         if not tokenized:
             line = line.strip()
@@ -821,68 +1174,71 @@ def from_json(lines, *args, all_categories=None, skip_category_mapping=False, **
     del args, kwargs
     d = lines if isinstance(lines, dict) else json.loads("".join(lines))
     passage = core.Passage(str(d.get("id") or d["manager_comment"]))
-    # Create terminals
-    l0 = layer0.Layer0(passage)
-    token_id_to_terminal = {token["id"]: l0.add_terminal(
-        text=token["text"], punct=not token["require_annotation"], paragraph=1)
-        for token in sorted(d["tokens"], key=itemgetter("index_in_task"))}
-    # Create non-terminals
-    l1 = layer1.Layer1(passage)
-    tree_id_to_node = {}
-    token_id_to_preterminal = {}
-    category_id_to_name = {c["id"]: c["name"] for c in all_categories} if all_categories else None
-    # Assuming topological sort: parents always appear before children
-    for unit in sorted(d["annotation_units"], key=itemgetter("is_remote_copy")):  # Get non-remotes first
-        tree_id = unit["tree_id"]
-        remote = unit["is_remote_copy"]
-        cloned_from_tree_id = None
-        if remote:
-            cloned_from_tree_id = unit.get("cloned_from_tree_id")
-            if cloned_from_tree_id is None:
-                raise ValueError("Remote unit %s without cloned_from_tree_id" % tree_id)
-        elif tree_id in tree_id_to_node:
-            raise ValueError("Unit %s is repeated" % tree_id)
-        parent_tree_id = unit["parent_tree_id"]
-        if parent_tree_id is None:  # Root node: no need to create
-            tree_id_to_node[tree_id] = None
-            continue
-        try:
-            parent_node = tree_id_to_node[parent_tree_id]
-        except KeyError:
-            raise ValueError("Unit %s appears before its parent, %s" % (tree_id, parent_tree_id))
-        category_name_to_edge_tag = {} if skip_category_mapping else EdgeTags.__dict__
-        for category in unit["categories"]:
-            try:
-                category_name = category.get("name") or category_id_to_name[category["id"]]
-            except TypeError:
-                raise ValueError("Missing category name, and no category list available")
-            except KeyError:
-                raise ValueError("Category missing from layer: " + category["id"])
-            if category_name in IGNORED_CATEGORIES:
+    with passage.bulk_mode():  # Ordering Nodes and Edges once in the end, rather than after each one is added
+        # Create terminals
+        l0 = layer0.Layer0(passage)
+        token_id_to_terminal = {token["id"]: l0.add_terminal(
+            text=token["text"], punct=not token["require_annotation"], paragraph=1)
+            for token in sorted(d["tokens"], key=itemgetter("index_in_task"))}
+        # Create non-terminals
+        l1 = layer1.Layer1(passage)
+        tree_id_to_node = {}
+        token_id_to_preterminal = {}
+        category_id_to_name = {c["id"]: c["name"] for c in all_categories} if all_categories else None
+        # Assuming topological sort: parents always appear before children
+        for unit in sorted(d["annotation_units"], key=itemgetter("is_remote_copy")):  # Get non-remotes first
+            tree_id = unit["tree_id"]
+            remote = unit["is_remote_copy"]
+            cloned_from_tree_id = None
+            if remote:
+                cloned_from_tree_id = unit.get("cloned_from_tree_id")
+                if cloned_from_tree_id is None:
+                    raise ValueError("Remote unit %s without cloned_from_tree_id" % tree_id)
+            elif tree_id in tree_id_to_node:
+                raise ValueError("Unit %s is repeated" % tree_id)
+            parent_tree_id = unit["parent_tree_id"]
+            if parent_tree_id is None:  # Root node: no need to create
+                tree_id_to_node[tree_id] = None
                 continue
-            tag = category_name_to_edge_tag.get(category_name.replace(" ", ""), category_name)
-            children_tokens = unit["children_tokens"]
             try:
-                terminal = token_id_to_terminal[children_tokens[0]["id"]] if len(children_tokens) == 1 else None
-            except (IndexError, KeyError):
-                terminal = None
-            if remote:
+                parent_node = tree_id_to_node[parent_tree_id]
+            except KeyError:
+                raise ValueError("Unit %s appears before its parent, %s" % (tree_id, parent_tree_id))
+            category_name_to_edge_tag = {} if skip_category_mapping else EdgeTags.__dict__
+            for category in unit["categories"]:
                 try:
-                    node = tree_id_to_node[cloned_from_tree_id]
+                    category_name = category.get("name") or category_id_to_name[category["id"]]
+                except TypeError:
+                    raise ValueError("Missing category name, and no category list available")
                 except KeyError:
-                    raise ValueError("Remote copy %s refers to nonexistent unit: %s" % (tree_id, cloned_from_tree_id))
-                l1.add_remote(parent_node, tag, node)
-            elif not skip_category_mapping and terminal and layer0.is_punct(terminal):
-                tree_id_to_node[tree_id] = l1.add_punct(None, terminal)
-            else:
-                node = tree_id_to_node[tree_id] = l1.add_fnode(parent_node, tag, implicit=(unit["type"] == "IMPLICIT"))
-                for token in children_tokens:
-                    token_id_to_preterminal[token["id"]] = node
-    # Attach terminals to non-terminals
-    for token_id, node in token_id_to_preterminal.items():
-        terminal = token_id_to_terminal[token_id]
-        if skip_category_mapping or not layer0.is_punct(terminal):
-            node.add(EdgeTags.Terminal, terminal)
+                    raise ValueError("Category missing from layer: " + category["id"])
+                if category_name in IGNORED_CATEGORIES:
+                    continue
+                tag = category_name_to_edge_tag.get(category_name.replace(" ", ""), category_name)
+                children_tokens = unit["children_tokens"]
+                try:
+                    terminal = token_id_to_terminal[children_tokens[0]["id"]] if len(children_tokens) == 1 else None
+                except (IndexError, KeyError):
+                    terminal = None
+                if remote:
+                    try:
+                        node = tree_id_to_node[cloned_from_tree_id]
+                    except KeyError:
+                        raise ValueError("Remote copy %s refers to nonexistent unit: %s" %
+                                         (tree_id, cloned_from_tree_id))
+                    l1.add_remote(parent_node, tag, node)
+                elif not skip_category_mapping and terminal and layer0.is_punct(terminal):
+                    tree_id_to_node[tree_id] = l1.add_punct(None, terminal)
+                else:
+                    node = tree_id_to_node[tree_id] = l1.add_fnode(parent_node, tag,
+                                                                   implicit=(unit["type"] == "IMPLICIT"))
+                    for token in children_tokens:
+                        token_id_to_preterminal[token["id"]] = node
+        # Attach terminals to non-terminals
+        for token_id, node in token_id_to_preterminal.items():
+            terminal = token_id_to_terminal[token_id]
+            if skip_category_mapping or not layer0.is_punct(terminal):
+                node.add(EdgeTags.Terminal, terminal)
     return passage
 
 
@@ -936,10 +1292,39 @@ def to_json(passage, *args, return_dict=False, tok_task=None, all_categories=Non
         edge_tag_to_category_name = {} if skip_category_mapping else \
             {v: re.sub(r"(?<=[a-z])(?=[A-Z])", " ", k) for k, v in EdgeTags.__dict__.items()}
 
+        node_id_to_terminals = {}
+
+        def _terminals(n):  # n.get_terminals(), but computing the terminals of each node only once
+            to_visit = [n]
+            visiting = set()
+            while to_visit:
+                node = to_visit[-1]
+                if node.ID in node_id_to_terminals:
+                    to_visit.pop()
+                    continue
+                if node.layer.ID != layer1.LAYER_ID or node.tag != layer1.NodeTags.Foundational:
+                    node_id_to_terminals[node.ID] = node.get_terminals()  # Terminal or PunctNode: no recursion
+                    continue
+                children = [e.child for e in node if not e.attrib.get("remote")]
+                missing = [c for c in children if c.ID not in node_id_to_terminals]
+                if not missing:
+                    node_id_to_terminals[node.ID] = sorted(
+                        chain.from_iterable(node_id_to_terminals[c.ID] for c in children),
+                        key=attrgetter("position"))
+                elif node.ID in visiting or visiting.intersection(c.ID for c in missing):  # Cycle
+                    node_id_to_terminals[node.ID] = node.get_terminals()
+                else:
+                    visiting.add(node.ID)
+                    to_visit += missing
+            return node_id_to_terminals[n.ID]
+
+        def _start_position(e):  # same as e.child.start_position
+            child_terminals = _terminals(e.child)
+            return child_terminals[0].position if child_terminals else -1
+
         def _outgoing(n):  # (tree ID element, outgoing edges sharing parent and child) for all children of node n
             return [([i + 1], list(es)) for i, (_, es) in enumerate(
-                groupby(sorted([e for e in n if e.tag not in IGNORED_EDGE_TAGS],
-                               key=attrgetter("child.start_position")),
+                groupby(sorted([e for e in n if e.tag not in IGNORED_EDGE_TAGS], key=_start_position),
                         key=lambda e: (e.child.ID, e.attrib.get("remote"))))]
 
         def _extra_tag(e):  # categories mentioned in the "remarks" attribute of the "extra" element in the node
@@ -951,9 +1336,9 @@ def to_json(passage, *args, return_dict=False, tok_task=None, all_categories=Non
             return tag
 
         # (tree id elements, edges per child) for each edge
-        queue = _outgoing(root_node)
+        queue = deque(_outgoing(root_node))
         while queue:  # breadth-first search
-            tree_id_elements, edges = queue.pop(0)  # edges all have the same child but may differ by category
+            tree_id_elements, edges = queue.popleft()  # edges all have the same child but may differ by category
             edge = edges[0]
             node = edge.child
             remote = edge.attrib.get("remote", False)
@@ -961,7 +1346,7 @@ def to_json(passage, *args, return_dict=False, tok_task=None, all_categories=Non
             tags = [e.tag for e in edges] + \
                 list(filter(None, (_extra_tag(e) for e in edges if not e.attrib.get("remote"))))
             categories = [dict(name=edge_tag_to_category_name.get(t, t), slot=1) for t in tags]
-            terminals = node.get_terminals()
+            terminals = _terminals(node)
             outgoing = _outgoing(node)
             if not outgoing and len(terminals) > 1:
                 categories.insert(0, dict(name=UNANALYZABLE))
@@ -992,9 +1377,21 @@ def to_json(passage, *args, return_dict=False, tok_task=None, all_categories=Non
     return d if return_dict else json.dumps(d).splitlines()
 
 
+def write_json(passage, f, *args, **kwargs):
+    """Write a Passage object to a file in UCCA-App JSON format (see to_json), dumping the dict directly rather than
+    splitting the encoded string into a list of lines first
+    :param passage: the Passage object to convert
+    :param f: file object to write to
+    :param args: arguments for to_json
+    :param kwargs: keyword arguments for to_json
+    """
+    kwargs["return_dict"] = True
+    json.dump(to_json(passage, *args, **kwargs), f)
+
+
 def file2passage(filename):
     """Opens a file and returns its parsed Passage object
-    Tries to read both as a standard XML file and as a binary pickle
+    Tries to read both as a standard XML file and as a binary pickle (or as the binary format, if ending with ".bin")
     :param filename: file name to write to
     """
     methods = [pickle2passage, xml2passage]
@@ -1003,6 +1400,8 @@ def file2passage(filename):
         del methods[0]
     elif ext == ".pickle":
         del methods[1]
+    elif ext == ".bin":
+        methods = [bin2passage]
     exception = None
     for method in methods:
         try:
@@ -1013,9 +1412,16 @@ def file2passage(filename):
         raise IOError("Failed reading '%s'" % filename) from exception
 
 
-def xml2passage(filename):
-    with open(filename, encoding="utf-8") as f:
-        return from_standard(ET.ElementTree().parse(f))
+def xml2passage(filename, backend=None):
+    """Opens a standard XML file and returns its parsed Passage object
+    :param filename: file name to read from
+    :param backend: XML backend to parse with, out of XML_BACKENDS (default: lxml if installed)
+    """
+    etree = get_xml_backend(backend)
+    if etree is ET:
+        with open(filename, encoding="utf-8") as f:
+            return from_standard(ET.ElementTree().parse(f))
+    return from_standard(etree.parse(filename, etree.XMLParser(remove_blank_text=True, huge_tree=True)).getroot())
 
 
 def pickle2passage(filename):
@@ -1023,33 +1429,64 @@ def pickle2passage(filename):
         return pickle.load(h)
 
 
-def passage2file(passage, filename, indent=True, binary=False):
-    """Writes a UCCA passage as a standard XML file or a binary pickle
+def bin2passage(filename):
+    """Opens a file in the compact binary format (see to_binary) and returns its parsed Passage object
+    :param filename: file name to read from
+    """
+    with open(filename, "rb") as h:
+        return from_binary(h.read())
+
+
+def xml2string(root, indent=True):
+    """Serializes an XML element (created by either XML backend) to string
+    :param root: root element of the XML structure
+    :param indent: whether to indent each line
+    :return XML string
+    """
+    if LET is not None and isinstance(root, LET._Element):
+        # Same output as xml.etree.ElementTree, which writes "<x />" and "&#09;" where lxml writes "<x/>" and "&#9;".
+        # The one remaining difference is that lxml escapes carriage returns in text (as "&#13;") rather than
+        # writing them as is, which is lossless where ElementTree's output is not
+        xml_string = LET.tostring(root).decode().replace("/>", " />").replace("&#9;", "&#09;")
+    else:
+        xml_string = ET.tostring(root).decode()
+    return textutil.indent_xml(xml_string) if indent else xml_string
+
+
+def passage2file(passage, filename, indent=True, binary=False, backend=None, compression=NO_COMPRESSION):
+    """Writes a UCCA passage as a standard XML file, a binary pickle, or in the compact binary format
     :param passage: passage object to write
-    :param filename: file name to write to
+    :param filename: file name to write to (if ending with BINARY_SUFFIX, the compact binary format is used)
     :param indent: whether to indent each line
     :param binary: whether to write pickle format (or XML)
+    :param backend: XML backend to build the element tree with, out of XML_BACKENDS
+                    (default: write directly with write_standard, without building the tree)
+    :param compression: compression for the compact binary format, out of COMPRESSIONS
     """
-    if binary:
+    if str(filename).endswith(BINARY_SUFFIX):
+        with open(filename, "wb") as h:
+            h.write(to_binary(passage, compression=compression))
+    elif binary:
         with open(filename, "wb") as h:
             pickle.dump(passage, h)
-    else:  # xml
-        root = to_standard(passage)
-        xml_string = ET.tostring(root).decode()
-        output = textutil.indent_xml(xml_string) if indent else xml_string
+    elif backend is None:  # xml, written directly without building the element tree
+        with open(filename, "w", encoding="utf-8") as h:
+            write_standard(passage, h, indent=indent)
+    else:  # xml, through the element tree of the given backend
+        output = xml2string(to_standard(passage, backend=backend), indent)
         with open(filename, "w", encoding="utf-8") as h:
             h.write(output)
 
 
-def split2sentences(passage, remarks=False, lang="en", ids=None):
-    return split2segments(passage, is_sentences=True, remarks=remarks, lang=lang, ids=ids)
+def split2sentences(passage, remarks=False, lang="en", ids=None, splitter=None):
+    return split2segments(passage, is_sentences=True, remarks=remarks, lang=lang, ids=ids, splitter=splitter)
 
 
 def split2paragraphs(passage, remarks=False, lang="en", ids=None):
     return split2segments(passage, is_sentences=False, remarks=remarks, lang=lang, ids=ids)
 
 
-def split2segments(passage, is_sentences, remarks=False, lang="en", ids=None):
+def split2segments(passage, is_sentences, remarks=False, lang="en", ids=None, splitter=None):
     """
     Split passage to sub-passages
     :param passage: Passage object
@@ -1057,9 +1494,11 @@ def split2segments(passage, is_sentences, remarks=False, lang="en", ids=None):
     :param remarks: Whether to add remarks with original node IDs
     :param lang: language to use for sentence splitting model
     :param ids: optional iterable of ids to set passage IDs for each split
+    :param splitter: sentence splitter for passages without annotation, see textutil.get_sentence_splitter
     :return: sequence of passages
     """
-    ends = (textutil.break2sentences if is_sentences else textutil.break2paragraphs)(passage, lang=lang)
+    ends = (textutil.break2sentences if is_sentences else textutil.break2paragraphs)(passage, lang=lang,
+                                                                                      splitter=splitter)
     return split_passage(passage, ends, remarks=remarks, ids=ids)
 
 
@@ -1073,24 +1512,28 @@ def split_passage(passage, ends, remarks=False, ids=None):
     :return: sequence of passages
     """
     passages = []
+    id_to_others = []
+    node_segments = {}  # node ID -> indices of the split passages the node will be copied to
+    segment_annotations = []
+    l0 = passage.layer(layer0.LAYER_ID)
+    docs = l0.extra.get("doc") or ()
     for i, (start, end, index) in enumerate(zip([0] + ends[:-1], ends, ids or repeat(None))):
         if start == end:
             continue
         other = core.Passage(ID=index or "%s%03d" % (passage.ID, i), attrib=passage.attrib.copy())
         other.extra = passage.extra.copy()
         # Create terminals and find layer 1 nodes to be included
-        l0 = passage.layer(layer0.LAYER_ID)
         other_l0 = layer0.Layer0(root=other, attrib=l0.attrib.copy())
-        other_l0.extra = l0.extra.copy()
+        other_l0.extra = {k: v for k, v in l0.extra.items() if k != "doc"}  # Not shared: set by offset below
         level = set()
         nodes = set()
         id_to_other = {}
-        paragraphs = set()
+        annotations = []
         for terminal in l0.all[start:end]:
             other_terminal = other_l0.add_terminal(terminal.text, terminal.punct, 1)
             _copy_extra(terminal, other_terminal, remarks)
             other_terminal.extra["orig_paragraph"] = terminal.paragraph
-            paragraphs.add(terminal.paragraph)
+            annotations.append(_token_annotation(docs, terminal))
             id_to_other[terminal.ID] = other_terminal
             level.update(terminal.parents)
             nodes.add(terminal)
@@ -1098,14 +1541,19 @@ def split_passage(passage, ends, remarks=False, ids=None):
             nodes.update(level)
             level = set(e.parent for n in level for e in n.incoming if not e.attrib.get("remote") and
                         e.tag != layer1.EdgeTags.Punctuation and e.parent not in nodes)
-
-        other_l1 = layer1.Layer1(root=other, attrib=passage.layer(layer1.LAYER_ID).attrib.copy())
-        _copy_l1_nodes(passage, other, id_to_other, nodes, remarks=remarks)
-        attach_punct(other_l0, other_l1)
-        for j, paragraph in enumerate(paragraphs, start=1):
-            other_l0.doc(j)[:] = l0.doc(paragraph)
-        other.frozen = passage.frozen
+        for node in nodes:
+            node_segments.setdefault(node.ID, set()).add(len(passages))
+        layer1.Layer1(root=other, attrib=passage.layer(layer1.LAYER_ID).attrib.copy())
         passages.append(other)
+        id_to_others.append(id_to_other)
+        segment_annotations.append(annotations)
+    # Copy all layer 1 nodes in one pass over the passage, rather than one pass per split passage
+    _copy_l1_nodes(passage, passages, id_to_others, node_segments, remarks=remarks)
+    for other, annotations in zip(passages, segment_annotations):
+        other_l0 = other.layer(layer0.LAYER_ID)
+        attach_punct(other_l0, other.layer(layer1.LAYER_ID))
+        _set_doc(other_l0, 1, annotations)  # All terminals are in one paragraph
+        other.frozen = passage.frozen
     return passages
 
 
@@ -1127,87 +1575,142 @@ def join_passages(passages, passage_id=None, remarks=False):
     layer1.Layer1(root=other, attrib=l1.attrib.copy())
     id_to_other = {}
     paragraph = 0
-    for passage in passages:
-        l0 = passage.layer(layer0.LAYER_ID)
-        paragraphs = set()
-        for terminal in l0.all:
-            if terminal.para_pos == 1:
-                paragraph += 1
-            orig_paragraph = terminal.extra.get("orig_paragraph")
-            if orig_paragraph is not None:
-                paragraph = orig_paragraph
-            paragraphs.add(paragraph)
-            other_terminal = other_l0.add_terminal(terminal.text, terminal.punct, paragraph)
-            _copy_extra(terminal, other_terminal, remarks)
-            id_to_other[terminal.ID] = other_terminal
-        for paragraph in paragraphs:
-            other_l0.doc(paragraph).extend(l0.doc(1))
-        _copy_l1_nodes(passage, other, id_to_other, remarks=remarks)
+    token_annotations = []  # per paragraph, the annotation of each terminal in layer 0 doc (or None if missing)
+    with other.bulk_mode():
+        for passage in passages:
+            l0 = passage.layer(layer0.LAYER_ID)
+            docs = l0.extra.get("doc") or ()
+            for terminal in l0.all:
+                if terminal.para_pos == 1:
+                    paragraph += 1
+                orig_paragraph = terminal.extra.get("orig_paragraph")
+                if orig_paragraph is not None:
+                    paragraph = orig_paragraph
+                other_terminal = other_l0.add_terminal(terminal.text, terminal.punct, paragraph)
+                _copy_extra(terminal, other_terminal, remarks)
+                id_to_other[terminal.ID] = other_terminal
+                # Merge doc by offset: the annotation of each terminal moves to its position in the joined passage
+                while len(token_annotations) < paragraph:
+                    token_annotations.append([])
+                annotations = token_annotations[paragraph - 1]
+                annotations += (other_terminal.para_pos - len(annotations)) * [None]
+                annotations[other_terminal.para_pos - 1] = _token_annotation(docs, terminal)
+            _copy_l1_nodes(passage, [other], [id_to_other], remarks=remarks)
+    for i, annotations in enumerate(token_annotations, start=1):
+        _set_doc(other_l0, i, annotations)
     return other
 
 
-def _copy_l1_nodes(passage, other, id_to_other, include=None, remarks=False):
+def _token_annotation(docs, terminal):
+    """
+    :param docs: extra["doc"] of the layer 0 of the terminal (see layer0.Layer0.docs)
+    :param terminal: Terminal to get annotation for
+    :return: annotation of the terminal from the layer 0 doc, or None if missing
+    """
+    try:
+        return docs[terminal.paragraph - 1][terminal.para_pos - 1]
+    except IndexError:
+        return None
+
+
+def _set_doc(l0, paragraph, annotations):
+    """
+    Set the layer 0 doc of a paragraph, keeping only annotations up to the first missing one (None),
+    so that the rest can be annotated by textutil.annotate
     """
-    Copy all layer 1 nodes from one passage to another
+    l0.doc(paragraph)[:] = annotations[:annotations.index(None)] if None in annotations else annotations
+
+
+def _copy_l1_nodes(passage, others, id_to_others, node_segments=None, remarks=False):
+    """
+    Copy all layer 1 nodes from one passage to others (each getting only the nodes in its segment), in one pass
     :param passage: source passage
-    :param other: target passage
-    :param id_to_other: dictionary mapping IDs from passage to existing nodes from other
-    :param include: if given, only the nodes from this set will be copied
+    :param others: target passages
+    :param id_to_others: for each target passage, dictionary mapping IDs from passage to existing nodes from it
+    :param node_segments: if given, dictionary mapping node IDs to the set of indices of target passages to copy
+                          the node to, and nodes not in it are not copied (otherwise, copy all nodes to all targets)
     :param remarks: add original node ID as remarks to the new nodes
     """
     l1 = passage.layer(layer1.LAYER_ID)
-    other_l1 = other.layer(layer1.LAYER_ID)
+    other_l1s = [other.layer(layer1.LAYER_ID) for other in others]
+    all_segments = range(len(others))
+
+    def _segments(n):
+        return all_segments if node_segments is None else node_segments.get(n.ID, ())
+
+    # Each entry has the node to copy and, for each segment it is copied to, the node in the target passage
     queue = [(n, None) for n in l1.heads]
-    linkages = []
-    remotes = []
-    heads = []
-    while queue:
-        node, other_node = queue.pop()
-        if node.tag == layer1.NodeTags.Linkage:
-            if include is None or set(include).issuperset(node.children):
-                linkages.append(node)
-            continue
-        if other_node is None:
-            heads.append(node)
-            other_node = other_l1.heads[0]
-        for edge in node:
-            is_remote = edge.attrib.get("remote", False)
-            if include is None or edge.child in include or _unanchored(edge.child):
-                if is_remote:
-                    remotes.append((edge, other_node))
-                    continue
-                if edge.child.layer.ID == layer0.LAYER_ID:
-                    other_node.add(edge.tag, id_to_other[edge.child.ID])
-                    continue
-                if edge.child.tag == layer1.NodeTags.Punctuation:
-                    grandchild = edge.child.children[0]
-                    other_child = other_l1.add_punct(other_node, id_to_other[grandchild.ID])
-                    other_child.incoming[0].tag = edge.tag
+    linkages = [[] for _ in others]
+    remotes = [[] for _ in others]
+    heads = [[] for _ in others]
+    with ExitStack() as stack:
+        for other in others:
+            stack.enter_context(other.bulk_mode())
+        while queue:
+            node, other_nodes = queue.pop()
+            if node.tag == layer1.NodeTags.Linkage:
+                children = node.children
+                segments = set(_segments(children[0])).intersection(*map(_segments, children[1:])) if children \
+                    else all_segments
+                for i in segments:
+                    linkages[i].append(node)
+                continue
+            if other_nodes is None:
+                other_nodes = {}
+                for i in all_segments:
+                    heads[i].append(node)
+                    other_nodes[i] = other_l1s[i].heads[0]
+            for edge in node:
+                is_remote = edge.attrib.get("remote", False)
+                if _unanchored(edge.child):
+                    included = other_nodes
                 else:
-                    other_child = other_l1.add_fnode(other_node, edge.tag, implicit=edge.child.attrib.get("implicit"))
-                    queue.append((edge.child, other_child))
-                id_to_other[edge.child.ID] = other_child
-                _copy_extra(edge.child, other_child, remarks)  # Add remotes
-            elif is_remote:  # Cross-paragraph remote edge -> create implicit child instead
-                other_l1.add_fnode(other_node, edge.tag, implicit=True)
-    for edge, parent in remotes:
-        other_child = id_to_other.get(edge.child.ID)
-        if other_child is None:  # Promote remote edge to primary if the original primary parent is gone due to split
-            id_to_other[edge.child.ID] = other_child = \
-                other_l1.add_fnode(parent, edge.tag, implicit=edge.child.attrib.get("implicit"))
-            _copy_extra(edge.child, other_child, remarks)
-        else:
-            other_l1.add_remote(parent, edge.tag, other_child)
-    # Add linkages
-    for linkage in linkages:
-        try:
-            arguments = [id_to_other[argument.ID] for argument in linkage.arguments]
-            other_linkage = other_l1.add_linkage(id_to_other[linkage.relation.ID], *arguments)
-            _copy_extra(linkage, other_linkage, remarks)
-        except layer1.MissingRelationError:
-            pass
-    for head, other_head in zip(heads, other_l1.heads):
-        _copy_extra(head, other_head, remarks)
+                    included = [i for i in _segments(edge.child) if i in other_nodes]
+                other_children = {}
+                for i in sorted(included):
+                    other_node, other_l1, id_to_other = other_nodes[i], other_l1s[i], id_to_others[i]
+                    if is_remote:
+                        remotes[i].append((edge, other_node))
+                        continue
+                    if edge.child.layer.ID == layer0.LAYER_ID:
+                        other_node.add(edge.tag, id_to_other[edge.child.ID])
+                        continue
+                    if edge.child.tag == layer1.NodeTags.Punctuation:
+                        grandchild = edge.child.children[0]
+                        other_child = other_l1.add_punct(other_node, id_to_other[grandchild.ID])
+                        other_child.incoming[0].tag = edge.tag
+                    else:
+                        other_child = other_children[i] = other_l1.add_fnode(
+                            other_node, edge.tag, implicit=edge.child.attrib.get("implicit"))
+                    id_to_other[edge.child.ID] = other_child
+                    _copy_extra(edge.child, other_child, remarks)  # Add remotes
+                if other_children:
+                    queue.append((edge.child, other_children))
+                if is_remote and len(included) < len(other_nodes):
+                    for i in sorted(set(other_nodes).difference(included)):
+                        # Cross-paragraph remote edge -> create implicit child instead
+                        other_l1s[i].add_fnode(other_nodes[i], edge.tag, implicit=True)
+        for other_l1, id_to_other, segment_remotes, segment_linkages in zip(other_l1s, id_to_others, remotes,
+                                                                             linkages):
+            for edge, parent in segment_remotes:
+                other_child = id_to_other.get(edge.child.ID)
+                if other_child is None:  # Promote remote edge to primary if the original primary parent is gone
+                    id_to_other[edge.child.ID] = other_child = \
+                        other_l1.add_fnode(parent, edge.tag, implicit=edge.child.attrib.get("implicit"))
+                    _copy_extra(edge.child, other_child, remarks)
+                else:
+                    other_l1.add_remote(parent, edge.tag, other_child)
+            # Add linkages
+            for linkage in segment_linkages:
+                try:
+                    arguments = [id_to_other[argument.ID] for argument in linkage.arguments]
+                    other_linkage = other_l1.add_linkage(id_to_other[linkage.relation.ID], *arguments)
+                    _copy_extra(linkage, other_linkage, remarks)
+                except layer1.MissingRelationError:
+                    pass
+    for other_l1, segment_heads in zip(other_l1s, heads):
+        for head, other_head in zip(segment_heads, other_l1.heads):
+            _copy_extra(head, other_head, remarks)
 
 
 def _copy_extra(node, other, remarks=False):
@@ -9,6 +9,7 @@ are connected between themselves and to Nodes in other layers using
 """
 
 import functools
+from contextlib import contextmanager
 
 
 # Max number of digits allowed for a unique ID
@@ -123,12 +124,9 @@ class ModifyPassage:
                 modified.
 
         """
-        @functools.wraps(self.fn)
-        def decorated(*args, **kwargs):
-            if args[0].root.frozen:
-                raise FrozenPassageError(args[0].root.ID)
-            return self.fn(*args, **kwargs)
-        return decorated(*args, **kwargs)
+        if args[0].root.frozen:
+            raise FrozenPassageError(args[0].root.ID)
+        return self.fn(*args, **kwargs)
 
 
 class _AttributeDict:
@@ -423,9 +421,10 @@ class Node:
         edge = Edge(root=self._root, tag=edge_tag, parent=self,
                     child=node, attrib=edge_attrib)
         self._outgoing.append(edge)
-        self._outgoing.sort(key=self._orderkey)
         node._incoming.append(edge)
-        node._incoming.sort(key=node._orderkey)
+        if not self._root.bulk:
+            self._reorder()
+            node._reorder()
         self.root._add_edge(edge)
         return edge
 
@@ -468,6 +467,11 @@ class Node:
         self._orderkey = value
         self._outgoing.sort(key=value)
 
+    def _reorder(self):
+        """Sorts the outgoing and incoming :class:Edge objects by orderkey."""
+        self._outgoing.sort(key=self._orderkey)
+        self._incoming.sort(key=self._orderkey)
+
     @ModifyPassage
     def destroy(self):
         """Removes the :class:Node from the :class:Passage annotation graph.
@@ -718,11 +722,11 @@ class Layer:
         :param edge: the Edge added to the Layer subgraph
 
         """
-        if edge.child in self._heads:
+        if edge.child.layer is self and edge.child in self._heads:  # other Layers' Nodes are never heads here
             self._heads.remove(edge.child)
         # Order may depend on edges, so re-order
-        self._all.sort(key=self._orderkey)
-        self._heads.sort(key=self._orderkey)
+        if not self._root.bulk:
+            self._reorder()
 
     def _remove_edge(self, edge):
         """Alters self.heads if an :class:Edge has been removed.
@@ -735,10 +739,9 @@ class Layer:
         """
         if edge.child.layer == self and all(p.layer != self for p in edge.child.parents):
             self._heads.append(edge.child)
-            self._heads.sort(key=self._orderkey)
         # Order may depend on edges, so re-order
-        self._all.sort(key=self._orderkey)
-        self._heads.sort(key=self._orderkey)
+        if not self._root.bulk:
+            self._reorder()
 
     def _add_node(self, node):
         """Adds a :class:node to the :class:Layer.
@@ -747,10 +750,23 @@ class Layer:
 
         """
         self._all.append(node)
-        self._all.sort(key=self._orderkey)
         self._heads.append(node)
+        if not self._root.bulk:
+            self._reorder()
+
+    def _reorder(self):
+        """Sorts all Nodes and heads of the :class:Layer by orderkey."""
+        self._all.sort(key=self._orderkey)
         self._heads.sort(key=self._orderkey)
 
+    def _exit_bulk_mode(self):
+        """Brings the :class:Layer up to date after :func:Passage.bulk_mode.
+
+        Subclasses which defer other updates in bulk mode should override it.
+
+        """
+        self._reorder()
+
     def _remove_node(self, node):
         """Removes a :class:node from the :class:Layer.
 
@@ -794,9 +810,13 @@ class Passage:
         layers: all Layers of the Passage, no order guaranteed
         nodes: dictionary of ID-node pairs for all the nodes in the Passage
         frozen: indicates whether the Passage can be modified or not, boolean.
+        bulk: indicates whether ordering of Nodes and Edges is deferred, boolean
+            (see :func:Passage.bulk_mode).
 
     """
 
+    bulk = False  # Also the value for Passages pickled before this attribute existed
+
     def __init__(self, ID, attrib=None):
         """Creates a new :class:Passage object.
 
@@ -809,6 +829,7 @@ class Passage:
         self._layers = {}
         self._nodes = {}
         self.frozen = False
+        self.bulk = False
 
     @property
     def ID(self):
@@ -906,14 +927,39 @@ class Passage:
         """
         other = Passage(ID=self.ID, attrib=self.attrib.copy())
         other.extra = self.extra.copy()
-        for lid in layers:
-            try:
-                self.layer(lid).copy(other)
-            except AttributeError:
-                raise UnimplementedMethodError()
+        with other.bulk_mode():
+            for lid in layers:
+                try:
+                    self.layer(lid).copy(other)
+                except AttributeError:
+                    raise UnimplementedMethodError()
         other.frozen = self.frozen
         return other
 
+    @contextmanager
+    def bulk_mode(self):
+        """Context manager for adding many :class:Node and :class:Edge objects.
+
+        Layers and Nodes normally keep their Nodes and Edges ordered after
+        every change, which takes quadratic time when building a large
+        Passage. Inside this context the ordering is skipped, so Layer.all,
+        Layer.heads and Node.outgoing/incoming are in insertion order until
+        the context exits, when everything is ordered once.
+
+        """
+        if self.bulk:  # Nested: the outermost context orders on exit
+            yield self
+            return
+        self.bulk = True
+        try:
+            yield self
+        finally:
+            self.bulk = False
+            for node in self._nodes.values():
+                node._reorder()
+            for layer in self._layers.values():
+                layer._exit_bulk_mode()
+
     def by_id(self, ID):
         """Returns a Node whose ID is given.
 
@@ -8,10 +8,9 @@ v1.2
 """
 from collections import Counter, OrderedDict
 
-from operator import attrgetter
-
 from ucca import layer0, layer1, normalization
-from ucca.constructions import get_by_names, create_passage_yields, PRIMARY, DEFAULT, ALL_EDGES
+from ucca.constructions import get_by_names, create_passage_yields, create_category_construction, get_yield_bits, \
+    yield_positions, PRIMARY, DEFAULT, ALL_EDGES, CONSTRUCTION_BY_NAME
 from ucca.layer1 import EdgeTags, NodeTags
 
 UNLABELED = "unlabeled"
@@ -27,19 +26,16 @@ EQUIV = ((EdgeTags.Process, EdgeTags.State),
          (EdgeTags.Function, EdgeTags.Relator))
 
 
-def get_yield(unit):
-    try:
-        return frozenset(t.position for t in unit.get_terminals(punct=False))
-    except ValueError:
-        return frozenset()
+def get_yield(unit, spans=None):
+    return get_yield_bits(unit, spans)[1]
 
 
 def move_functions(p1, p2):
     """
     Move any common Fs to the root
     """
-    f1, f2 = [{get_yield(u): u for u in p.layer(layer1.LAYER_ID).all
-               if u.tag == NodeTags.Foundational and u.ftag == EdgeTags.Function} for p in (p1, p2)]
+    f1, f2 = [{get_yield(u, spans): u for u in p.layer(layer1.LAYER_ID).all
+               if u.tag == NodeTags.Foundational and u.ftag == EdgeTags.Function} for p, spans in ((p1, {}), (p2, {}))]
     for positions in f1.keys() & f2.keys():
         for (p, unit) in ((p1, f1[positions]), (p2, f2[positions])):
             for parent in unit.parents:
@@ -48,13 +44,27 @@ def move_functions(p1, p2):
                 p.layer(layer1.LAYER_ID).heads[0].add(tag, unit)
 
 
+def copy_passages(*passages):
+    """
+    Copy layers 0 and 1 of the passages, to be modified by normalization (the same passage given twice is copied once)
+    :param passages: Passage objects
+    :return: list of copies, in the same order
+    """
+    copies = {}
+    for passage in passages:
+        if id(passage) not in copies:
+            copies[id(passage)] = other = passage.copy((layer0.LAYER_ID, layer1.LAYER_ID))
+            other.frozen = False  # The copy is only used here, so it can be normalized even if the passage is frozen
+    return [copies[id(passage)] for passage in passages]
+
+
 def get_text(p, positions):
     l0 = p.layer(layer0.LAYER_ID)
-    return [l0.by_position(i).text for i in range(1, len(l0.all) + 1) if i in positions]
+    return [l0.by_position(i).text for i in yield_positions(positions)]
 
 
 def print_tags_and_text(p, yield_tags):
-    for y, tags in sorted(yield_tags.items(), key=lambda x: min(x[0] or [0])):
+    for y, tags in sorted(yield_tags.items(), key=lambda x: (x[0] & -x[0]).bit_length()):  # Lowest position first
         text = " ".join(get_text(p, y))
         print((",".join(sorted(filter(None, tags))) + ": " + text) if tags else text)
 
@@ -67,6 +77,14 @@ def expand_equivalents(tag_set):
     return tag_set.union(t1 for t in tag_set for pair in EQUIV for t1 in pair if t in pair and t != t1)
 
 
+def get_construction(name):
+    """
+    :param name: name of a construction, or an edge tag for the construction of its category
+    :return: Construction object
+    """
+    return CONSTRUCTION_BY_NAME.get(name) or create_category_construction(name)
+
+
 class Evaluator:
     def __init__(self, verbose, constructions, units, fscore, errors):
         """
@@ -83,73 +101,125 @@ class Evaluator:
         self.fscore = fscore
         self.errors = errors
 
-        self.mutual = OrderedDict()
+        self.mutual_by_type = OrderedDict()  # eval_type -> Construction -> yield -> tags shared by both passages
         self.error_counters = OrderedDict()
 
-    def find_mutuals(self, m1, m2, eval_type, construction):
-        mutual_tags = self.mutual.setdefault(construction, {})
-        for y in m1.keys() & m2.keys():
-            if eval_type == UNLABELED:
-                mutual_tags[y] = ()
-            else:
-                tags = [set(m1[y]), set(m2[y])]
+    @property
+    def mutual(self):
+        """
+        Dict: Construction -> yield -> tags shared by both passages, for the last evaluation type evaluated (the one
+        given to get_scores); see mutual_by_type for all evaluation types evaluated at once by get_all_scores
+        """
+        return next(reversed(self.mutual_by_type.values()), OrderedDict())
+
+    def find_mutuals(self, m1, m2, eval_types, construction):
+        """
+        Find the yields shared by two passages, for one or more evaluation types at once
+        :param m1: dict: yield -> tags, of the guessed passage
+        :param m2: dict: yield -> tags, of the reference passage
+        :param eval_types: evaluation type, or list of evaluation types out of EVAL_TYPES
+        :param construction: Construction the yields belong to
+        """
+        if isinstance(eval_types, str):
+            eval_types = [eval_types]
+        mutual_tags = [self.mutual_by_type.setdefault(eval_type, OrderedDict()).setdefault(construction, {})
+                       for eval_type in eval_types]
+        for y in [y for y in m1 if y in m2]:
+            tags1 = tags2 = expanded = None
+            for eval_type, mutual in zip(eval_types, mutual_tags):
+                if eval_type == UNLABELED:
+                    mutual[y] = ()
+                    continue
+                if tags1 is None:
+                    tags1, tags2 = set(m1[y]), set(m2[y])
                 if eval_type == WEAK_LABELED:
-                    tags[0] = expand_equivalents(tags[0])
+                    if expanded is None:
+                        expanded = expand_equivalents(tags1)
+                    tags = [expanded, tags2]
+                else:
+                    tags = [tags1, tags2]
                 intersection = set.intersection(*tags)
                 if intersection:  # non-empty intersection
-                    mutual_tags[y] = intersection
+                    mutual[y] = intersection
                 elif self.errors:
                     self.error_counters.setdefault(eval_type, {}).setdefault(construction, Counter())[
                         tuple("|".join(sorted(t)) for t in tags)] += 1
 
-    def get_scores(self, p1, p2, eval_type, r=None):
+    def get_yields(self, p1, p2, r=None):
         """
-        prints the relevant statistics and f-scores. eval_type can be 'unlabeled', 'labeled' or 'weak_labeled'.
-        calculates a set of all the yields such that both passages have a unit with that yield.
-        :param p1: passage to compare
+        Extract the yields of all units in both passages, for each construction
+        :param p1: passage to compare, or None
         :param p2: reference passage object
-        :param eval_type: evaluation type to use, out of EVAL_TYPES
-        1. UNLABELED: it doesn't matter what labels are there.
-        2. LABELED: also requires tag match (if there are multiple units with the same yield, requires one match)
-        3. WEAK_LABELED: also requires weak tag match (if there are multiple units with the same yield,
-                         requires one match)
         :param r: reference passage for fine-grained evaluation
-        :returns EvaluatorResults object if self.fscore is True, otherwise None
+        :return: list of two dicts: Construction -> dict: yield -> tags, for p1 and for p2
         """
-        self.mutual.clear()
-        self.error_counters.clear()
         reference_yield_tags = None if r is None else create_passage_yields(r, punct=True)[ALL_EDGES.name]
         maps = [{}, create_passage_yields(p2, self.constructions,
                                           reference_yield_tags=reference_yield_tags)]
         if p1 is not None:
             maps[0] = create_passage_yields(p1, self.constructions,
                                             reference=p2, reference_yield_tags=reference_yield_tags)
+        return maps
+
+    def get_all_scores(self, p1, p2, eval_types=EVAL_TYPES, r=None):
+        """
+        Like get_scores, but for several evaluation types, extracting the yields of the passages only once.
+        :param p1: passage to compare
+        :param p2: reference passage object
+        :param eval_types: evaluation types to use, out of EVAL_TYPES
+        :param r: reference passage for fine-grained evaluation
+        :returns OrderedDict: eval_type -> EvaluatorResults
+        """
+        self.mutual_by_type.clear()
+        self.error_counters.clear()
+        maps = self.get_yields(p1, p2, r=r)
+        if p1 is not None:
             ordered_constructions = [c for c in self.constructions if c in maps[0] or c in maps[1]]
             ordered_constructions += [c for c in maps[1] if c not in ordered_constructions]
             ordered_constructions += [c for c in maps[0] if c not in ordered_constructions]
             for construction in ordered_constructions:
                 yield_tags1 = maps[0].get(construction, {})
                 yield_tags2 = maps[1].get(construction, {})
-                self.find_mutuals(yield_tags1, yield_tags2, eval_type, construction)
+                self.find_mutuals(yield_tags1, yield_tags2, eval_types, construction)
+        return OrderedDict((eval_type, self._results(p1, p2, maps, eval_type)) for eval_type in eval_types)
+
+    def get_scores(self, p1, p2, eval_type, r=None):
+        """
+        prints the relevant statistics and f-scores. eval_type can be 'unlabeled', 'labeled' or 'weak_labeled'.
+        calculates a set of all the yields such that both passages have a unit with that yield.
+        :param p1: passage to compare
+        :param p2: reference passage object
+        :param eval_type: evaluation type to use, out of EVAL_TYPES
+        1. UNLABELED: it doesn't matter what labels are there.
+        2. LABELED: also requires tag match (if there are multiple units with the same yield, requires one match)
+        3. WEAK_LABELED: also requires weak tag match (if there are multiple units with the same yield,
+                         requires one match)
+        :param r: reference passage for fine-grained evaluation
+        :returns EvaluatorResults object if self.fscore is True, otherwise None
+        """
+        return self.get_all_scores(p1, p2, [eval_type], r=r)[eval_type]
 
+    def _results(self, p1, p2, maps, eval_type):
         if self.verbose:
             print("Evaluation type: (" + eval_type + ")")
 
-        only = [{c: {y: tags for y, tags in d.items() if y not in self.mutual[c]} for c, d in m.items()} for m in maps]
+        mutual = self.mutual_by_type.get(eval_type, {})
+        only = [{c: {y: tags for y, tags in d.items() if y not in mutual.get(c, ())} for c, d in m.items()}
+                for m in maps]
         if self.verbose and self.units and p1 is not None:
             print("==> Mutual Units:")
-            print_tags_and_text(p1, self.mutual[PRIMARY])
+            print_tags_and_text(p1, mutual[PRIMARY])
             print("==> Only in guessed:")
             print_tags_and_text(p1, only[0][PRIMARY])
             print("==> Only in reference:")
             print_tags_and_text(p2, only[1][PRIMARY])
 
         error_counters = self.error_counters.get(eval_type, {})
-        res = EvaluatorResults((c, SummaryStatistics(len(self.mutual[c]),
+        res = EvaluatorResults((c, SummaryStatistics(len(mutual[c]),
                                                      len(only[0].get(c, ())),
                                                      len(only[1].get(c, ())),
                                                      error_counters.get(c)))
-                               for c in self.mutual)
+                               for c in mutual)
         if self.verbose:
             if self.fscore:
                 res.print()
@@ -185,14 +255,27 @@ class Scores:
         :param scores: iterable of Scores
         :return: new Scores with aggregated scores
         """
-        scores = list(scores)
-        evaluators = [s.evaluators for s in scores]
-        names = list(set(s.name for s in scores))
-        formats = list(set(s.format for s in scores))
-        return Scores(((t, EvaluatorResults.aggregate(filter(None, (e.get(t) for e in evaluators))))
-                       for t in EVAL_TYPES),
-                      name=names[0] if len(names) == 1 else None,
-                      evaluation_format=formats[0] if len(formats) == 1 else None)
+        accumulator = ScoresAccumulator()
+        for s in scores:
+            accumulator.add(s)
+        return accumulator.scores()
+
+    def counts(self):
+        """
+        Compact representation of the scores, made of tuples, strings and ints only, to send to other processes
+        :return: tuple that Scores.from_counts converts back to an equal Scores object
+        """
+        return self.name, self.format, tuple((t, e.counts()) for t, e in self.evaluators.items())
+
+    @staticmethod
+    def from_counts(counts):
+        """
+        :param counts: tuple returned by Scores.counts
+        :return: new Scores
+        """
+        name, evaluation_format, evaluators = counts
+        return Scores(((t, EvaluatorResults.from_counts(c)) for t, c in evaluators),
+                      name=name, evaluation_format=evaluation_format)
 
     def print(self, eval_type=None, **kwargs):
         for eval_type in EVAL_TYPES if eval_type is None else [eval_type]:
@@ -263,13 +346,28 @@ class EvaluatorResults:
         :param results: iterable of EvaluatorResults
         :return: new EvaluatorResults with aggregates scores
         """
-        collected = OrderedDict()
-        default = OrderedDict()
+        accumulator = ScoresAccumulator()
         for evaluator_results in results:
-            for c, r in evaluator_results.results.items():
-                collected.setdefault(c, []).append(r)
-            default.update(evaluator_results.default)
-        return EvaluatorResults(((c, SummaryStatistics.aggregate(r)) for c, r in collected.items()), default=default)
+            accumulator.add_results(None, evaluator_results)
+        return accumulator.results(None)
+
+    def counts(self):
+        """
+        :return: tuple of the names of the default constructions, and of the counts for each construction, see
+                 SummaryStatistics.counts
+        """
+        return tuple(map(str, self.default.values())), tuple((str(c), s.counts()) for c, s in self.results.items())
+
+    @classmethod
+    def from_counts(cls, counts):
+        """
+        :param counts: tuple returned by EvaluatorResults.counts
+        :return: new EvaluatorResults
+        """
+        default, results = counts
+        constructions = {name: get_construction(name) for name in default + tuple(c for c, _ in results)}
+        return EvaluatorResults(((constructions[c], SummaryStatistics.from_counts(r)) for c, r in results),
+                                default=OrderedDict((c, constructions[c]) for c in default))
 
     def aggregate_default(self):
         """
@@ -308,20 +406,148 @@ class SummaryStatistics:
         :param stats: iterable of SummaryStatistics
         :return: new SummaryStatistics with aggregated scores
         """
-        return SummaryStatistics(*map(sum, [map(attrgetter(attr), stats)
-                                            for attr in ("num_matches", "num_only_guessed", "num_only_ref")]),
-                                 Counter({k: sum((s.errors or {}).get(k, 0) for s in stats)
-                                          for k in set.union(*[set(s.errors or ()) for s in stats])}))
+        num_matches = num_only_guessed = num_only_ref = 0
+        errors = Counter()
+        for s in stats:  # Keep the order of first occurrence, so that errors with equal counts are printed in order
+            num_matches += s.num_matches
+            num_only_guessed += s.num_only_guessed
+            num_only_ref += s.num_only_ref
+            errors.update(s.errors or ())
+        return SummaryStatistics(num_matches, num_only_guessed, num_only_ref, errors)
+
+    def counts(self):
+        """
+        :return: tuple of number of matches, number only guessed, number only in reference, and errors (None, or tuple
+                 of ((guessed, ref), count) pairs)
+        """
+        return self.num_matches, self.num_only_guessed, self.num_only_ref, \
+            None if self.errors is None else tuple(self.errors.items())
+
+    @classmethod
+    def from_counts(cls, counts):
+        """
+        :param counts: tuple returned by SummaryStatistics.counts
+        :return: new SummaryStatistics
+        """
+        *numbers, errors = counts
+        return SummaryStatistics(*numbers, None if errors is None else Counter(dict(errors)))
 
     def __bool__(self):
         return bool(self.num_matches or self.num_only_guessed or self.num_only_ref or self.errors)
 
 
+class ScoresAccumulator:
+    """
+    Running sums of the counts in Scores objects, for each evaluation type and construction, taking memory that does
+    not grow with the number of Scores added. Adding Scores one by one gives the same result as Scores.aggregate.
+    Accumulators of parts of the data can be merged, and saved in between (see counts and from_counts).
+    """
+    def __init__(self):
+        self.names = set()
+        self.formats = set()
+        self.num_scores = 0
+        self.defaults = OrderedDict()  # eval_type -> OrderedDict: name -> default Construction
+        # eval_type -> OrderedDict: Construction -> [matches, only guessed, only ref, errors]
+        self.totals = OrderedDict()
+
+    def add(self, scores):
+        """
+        :param scores: Scores object to add the counts of
+        :return: self
+        """
+        self.names.add(scores.name)
+        self.formats.add(scores.format)
+        self.num_scores += 1
+        for eval_type, evaluator_results in scores.evaluators.items():
+            if evaluator_results:  # Scores.aggregate skips empty results, so their default constructions are ignored
+                self.add_results(eval_type, evaluator_results)
+        return self
+
+    def add_results(self, eval_type, evaluator_results):
+        """
+        :param eval_type: evaluation type to add to the totals of
+        :param evaluator_results: EvaluatorResults object to add the counts of
+        """
+        self._add(eval_type, evaluator_results.default,
+                  ((c, r.num_matches, r.num_only_guessed, r.num_only_ref, r.errors)
+                   for c, r in evaluator_results.results.items()))
+
+    def merge(self, other):
+        """
+        :param other: ScoresAccumulator to add the totals of
+        :return: self
+        """
+        self.names.update(other.names)
+        self.formats.update(other.formats)
+        self.num_scores += other.num_scores
+        for eval_type, totals in other.totals.items():
+            self._add(eval_type, other.defaults[eval_type], ((c,) + tuple(t) for c, t in totals.items()))
+        return self
+
+    def _add(self, eval_type, default, entries):
+        self.defaults.setdefault(eval_type, OrderedDict()).update(default)
+        totals = self.totals.setdefault(eval_type, OrderedDict())
+        for construction, num_matches, num_only_guessed, num_only_ref, errors in entries:
+            total = totals.get(construction)
+            if total is None:
+                total = totals[construction] = [0, 0, 0, Counter()]
+            total[0] += num_matches
+            total[1] += num_only_guessed
+            total[2] += num_only_ref
+            if errors:
+                total[3].update(errors)
+
+    def results(self, eval_type):
+        """
+        :param eval_type: evaluation type to get the totals of
+        :return: new EvaluatorResults with the totals
+        """
+        return EvaluatorResults(((c, SummaryStatistics(*t)) for c, t in self.totals.get(eval_type, {}).items()),
+                                default=self.defaults.get(eval_type))
+
+    def scores(self):
+        """
+        :return: new Scores with the totals for all evaluation types
+        """
+        return Scores(((t, self.results(t)) for t in EVAL_TYPES),
+                      name=next(iter(self.names)) if len(self.names) == 1 else None,
+                      evaluation_format=next(iter(self.formats)) if len(self.formats) == 1 else None)
+
+    def counts(self):
+        """
+        Representation of the totals made of tuples, strings and ints only, to pickle or to save as JSON
+        :return: tuple that ScoresAccumulator.from_counts converts back to an equal ScoresAccumulator
+        """
+        return (tuple(sorted(self.names)), tuple(sorted(self.formats)), self.num_scores,
+                tuple((t, tuple(map(str, self.defaults[t].values())),
+                       tuple((str(c), tuple(m) + (tuple(errors.items()),)) for c, (*m, errors) in totals.items()))
+                      for t, totals in self.totals.items()))
+
+    @classmethod
+    def from_counts(cls, counts):
+        """
+        :param counts: tuple returned by ScoresAccumulator.counts (or the same with lists instead of tuples, as loaded
+                       from JSON)
+        :return: new ScoresAccumulator
+        """
+        names, formats, num_scores, totals = counts
+        accumulator = ScoresAccumulator()
+        accumulator.names.update(names)
+        accumulator.formats.update(formats)
+        accumulator.num_scores = num_scores
+        for eval_type, default, entries in totals:
+            accumulator._add(eval_type, OrderedDict((c, get_construction(c)) for c in default),
+                             ((get_construction(c), m, g, r, Counter(OrderedDict((tuple(e), n) for e, n in errors)))
+                              for c, (m, g, r, errors) in entries))
+        return accumulator
+
+
 def evaluate(guessed, ref, converter=None, verbose=False, constructions=DEFAULT,
-             units=False, fscore=True, errors=False, normalize=True, eval_type=None, ref_yield_tags=None, **kwargs):
+             units=False, fscore=True, errors=False, normalize=True, eval_type=None, ref_yield_tags=None, copy=True,
+             **kwargs):
     """
     Compare two passages and return requested diagnostics and scores, possibly printing them too.
-    NOTE: since normalize=True by default, this method is destructive: it modifies the given passages before evaluation.
+    NOTE: with normalize=True and copy=False, this method is destructive: it modifies the given passages.
     :param guessed: Passage object to evaluate
     :param ref: reference Passage object to compare to
     :param converter: optional function to apply to passages before evaluation
@@ -330,9 +556,11 @@ def evaluate(guessed, ref, converter=None, verbose=False, constructions=DEFAULT,
     :param units: whether to evaluate common units
     :param fscore: whether to compute precision, recall and f1 score
     :param errors: whether to print the mistakes
-    :param normalize: flatten centers and move common functions to root before evaluation - modifies passages
+    :param normalize: flatten centers and move common functions to root before evaluation
     :param eval_type: specific evaluation type to limit to
     :param ref_yield_tags: reference passage for fine-grained evaluation
+    :param copy: normalize copies of the passages, leaving the given ones unchanged
+                 (otherwise, faster but modifies them)
     :return: Scores object
     """
     del kwargs
@@ -340,10 +568,12 @@ def evaluate(guessed, ref, converter=None, verbose=False, constructions=DEFAULT,
         guessed = converter(guessed)
         ref = converter(ref)
     if normalize:
+        if copy:
+            guessed, ref = copy_passages(guessed, ref)
         for passage in (guessed, ref):
             normalization.normalize(passage)  # flatten Cs inside Cs
         move_functions(guessed, ref)  # move common Fs to be under the root
 
     evaluator = Evaluator(verbose, constructions, units, fscore, errors)
-    return Scores((evaluation_type, evaluator.get_scores(guessed, ref, evaluation_type, r=ref_yield_tags))
-                  for evaluation_type in ([eval_type] if eval_type else EVAL_TYPES))
+    return Scores(evaluator.get_all_scores(guessed, ref, [eval_type] if eval_type else EVAL_TYPES,
+                                           r=ref_yield_tags).items())
@@ -1,48 +1,124 @@
 """Input/output utility functions for UCCA scripts."""
+import hashlib
+import inspect
+import io
+import pickle
+import queue
+import re
 import sys
+import tempfile
+import threading
 import time
-from collections import defaultdict
-from itertools import filterfalse, chain
+from collections import defaultdict, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
 
+import json
+import mmap
 import os
+import struct
 from contextlib import contextmanager
-from glob import glob
+from glob import iglob
 from tqdm import tqdm
 from xml.etree.ElementTree import ParseError
 
-from ucca.convert import file2passage, passage2file, from_text, to_text, split2segments
+from ucca.__version__ import VERSION
+from ucca.convert import file2passage, passage2file, from_text, to_text, split2segments, BINARY_SUFFIX, \
+    to_binary, from_binary, GZIP, NO_COMPRESSION, BinaryFormatError, write_standard, to_json
 from ucca.core import Passage
 
 DEFAULT_LANG = "en"
 DEFAULT_ATTEMPTS = 3
 DEFAULT_DELAY = 5
+ARCHIVE_SUFFIX = ".ucca.archive"
+ARCHIVE_MAGIC = b"UCCAARCH"
+ARCHIVE_VERSION = 1
+_ARCHIVE_HEADER = struct.Struct("<8sB")  # magic, version
+_ARCHIVE_TRAILER = struct.Struct("<Q")  # offset of the index
+DEFAULT_CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+                                 "ucca")
+DEFAULT_CACHE_SIZE = 1 << 30  # bytes
+CACHE_RESCAN_WRITES = 100  # writes after which the cache size is counted again, to include other processes' entries
+CACHE_EVICT_RATIO = .9  # fraction of the maximum size to evict down to once it is exceeded, to avoid evicting often
+JSONL_SUFFIX = ".jsonl"
+DEFAULT_WRITE_QUEUE_SIZE = 64
+PREFETCH_JOIN_TIMEOUT = 1  # seconds to wait for the prefetching thread to stop when the consumer stops early
+GLOB_CHARS = re.compile(r"[*?\[]")
+DIGITS = re.compile(r"(\d+)")
+
+
+PassageEntry = namedtuple("PassageEntry", ("file", "key", "number"))
+PassageEntry.__doc__ = """
+Location of one passage in the files given to LazyLoadedPassages with index=True: the whole file if key is None, the
+passage ID if the file is an archive, or the byte offset of the passage if the file is converted from text, in which
+case number is the position of the passage in the file. If key is None but number is not, the passage is the number-th
+one converted from the whole text file, as for converters that cannot be given the number of the first passage.
+"""
+
+
+def _takes_first_index(converter):
+    """
+    :return: whether the converter can be given the number of the first passage it converts (as from_text can)
+    """
+    try:
+        return "first_index" in inspect.signature(converter).parameters
+    except (TypeError, ValueError):  # No signature
+        return False
 
 
 class LazyLoadedPassages:
     """
-    Iterable interface to Passage objects that loads files on-the-go and can be iterated more than once
+    Iterable interface to Passage objects that loads files on-the-go and can be iterated more than once.
+    With workers > 1, files are read and parsed in a pool of worker processes, a few files ahead of the consumer,
+    and passages are still returned in the same order as without workers. The read-ahead is limited by files, not
+    passages: each file is loaded whole, so a file with many passages (e.g., a large text file) is held in memory
+    with all of them.
+    With index=True, the files are scanned once, without parsing, for the location of each passage in them (see
+    PassageEntry), so that len(), shuffling and shard() work on passages rather than files, and load(i) reads just the
+    i-th passage. Text files are indexed if there is a converter for them: by the blank lines between passages, if the
+    converter takes the number of the first passage (first_index, as from_text), so that each is read separately with
+    the same ID as when reading the whole file; otherwise, by converting the whole file once, and again when loading.
     """
     def __init__(self, files, sentences=False, paragraphs=False, converters=None, lang=DEFAULT_LANG,
-                 attempts=DEFAULT_ATTEMPTS, delay=DEFAULT_DELAY):
+                 attempts=DEFAULT_ATTEMPTS, delay=DEFAULT_DELAY, workers=None, cache=None, index=False, splitter=None):
+        if index and (sentences or paragraphs):
+            raise ValueError("Passages cannot be indexed when splitting to sentences or paragraphs")
         self.files = files
         self.sentences = sentences
         self.paragraphs = paragraphs
         self.split = self.sentences or self.paragraphs
+        self.splitter = splitter  # Sentence splitter name (or picklable function), see textutil.get_sentence_splitter
+        self._converters = converters  # Passed on to worker processes, where the default converters are recreated
         self.converters = defaultdict(lambda: from_text) if converters is None else converters
         self.lang = lang
         self.attempts = attempts
         self.delay = delay
+        self.workers = workers
+        self.cache = PassageCache() if cache is True else cache or None
+        self.index = index
+        self._entries = None
+        self._archives = {}
+        self._converted = None  # (file, number of the next passage, converted passages, file handle) for load_entry
         self._files_iter = None
         self._split_iter = None
         self._file_handle = None
+        self._parallel_iter = None
 
     def __iter__(self):
         self._files_iter = iter(self.files)
         self._split_iter = None
         self._file_handle = None
+        if self.index:
+            self._parallel_iter = map(self.load_entry, list(self.entries))
+        elif self.workers and self.workers > 1:
+            self._parallel_iter = self._iter_parallel()
+        else:
+            self._parallel_iter = None
         return self
 
     def __next__(self):
+        if self._parallel_iter is not None:
+            return next(self._parallel_iter)
         while True:
             passage = self._next_passage()
             if passage is not None:
@@ -58,29 +134,26 @@ class LazyLoadedPassages:
             if isinstance(file, Passage):  # Not really a file, but a Passage
                 passage = file
             else:  # A file
-                attempts = self.attempts
-                while not os.path.exists(file):
-                    with external_write_mode(file=sys.stderr):
-                        if attempts == 0:
-                            print("File not found: %s" % file, file=sys.stderr)
-                            return None
-                        print("Failed reading %s, trying %d more times..." % (file, attempts), file=sys.stderr)
-                    time.sleep(self.delay)
-                    attempts -= 1
-                try:
-                    passage = file2passage(file)  # XML or binary format
-                except (IOError, ParseError) as e:  # Failed to read as passage file
-                    base, ext = os.path.splitext(os.path.basename(file))
-                    converter = self.converters.get(ext.lstrip("."))
-                    if converter is None:
-                        raise IOError("Could not read %s file. Try adding '.txt' suffix: '%s'" % (ext, file)) from e
-                    self._file_handle = open(file, encoding="utf-8")
-                    self._split_iter = iter(converter(chain(self._file_handle, [""]), passage_id=base, lang=self.lang))
+                if not self._wait_for(file):
+                    return None
+                if is_archive(file):  # Many passages, read one by one like passages from a converter
+                    self._file_handle = PassageArchive(file)
+                    self._split_iter = iter(self._file_handle)
+                else:
+                    try:
+                        passage = file2passage(file) if self.cache is None else self.cache.load(file)
+                    except (IOError, ParseError) as e:  # Failed to read as passage file
+                        base, ext = os.path.splitext(os.path.basename(file))
+                        converter = self.converters.get(ext.lstrip("."))
+                        if converter is None:
+                            raise IOError("Could not read %s file. Try adding '.txt' suffix: '%s'" % (ext, file)) from e
+                        self._file_handle, self._split_iter = self._convert(file, converter)
             if self.split:
                 if self._split_iter is None:
                     self._split_iter = (passage,)
                 self._split_iter = iter(s for p in self._split_iter for s in
-                                        split2segments(p, is_sentences=self.sentences, lang=self.lang))
+                                        split2segments(p, is_sentences=self.sentences, lang=self.lang,
+                                                       splitter=self.splitter))
         if self._split_iter is not None:  # Either set before or initialized now
             try:
                 passage = next(self._split_iter)
@@ -92,49 +165,590 @@ class LazyLoadedPassages:
                 return None
         return passage
 
+    def _wait_for(self, file):
+        """
+        :return: whether the file exists, possibly after waiting for it to appear
+        """
+        attempts = self.attempts
+        while not os.path.exists(file):
+            with external_write_mode(file=sys.stderr):
+                if attempts == 0:
+                    print("File not found: %s" % file, file=sys.stderr)
+                    return False
+                print("Failed reading %s, trying %d more times..." % (file, attempts), file=sys.stderr)
+            time.sleep(self.delay)
+            attempts -= 1
+        return True
+
+    def _convert(self, file, converter):
+        """
+        :return: open file handle, and iterator of the passages converted from the text file
+        """
+        f = open(file, encoding="utf-8")
+        return f, iter(converter(chain(f, [""]), passage_id=os.path.splitext(os.path.basename(file))[0],
+                                 lang=self.lang))
+
+    def _text_converter(self, file):
+        """
+        :return: converter to read file with, if it is a text file with one, or None if it is a passage file
+        """
+        if file.endswith((".xml", ".pickle", BINARY_SUFFIX)):
+            return None
+        return self.converters.get(os.path.splitext(file)[1].lstrip("."))
+
+    @property
+    def entries(self):
+        """
+        :return: list of the location of each passage in the files (PassageEntry objects, or Passage objects given
+                 instead of files), read once on first access if this was created with index=True, and None otherwise
+        """
+        if self._entries is None and self.index:
+            self._entries = [e for file in self.files for e in self._index_file(file)]
+        return self._entries
+
+    def _index_file(self, file):
+        if isinstance(file, Passage):
+            yield file
+        elif self._wait_for(file):
+            if is_archive(file):
+                with PassageArchive(file) as archive:
+                    for passage_id in archive.ids():
+                        yield PassageEntry(file, passage_id, None)
+            elif self._text_converter(file) is None:
+                yield PassageEntry(file, None, None)
+            elif not _takes_first_index(self._text_converter(file)):  # IDs are only known converting the whole file
+                f, passages = self._convert(file, self._text_converter(file))
+                with f:
+                    for number, _ in enumerate(passages):
+                        yield PassageEntry(file, None, number)
+            else:  # Passages start at the first line that is not blank, after a blank line
+                offset = 0
+                blank = True
+                number = 0
+                with open(file, "rb") as f:
+                    for line in f:
+                        if line.strip():
+                            if blank:
+                                yield PassageEntry(file, offset, number)
+                                number += 1
+                            blank = False
+                        else:
+                            blank = True
+                        offset += len(line)
+
+    def load(self, i):
+        """
+        :param i: position of the passage in the index
+        :return: Passage object
+        """
+        return self.load_entry(self.entries[i])
+
+    def load_entry(self, entry):
+        """
+        :param entry: PassageEntry from the index (or a Passage object)
+        :return: Passage object
+        """
+        if isinstance(entry, Passage):
+            return entry
+        if entry.key is None and entry.number is not None:
+            return self._load_converted(entry)
+        if entry.key is None:
+            return file2passage(entry.file) if self.cache is None else self.cache.load(entry.file)
+        if entry.number is None:
+            archive = self._archives.get(entry.file)
+            if archive is None:
+                archive = self._archives[entry.file] = PassageArchive(entry.file)
+            return archive[entry.key]
+        lines = []
+        with open(entry.file, "rb") as f:
+            f.seek(entry.key)
+            for line in f:
+                if not line.strip():
+                    break
+                lines.append(line.decode("utf-8"))
+        return next(iter(self._text_converter(entry.file)(
+            lines + [""], passage_id=os.path.splitext(os.path.basename(entry.file))[0], lang=self.lang,
+            first_index=entry.number)))
+
+    def _load_converted(self, entry):
+        """
+        Convert the whole text file up to the passage of the entry, continuing the previous conversion if it was of
+        the same file and has not passed this passage yet, so that loading the passages of a file in order is linear
+        """
+        if self._converted is None or self._converted[0] != entry.file or self._converted[1] > entry.number:
+            self._close_converted()
+            f, passages = self._convert(entry.file, self._text_converter(entry.file))
+            self._converted = [entry.file, 0, passages, f]
+        _, number, passages, _ = self._converted
+        passage = next(islice(passages, entry.number - number, None), None)
+        if passage is None:
+            raise IOError("Passage %d not found, the file may have changed since indexed: '%s'" % (
+                entry.number, entry.file))
+        self._converted[1] = entry.number + 1
+        return passage
+
+    def _close_converted(self):
+        if self._converted is not None:
+            self._converted[3].close()
+            self._converted = None
+
+    def shard(self, i, n):
+        """
+        :param i: index of the shard to return, out of range(n)
+        :param n: number of shards
+        :return: LazyLoadedPassages with every n-th passage, starting from the i-th (or every n-th file, without index)
+        """
+        shard = LazyLoadedPassages(self.files[i::n], sentences=self.sentences, paragraphs=self.paragraphs,
+                                   converters=self._converters, lang=self.lang, attempts=self.attempts,
+                                   delay=self.delay, workers=self.workers, cache=self.cache, index=self.index,
+                                   splitter=self.splitter)
+        if self.index:
+            shard.files = self.files
+            shard._entries = self.entries[i::n]
+        return shard
+
+    def _iter_parallel(self):
+        """
+        Load files in worker processes, keeping the order of the files, and at most 2 * workers files loaded or
+        being loaded at a time. The limit is per file, whatever the number of passages in it: each file is loaded
+        fully, including all the passages it contains or is split to, so memory use grows with the largest files.
+        Passage objects and archives are not worth sending to another process, so they are read in this process.
+        """
+        kwargs = dict(sentences=self.sentences, paragraphs=self.paragraphs, converters=self._converters,
+                      lang=self.lang, attempts=self.attempts, delay=self.delay, cache=self.cache, splitter=self.splitter)
+        executor = ProcessPoolExecutor(max_workers=self.workers)
+        pending = deque()
+        files = iter(self.files)
+        try:
+            while True:
+                for file in files:
+                    pending.append(file if isinstance(file, Passage) or is_archive(file) else
+                                   executor.submit(_load_passages, [file], **kwargs))
+                    if len(pending) >= 2 * self.workers:
+                        break
+                if not pending:
+                    return
+                item = pending.popleft()
+                if isinstance(item, Passage) or is_archive(item):
+                    yield from LazyLoadedPassages([item], **kwargs)
+                else:
+                    yield from item.result()
+        finally:  # Also when the consumer stops early: do not load files that will not be used, nor wait for them
+            try:
+                executor.shutdown(wait=False, cancel_futures=True)
+            except TypeError:  # Python < 3.9: cancel the files not being loaded yet one by one
+                for future in pending:
+                    if not isinstance(future, Passage) and not is_archive(future):
+                        future.cancel()
+                executor.shutdown(wait=False)
+
+    def close(self):
+        """ Release any open file and stop worker processes, if the iteration was stopped before the end """
+        if self._file_handle is not None:
+            self._file_handle.close()
+            self._file_handle = None
+        close = getattr(self._parallel_iter, "close", None)
+        if close is not None:
+            close()
+        self._parallel_iter = None
+        self._split_iter = None
+        for archive in self._archives.values():
+            archive.close()
+        self._archives.clear()
+        self._close_converted()
+
     # The following three methods are implemented to support shuffle;
-    # note files are shuffled but there is no shuffling within files, as it would not be efficient.
+    # note files are shuffled but there is no shuffling within files, as it would not be efficient,
+    # unless there is an index, and then these access PassageEntry objects, so passages are shuffled.
     # Note also the inconsistency because these access the files while __iter__ accesses individual passages.
     def __len__(self):
-        return len(self.files)
+        return len(self.files if self.entries is None else self.entries)
 
     def __getitem__(self, i):
-        return self.files[i]
+        return (self.files if self.entries is None else self.entries)[i]
 
     def __setitem__(self, i, value):
-        self.files[i] = value
+        (self.files if self.entries is None else self.entries)[i] = value
 
     def __bool__(self):
-        return bool(self.files)
+        return bool(self.files if self.entries is None else self.entries)
+
+
+def _load_passages(files, **kwargs):
+    """ Run in worker processes by LazyLoadedPassages, so the passages are returned at once to be pickled back """
+    return list(LazyLoadedPassages(files, **kwargs))
+
+
+class PassageArchive:
+    """
+    Single-file corpus of passages in the compact binary format (see convert.to_binary), created by write_archive.
+    The file is memory-mapped and has an index from passage ID to the offset of its data, so that getting a passage by
+    ID decodes only that passage, and iteration decodes the passages sequentially in the order they were written.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, "rb") as f:
+            try:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as e:  # Empty files cannot be memory-mapped
+                raise IOError("Empty passage archive: '%s'" % filename) from e
+        try:
+            magic, version = _ARCHIVE_HEADER.unpack_from(self._mmap)
+            if magic != ARCHIVE_MAGIC:
+                raise IOError("Not a passage archive: '%s'" % filename)
+            if version > ARCHIVE_VERSION:
+                raise IOError("Unsupported passage archive version %d (latest supported: %d): '%s'" % (
+                    version, ARCHIVE_VERSION, filename))
+            index_start, = _ARCHIVE_TRAILER.unpack_from(self._mmap, len(self._mmap) - _ARCHIVE_TRAILER.size)
+            index = json.loads(self._mmap[index_start:len(self._mmap) - _ARCHIVE_TRAILER.size].decode("utf-8"))
+        except (struct.error, ValueError) as e:
+            self.close()
+            raise IOError("Corrupt passage archive: '%s'" % filename) from e
+        except IOError:
+            self.close()
+            raise
+        self._ids = [passage_id for passage_id, _, _ in index]
+        self._entries = [(offset, length) for _, offset, length in index]
+        self._index = dict(zip(self._ids, self._entries))
+        if len(self._index) < len(self._ids):
+            self.close()
+            raise IOError("Duplicate passage IDs in passage archive: '%s'" % filename)
+
+    def __getitem__(self, passage_id):
+        """
+        :param passage_id: ID of passage to load
+        :return: Passage object
+        :raise KeyError: if there is no passage with this ID in the archive
+        """
+        offset, length = self._index[passage_id]
+        return from_binary(self._mmap[offset:offset + length])
+
+    def __iter__(self):
+        for offset, length in self._entries:
+            yield from_binary(self._mmap[offset:offset + length])
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, passage_id):
+        return passage_id in self._index
+
+    def __bool__(self):
+        return bool(self._entries)
+
+    def ids(self):
+        """
+        :return: IDs of all passages in the archive in order, without loading them
+        """
+        return list(self._ids)
+
+    def close(self):
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def is_archive(filename):
+    return str(filename).endswith(ARCHIVE_SUFFIX)
+
+
+def write_archive(passages, filename, compression=GZIP):
+    """
+    Write passages to a single-file archive, which can be read with PassageArchive or get_passages.
+    :param passages: iterable of Passage objects to write (consumed one by one), with distinct IDs
+    :param filename: file name to write to, should end with ARCHIVE_SUFFIX to be recognized by get_passages
+    :param compression: compression for each passage, out of convert.COMPRESSIONS
+    :return: number of passages written
+    :raise ValueError: if two passages have the same ID
+    """
+    return _write_archive(((p.ID, to_binary(p, compression=compression)) for p in passages), filename)
+
+
+def _write_archive(entries, filename):
+    """
+    :param entries: iterable of (passage ID, passage in binary format)
+    :param filename: archive file name to write to
+    :return: number of passages written
+    """
+    index = []
+    ids = set()
+    # Written to a temporary file and renamed, so that a failure (or interrupt) never leaves a partial archive
+    fd, temp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(filename)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION))
+            for passage_id, data in entries:
+                if passage_id in ids:
+                    raise ValueError("Duplicate passage ID in passage archive: '%s'" % passage_id)
+                ids.add(passage_id)
+                index.append((passage_id, f.tell(), len(data)))
+                f.write(data)
+            index_start = f.tell()
+            f.write(json.dumps(index).encode("utf-8"))
+            f.write(_ARCHIVE_TRAILER.pack(index_start))
+        os.replace(temp, filename)
+    except BaseException:
+        try:
+            os.remove(temp)
+        except IOError:
+            pass
+        raise
+    return len(index)
+
+
+class PassageCache:
+    """
+    On-disk cache of parsed passage files, in the compact binary format (see convert.to_binary), which is much faster
+    to load than XML. Each file is cached under a key of its absolute path, modification time and size, and the library
+    version, so changed files are parsed again. When the cache grows over its maximum size, the least recently used
+    entries are removed. Entries are written to a temporary file and renamed, so several processes can use the same
+    cache directory at once. The total size is kept as a running count, and the directory is only scanned again when
+    the count exceeds the maximum size or every CACHE_RESCAN_WRITES writes, to account for other processes.
+    """
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_size=DEFAULT_CACHE_SIZE):
+        """
+        :param cache_dir: directory to keep the cached passages in, created if it does not exist
+        :param max_size: maximum total size of the cached passages, in bytes
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self._size = None  # Total size of the entries, unknown until the directory is scanned
+        self._writes = 0  # Entries written since the directory was last scanned
+
+    def path(self, filename):
+        """
+        :param filename: passage file name
+        :return: path of the cache entry for the current version of the file
+        """
+        stat = os.stat(filename)
+        key = json.dumps([os.path.abspath(filename), stat.st_mtime_ns, stat.st_size, VERSION])
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + BINARY_SUFFIX)
+
+    def load(self, filename):
+        """
+        Load a passage file from the cache, or parse it with file2passage and add it to the cache
+        :param filename: passage file name
+        :return: Passage object
+        """
+        if str(filename).endswith(BINARY_SUFFIX):  # Already fast to load
+            return file2passage(filename)
+        path = self.path(filename)
+        try:
+            with open(path, "rb") as f:
+                passage = from_binary(f.read())
+        except (IOError, BinaryFormatError):  # Not cached, removed concurrently, or partially written by an old version
+            pass
+        else:
+            try:
+                os.utime(path)  # Mark as recently used
+            except IOError:  # Read-only cache: still a hit
+                pass
+            return passage
+        passage = file2passage(filename)
+        self._store(path, to_binary(passage))
+        return passage
+
+    def _store(self, path, data):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, temp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp, path)  # Atomic, so other processes never see a partial entry
+        except IOError:
+            try:
+                os.remove(temp)
+            except IOError:
+                pass
+            return
+        if self._size is None or self._writes >= CACHE_RESCAN_WRITES:
+            self.evict(int(self.max_size * CACHE_EVICT_RATIO))
+        else:
+            self._size += len(data)  # Over-counted if the entry replaced an existing one, until the next scan
+            self._writes += 1
+            if self._size > self.max_size:
+                self.evict(int(self.max_size * CACHE_EVICT_RATIO))
+
+    def evict(self, size=None):
+        """
+        If the total size of the cache is over max_size, remove the least recently used entries until it is at most
+        `size'. Scans the cache directory for the entries, and updates the running count of their total size.
+        :param size: total size to evict down to, by default max_size
+        """
+        self._size = None
+        self._writes = 0
+        entries = []
+        try:
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if entry.name.endswith(BINARY_SUFFIX):
+                        try:
+                            stat = entry.stat()
+                        except IOError:  # Removed by another process
+                            continue
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except IOError:
+            return
+        total = sum(entry_size for _, entry_size, _ in entries)
+        if total > self.max_size:
+            limit = self.max_size if size is None else min(size, self.max_size)
+            for _, entry_size, path in sorted(entries):
+                if total <= limit:
+                    break
+                try:
+                    os.remove(path)
+                except IOError:  # Removed by another process
+                    pass
+                total -= entry_size
+        self._size = total
+
+    def clear(self):
+        """
+        Remove all entries from the cache
+        """
+        max_size, self.max_size = self.max_size, -1
+        try:
+            self.evict()
+        finally:
+            self.max_size = max_size
 
 
 def get_passages_with_progress_bar(filename_patterns, desc=None, **kwargs):
+    """
+    :param filename_patterns: glob patterns of files and/or directories to read, see get_passages
+    :param desc: description to show in the progress bar
+    :param kwargs: passed to read_files_and_dirs, e.g. workers=4 to load files in parallel
+    :return: generator of passages, updating a progress bar with each passage
+    """
     t = tqdm(get_passages(filename_patterns, **kwargs), desc=desc, unit=" passages")
     for passage in t:
         t.set_postfix(ID=passage.ID)
         yield passage
 
 
-def get_passages(filename_patterns, **kwargs):
+def get_passages(filename_patterns, prefetch=None, splitter=None, **kwargs):
+    """
+    :param filename_patterns: glob pattern or iterable of glob patterns of files and/or directories to read
+    :param prefetch: number of passages to read ahead on a background thread while the consumer works on the current
+                     one; if None or 0, each passage is read only when it is requested
+    :param splitter: sentence splitter to use with sentences=True, see read_files_and_dirs
+    :param kwargs: passed to read_files_and_dirs
+    :return: generator of passages
+    """
+    # All matches are read together so that with workers > 1, files matched by different patterns are loaded in parallel
+    passages = read_files_and_dirs(_expand_patterns(filename_patterns), stream=True, splitter=splitter, **kwargs)
+    yield from prefetched(passages, prefetch) if prefetch else passages
+
+
+def _expand_patterns(filename_patterns):
+    """ Glob each pattern when it is reached, in natural order, without looking for file names that are not patterns """
     for pattern in [filename_patterns] if isinstance(filename_patterns, str) else filename_patterns:
-        for filenames in glob(pattern) or [pattern]:
-            yield from read_files_and_dirs(filenames, **kwargs)
+        if GLOB_CHARS.search(pattern):  # If nothing matches, the pattern is kept so that it is reported when read
+            yield from sorted(iglob(pattern), key=natural_sort_key) or [pattern]
+        else:
+            yield pattern
+
+
+_END = object()
+
+
+def prefetched(iterable, size):
+    """
+    Iterate on a background thread, which stays up to `size' items ahead of the consumer.
+    Exceptions raised by the iteration are raised to the consumer after all items before them.
+    Closing the returned generator (or deleting it) stops the background thread and closes the iterator, if possible.
+    If the thread is busy reading an item (e.g. waiting for a missing file to appear), the consumer does not wait for
+    more than PREFETCH_JOIN_TIMEOUT seconds: the (daemon) thread then stops by itself once it has read the item.
+    :param iterable: iterable to read items from
+    :param size: maximum number of items read but not yet consumed
+    :return: generator of the same items as `iterable', in the same order
+    """
+    items = queue.Queue(maxsize=size)
+    stop = threading.Event()
+
+    def _put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _produce():
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if not _put((item, None)):
+                    return
+            _put((_END, None))
+        except Exception as e:  # Passed to the consumer, to be raised in its thread
+            _put((_END, e))
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    thread = threading.Thread(target=_produce, name="prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = items.get()
+            if error is not None:
+                raise error
+            if item is _END:
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join(timeout=PREFETCH_JOIN_TIMEOUT)
+
+
+def natural_sort_key(name):
+    """
+    :param name: file name
+    :return: key to sort file names by, with numbers in them compared by value, so that "2.xml" comes before "10.xml"
+    """
+    return [int(part) if part.isdigit() else part for part in DIGITS.split(name)]
 
 
-def gen_files(files_and_dirs):
+def gen_files(files_and_dirs, recursive=False, extensions=None):
     """
+    Directories are scanned with os.scandir, which gets the type of each entry without a separate stat call.
+    Files are generated while scanning, one directory after another, each in natural order (see natural_sort_key).
     :param files_and_dirs: iterable of files and/or directories to look in
-    :return: all files given, plus any files directly under any directory given
+    :param recursive: whether to look in subdirectories of the directories given too
+    :param extensions: if given, only files in the directories with one of these suffixes (e.g. ".xml") are included;
+                       files given explicitly are always included
+    :return: all files given, plus any files directly under any directory given (or anywhere under it, if recursive)
     """
+    extensions = None if extensions is None else tuple([extensions] if isinstance(extensions, str) else extensions)
     for file_or_dir in [files_and_dirs] if isinstance(files_and_dirs, str) else files_and_dirs:
-        if os.path.isdir(file_or_dir):
-            yield from filterfalse(os.path.isdir, (os.path.join(file_or_dir, f) for f in os.listdir(file_or_dir)))
-        else:
+        if isinstance(file_or_dir, Passage) or not os.path.isdir(file_or_dir):
             yield file_or_dir
+            continue
+        directories = [file_or_dir]
+        while directories:
+            directory = directories.pop()
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda e: natural_sort_key(e.name))
+            subdirectories = []
+            for entry in entries:
+                if entry.is_dir():
+                    if recursive:
+                        subdirectories.append(entry.path)
+                elif extensions is None or entry.name.endswith(extensions):
+                    yield entry.path
+            directories += reversed(subdirectories)  # So that they are popped in order
 
 
 def read_files_and_dirs(files_and_dirs, sentences=False, paragraphs=False, converters=None, lang=DEFAULT_LANG,
-                        attempts=DEFAULT_ATTEMPTS, delay=DEFAULT_DELAY):
+                        attempts=DEFAULT_ATTEMPTS, delay=DEFAULT_DELAY, workers=None, cache=None, index=False,
+                        recursive=False, extensions=None, stream=False, splitter=None):
     """
     :param files_and_dirs: iterable of files and/or directories to look in
     :param sentences: whether to split to sentences
@@ -143,10 +757,23 @@ def read_files_and_dirs(files_and_dirs, sentences=False, paragraphs=False, conve
     :param lang: language to use for tokenization model
     :param attempts: number of times to try reading a file before giving up
     :param delay: number of seconds to wait before subsequent attempts to read a file
+    :param workers: number of processes to read and parse files in parallel (converters must then be picklable,
+                    i.e., module-level functions), up to 2 * workers files ahead (whole files, however many passages
+                    each has); if None or 1, files are read one after another in this process
+    :param cache: PassageCache to keep parsed passage files in, or True to use one in the default directory
+    :param index: whether to index the passages in the files, for passage-level len(), shuffling and sharding
+    :param recursive: whether to look in subdirectories too, see gen_files
+    :param extensions: file name suffixes to include from directories, see gen_files
+    :param stream: start loading passages while the directories are still being scanned, rather than listing all
+                   files first; the result can then be iterated only once, and does not support len() or shuffling
+    :param splitter: sentence splitter to use with sentences=True, see textutil.get_sentence_splitter (must be a name
+                     or a picklable function if workers > 1)
     :return: lazy-loaded passages from all files given, plus any files directly under any directory given
     """
-    return LazyLoadedPassages(list(gen_files(files_and_dirs)), sentences=sentences, paragraphs=paragraphs,
-                              converters=converters, lang=lang, attempts=attempts, delay=delay)
+    files = gen_files(files_and_dirs, recursive=recursive, extensions=extensions)
+    return LazyLoadedPassages(files if stream else list(files), sentences=sentences, paragraphs=paragraphs,
+                              converters=converters, lang=lang, attempts=attempts, delay=delay, workers=workers,
+                              cache=cache, index=index, splitter=splitter)
 
 
 def write_passage(passage, output_format=None, binary=False, outdir=".", prefix="", converter=None, verbose=True,
@@ -154,7 +781,8 @@ def write_passage(passage, output_format=None, binary=False, outdir=".", prefix=
     """
     Write a given UCCA passage in any format.
     :param passage: Passage object to write
-    :param output_format: filename suffix (if given "ucca", suffix will be ".pickle" or ".xml" depending on `binary')
+    :param output_format: filename suffix (if given "ucca", suffix will be ".pickle" or ".xml" depending on `binary';
+                          if given "bin", the compact binary format is written with ".ucca.bin" suffix)
     :param binary: save in pickle format with ".pickle" suffix
     :param outdir: output directory, should exist already
     :param prefix: string to prepend to output filename
@@ -166,12 +794,11 @@ def write_passage(passage, output_format=None, binary=False, outdir=".", prefix=
     :return: path of created output file
     """
     os.makedirs(outdir, exist_ok=True)
-    suffix = output_format if output_format and output_format != "ucca" else ("pickle" if binary else "xml")
-    outfile = os.path.join(outdir, prefix + (basename or passage.ID) + "." + suffix)
+    outfile = os.path.join(outdir, prefix + (basename or passage.ID) + "." + _output_suffix(output_format, binary))
     if verbose:
         with external_write_mode():
             print("%s '%s'..." % ("Appending to" if append else "Writing passage", outfile))
-    if output_format is None or output_format in ("ucca", "pickle", "xml"):
+    if output_format is None or output_format in ("ucca", "pickle", "xml", "bin"):
         passage2file(passage, outfile, binary=binary)
     else:
         with open(outfile, "a" if append else "w", encoding="utf-8") as f:
@@ -179,6 +806,171 @@ def write_passage(passage, output_format=None, binary=False, outdir=".", prefix=
     return outfile
 
 
+def _output_suffix(output_format, binary):
+    suffix = output_format if output_format and output_format != "ucca" else ("pickle" if binary else "xml")
+    return BINARY_SUFFIX.lstrip(".") if suffix == "bin" else suffix
+
+
+def _serialize(passage, suffix, converter=None, compression=NO_COMPRESSION):
+    """
+    Run by PassageWriter, possibly in worker processes
+    :return: the contents of a passage file with the given suffix, as bytes for binary formats or str for text formats
+    """
+    if suffix == "xml":
+        f = io.StringIO()
+        write_standard(passage, f)
+        return f.getvalue()
+    if suffix == "pickle":
+        return pickle.dumps(passage)
+    if suffix == BINARY_SUFFIX.lstrip("."):
+        return to_binary(passage, compression=compression)
+    if suffix == JSONL_SUFFIX.lstrip("."):
+        return json.dumps(to_json(passage, return_dict=True)) + "\n"
+    return "".join(map("{}\n".format, (converter or to_text)(passage)))
+
+
+class PassageWriter:
+    """
+    Writes many passages in the background: passages are serialized by a pool of worker processes (or by the writer
+    thread, if there are no workers), and written in the order they were given by a writer thread, which takes them
+    from a bounded queue, so that writing blocks only when the queue is full.
+    Passages are written either each to its own file, like write_passage, or all to one stream: an archive (see
+    write_archive) or a JSON lines file, with one passage in UCCA-App JSON format (see convert.to_json) per line.
+    Errors do not stop writing the other passages, and are raised by close() (or at the end of the `with' block).
+    Passages must not be modified after they are given to write().
+    """
+    def __init__(self, outdir=".", output_format=None, binary=False, prefix="", converter=None, verbose=False,
+                 output=None, compression=NO_COMPRESSION, workers=None, queue_size=DEFAULT_WRITE_QUEUE_SIZE,
+                 append=False):
+        """
+        :param outdir: output directory, created if it does not exist
+        :param output_format: filename suffix for each passage file, as in write_passage
+        :param binary: save in pickle format with ".pickle" suffix, as in write_passage
+        :param prefix: string to prepend to each output filename
+        :param converter: function to apply to each passage to get output lines (if output_format is not
+                          "ucca"/"pickle"/"xml"/"bin"), must be picklable (a module-level function) if workers > 1
+        :param verbose: print a "Writing passage" message for each passage
+        :param output: file name to write all passages to, instead of a file per passage; should end with
+                       ARCHIVE_SUFFIX for an archive or JSONL_SUFFIX for JSON lines
+        :param compression: compression for the compact binary format, out of convert.COMPRESSIONS
+        :param workers: number of processes to serialize passages in; if None or 1, the writer thread serializes them
+        :param queue_size: maximum number of passages given to write() but not yet written
+        :param append: if using converter (or writing JSON lines to output), append to the output files rather than
+                       creating new files, as in write_passage
+        """
+        self.outdir = outdir
+        self.prefix = prefix
+        self.converter = converter
+        self.verbose = verbose
+        self.output = output
+        self.compression = compression
+        self.append = append
+        if output is None:
+            self.suffix = _output_suffix(output_format, binary)
+        elif is_archive(output):
+            self.suffix = BINARY_SUFFIX.lstrip(".")
+        elif str(output).endswith(JSONL_SUFFIX):
+            self.suffix = JSONL_SUFFIX.lstrip(".")
+        else:
+            raise ValueError("Output file name must end with '%s' or '%s': '%s'" % (
+                ARCHIVE_SUFFIX, JSONL_SUFFIX, output))
+        if append and output is not None and is_archive(output):
+            raise ValueError("Cannot append to an archive: '%s'" % output)
+        # Like write_passage, only converter output is appended to, as passage files each hold one passage
+        self._mode = "a" if append and (output is not None or output_format is not None and
+                                        output_format not in ("ucca", "pickle", "xml", "bin")) else "w"
+        os.makedirs(outdir if output is None else os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        self.errors = []
+        self._executor = ProcessPoolExecutor(max_workers=workers) if workers and workers > 1 else None
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._write_all, name="writer", daemon=True)
+        self._thread.start()
+        self._closed = False
+
+    def write(self, passage, basename=None):
+        """
+        Queue a passage for writing, blocking only if the queue is full
+        :param passage: Passage object to write
+        :param basename: use this instead of `passage.ID' for the output filename (when writing a file per passage)
+        :return: path of the output file that will be written
+        """
+        if self._closed:
+            raise ValueError("Writing to a closed PassageWriter")
+        outfile = self.output
+        if outfile is None:
+            outfile = os.path.join(self.outdir, self.prefix + (basename or passage.ID) + "." + self.suffix)
+        args = (passage, self.suffix, self.converter, self.compression)
+        self._queue.put((passage.ID, outfile, args if self._executor is None else self._executor.submit(
+            _serialize, *args)))
+        return outfile
+
+    def _serialized(self):
+        """ Take serialized passages from the queue in order, until close() is called, recording any errors """
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            passage_id, outfile, task = item
+            try:
+                data = _serialize(*task) if self._executor is None else task.result()
+            except Exception as e:
+                self.errors.append((passage_id, e))
+                continue
+            if self.verbose:
+                with external_write_mode():
+                    print("Writing passage '%s'..." % (outfile if self.output is None else passage_id))
+            yield passage_id, outfile, data
+
+    def _write_all(self):
+        serialized = self._serialized()
+        try:
+            if self.output is None:
+                for passage_id, outfile, data in serialized:
+                    try:
+                        with open(outfile, "wb") if isinstance(data, bytes) else \
+                                open(outfile, self._mode, encoding="utf-8") as f:
+                            f.write(data)
+                    except IOError as e:
+                        self.errors.append((passage_id, e))
+            elif self.suffix == JSONL_SUFFIX.lstrip("."):
+                with open(self.output, self._mode, encoding="utf-8") as f:
+                    for _, _, data in serialized:
+                        f.write(data)
+            else:
+                _write_archive(((passage_id, data) for passage_id, _, data in serialized), self.output)
+        except Exception as e:  # Failed writing the output stream, so nothing more can be written
+            self.errors.append((None, e))
+            for _ in serialized:  # Keep taking from the queue so that write() does not block
+                pass
+
+    def close(self):
+        """
+        Wait for all passages to be written
+        :raise IOError: if any passage failed to be serialized or written, chained from the first error
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        if self._executor is not None:
+            self._executor.shutdown()
+        if self.errors:
+            passage_id, error = self.errors[0]
+            raise IOError("Failed writing %d passage(s), first error%s: %s" % (
+                len(self.errors), "" if passage_id is None else " in passage " + passage_id, error)) from error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        try:
+            self.close()
+        except IOError:
+            if exc_type is None:  # Do not hide the exception raised in the `with' block
+                raise
+
+
 @contextmanager
 def external_write_mode(*args, **kwargs):
     try:
@@ -8,6 +8,8 @@ Layer 0 has only one type of node, :class:Terminal. This is a subtype of
 
 """
 
+import copy
+
 from ucca import core
 
 LAYER_ID = '0'
@@ -190,10 +192,10 @@ class Layer0(core.Layer):
 
         """
         other = Layer0(root=other_passage, attrib=self.attrib.copy())
-        other.extra = self.extra.copy()
+        other.extra = _copy_extra(self.extra)
         for t in self._all:
             copied = other.add_terminal(t.text, t.punct, t.paragraph)
-            copied.extra = t.extra.copy()
+            copied.extra = _copy_extra(t.extra)
 
     def docs(self, num_paragraphs=1):
         docs = self.extra.setdefault("doc", [[]])
@@ -205,6 +207,12 @@ class Layer0(core.Layer):
         return self.docs(paragraph)[paragraph - 1]
 
 
+def _copy_extra(extra):
+    """Copies an extra dict along with any lists and dicts in it (such as the docs), so that annotating the copy leaves
+    the original unchanged, while the (usually scalar) values of terminals are still copied quickly."""
+    return {k: copy.deepcopy(v) if isinstance(v, (list, dict)) else v for k, v in extra.items()}
+
+
 def is_punct(node):
     """Returns whether the unit is a layer0 punctuation (for all Units)."""
     return node.layer.ID == LAYER_ID and node.punct
@@ -377,7 +377,7 @@ class PunctNode(FoundationalNode):
         if not layer0.is_punct(node):
             node.tag = layer0.NodeTags.Punct
             # raise ValueError("%s child (%s) for %s node (%s)" % (node.tag, node.ID, NodeTags.Punctuation, self.ID))
-        super().add(edge_tag, node, edge_attrib=None)
+        return super().add(edge_tag, node, edge_attrib=None)
 
     @property
     def terminals(self):
@@ -501,6 +501,33 @@ class Layer1(core.Layer):
             linkage.add(EdgeTags.LinkArgument, arg)
         return linkage
 
+    def copy(self, other_passage):
+        """Creates a copied Layer1 object, with all its Nodes and Edges, in other_passage.
+
+        Nodes keep their IDs, so other_passage must already have a copy of
+        the Terminals (see :func:layer0.Layer0.copy).
+
+        :param other_passage: the Passage to copy self to
+
+        """
+        other = Layer1(root=other_passage, attrib=self.attrib.copy(), orderkey=self.orderkey)
+        other.extra = layer0._copy_extra(self.extra)
+        with other_passage.bulk_mode():
+            created = {node.ID: node for node in other.all}
+            for node in self._all:
+                other_node = created.get(node.ID)
+                if other_node is None:
+                    other_node = type(node)(root=other_passage, ID=node.ID, tag=node.tag, attrib=node.attrib.copy())
+                else:
+                    other_node.attrib.update(node.attrib.copy())
+                other_node.extra = layer0._copy_extra(node.extra)
+            for node in self._all:
+                other_node = other_passage.by_id(node.ID)
+                for edge in node:
+                    other_edge = other_node.add(edge.tag, other_passage.by_id(edge.child.ID),
+                                                edge_attrib=edge.attrib.copy())
+                    other_edge.extra = layer0._copy_extra(edge.extra)
+
     def _check_top_scene(self, node):
         """Checks whether a node is a scene, and a top-level one.
 
@@ -544,6 +571,8 @@ class Layer1(core.Layer):
 
     def _update_edge(self, edge):
         """Adds the Edge to the Layer, and updates top scenes and linkers."""
+        if self._root.bulk:  # Updated all at once in _exit_bulk_mode
+            return
         self._update_top_scene(edge.parent)
         self._update_top_scene(edge.child)
         for lkg in [x for x in edge.parent.parents
@@ -553,6 +582,13 @@ class Layer1(core.Layer):
                     if x.tag == NodeTags.Linkage]:
             self._update_top_linkage(lkg)
 
+    def _exit_bulk_mode(self):
+        """Sorts the Nodes and finds the top scenes and linkers, skipped while in bulk mode."""
+        super()._exit_bulk_mode()
+        self._scenes = [n for n in self._all if n.tag == NodeTags.Foundational and self._check_top_scene(n)]
+        scenes = set(self._scenes)
+        self._linkages = [n for n in self._all if n.tag == NodeTags.Linkage and scenes.issuperset(n.arguments)]
+
     def _add_edge(self, edge):
         super()._add_edge(edge)
         self._update_edge(edge)
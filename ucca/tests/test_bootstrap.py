@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from ucca import bootstrap
+from ucca.evaluation import evaluate, Scores, SummaryStatistics, EVAL_TYPES
+from .test_evaluation import passage1, passage2
+
+"""Tests the bootstrap module functions."""
+
+
+def passage_scores():
+    return [evaluate(passage1(), passage2(), constructions=("primary", "remote", "categories"),
+                     ref_yield_tags=passage2()),
+            evaluate(passage2(), passage2(), constructions=("primary", "remote", "categories"),
+                     ref_yield_tags=passage2())]
+
+
+def test_f1():
+    counts = np.random.RandomState(1).randint(0, 3, size=(100, 3))
+    for c, f in zip(counts, bootstrap.f1(counts)):
+        assert SummaryStatistics(*c).f1 == pytest.approx(f)
+
+
+def test_counts_array():
+    scores = passage_scores()
+    columns, counts = bootstrap.counts_array([bootstrap.scores_counts(s) for s in scores])
+    assert counts.shape == (len(scores), len(columns), 3)
+    f1 = bootstrap.f1(counts.sum(axis=0))
+    aggregated = Scores.aggregate(scores)
+    for eval_type in EVAL_TYPES:
+        assert f1[columns.index((eval_type, bootstrap.AVERAGE))] == pytest.approx(aggregated.average_f1(eval_type))
+        for construction, stats in aggregated[eval_type].results.items():
+            assert f1[columns.index((eval_type, str(construction)))] == pytest.approx(stats.f1)
+
+
+def test_bootstrap():
+    scores = passage_scores()
+    columns, counts = bootstrap.counts_array([bootstrap.scores_counts(s) for s in scores])
+    results = bootstrap.bootstrap(counts, columns=columns, samples=200, seed=1)
+    assert [(r.eval_type, r.construction) for r in results] == columns
+    for result in results:
+        assert result.low <= result.f1 + 1e-9 and result.f1 <= result.high + 1e-9
+        assert result.other_f1 is None and result.p_value is None
+    assert results == bootstrap.bootstrap(counts, columns=columns, samples=200, seed=1)
+
+
+def test_bootstrap_paired():
+    scores = passage_scores()
+    columns, counts = bootstrap.counts_array([bootstrap.scores_counts(s) for s in scores])
+    same = bootstrap.bootstrap(counts, counts, columns=columns, samples=100, seed=1)
+    assert all(r.difference == 0 and r.difference_low == 0 and r.p_value == 1 for r in same)
+    worse = counts.copy()  # Nothing matches
+    worse[..., 1:] += worse[..., :1]
+    worse[..., 0] = 0
+    better = bootstrap.bootstrap(counts, worse, columns=columns, samples=100, seed=1)
+    average = better[columns.index(("labeled", bootstrap.AVERAGE))]
+    assert average.difference == pytest.approx(average.f1) and average.p_value < 0.05
@@ -1,7 +1,7 @@
 import pytest
 
-from ucca import textutil
-from ucca.constructions import extract_edges, CATEGORIES_NAME, DEFAULT, CONSTRUCTIONS
+from ucca import textutil, layer1
+from ucca.constructions import extract_edges, get_yield_bits, yield_positions, CATEGORIES_NAME, DEFAULT, CONSTRUCTIONS
 from .conftest import PASSAGES, loaded, loaded_valid, multi_sent, crossing, discontiguous, l1_passage, empty
 
 """Tests the constructions module functions and classes."""
@@ -41,3 +41,15 @@ def test_extract_all(create, expected):
 def test_extract(create, constructions, monkeypatch):
     monkeypatch.setattr(textutil, "get_nlp", assert_spacy_not_loaded)
     extract_and_check(create(), constructions=constructions)
+
+
+@pytest.mark.parametrize("create", PASSAGES)
+def test_yield_bits(create):
+    p = create()
+    spans = {}
+    for node in p.layer(layer1.LAYER_ID).all:
+        if node.tag == layer1.NodeTags.Linkage:
+            continue
+        bits, bits_no_punct = get_yield_bits(node, spans)
+        for b, punct in ((bits, True), (bits_no_punct, False)):
+            assert yield_positions(b) == sorted({t.position for t in node.get_terminals(punct=punct)}), node.ID
@@ -1,7 +1,13 @@
+import io
+import json
+import os
+import sys
+import pytest
 import xml.etree.ElementTree as ETree
+from glob import glob
 
-from ucca import layer0, layer1, convert
-from .conftest import loaded, load_xml
+from ucca import layer0, layer1, convert, textutil
+from .conftest import loaded, load_xml, PASSAGES
 
 """Tests convert module correctness and API."""
 
@@ -199,3 +205,132 @@ def test_to_site():
     root = convert.to_site(passage)
     copy = convert.from_site(root)
     assert passage.equals(copy)
+
+
+@pytest.mark.parametrize("backend", convert.XML_BACKENDS)
+def test_xml_backends(backend, tmpdir):
+    if backend == convert.LXML:
+        pytest.importorskip("lxml")
+    passage = loaded()
+    filename = str(tmpdir.join("passage.xml"))
+    convert.passage2file(passage, filename, backend=backend)
+    assert passage.equals(convert.xml2passage(filename, backend=backend), ordered=True)
+    assert passage.equals(convert.from_site(convert.to_site(passage, backend=backend)))
+    site = convert.get_xml_backend(backend).parse("test_files/site3.xml").getroot()
+    assert passage.equals(convert.from_site(site), ordered=True)
+
+
+@pytest.mark.parametrize("create", PASSAGES)
+@pytest.mark.parametrize("indent", (True, False), ids=("indent", "compact"))
+def test_xml_backends_same_output(create, indent):
+    pytest.importorskip("lxml")
+    passage = create()
+    passage.extra["remarks"] = 'special "characters" <&>\n\tand non-ASCII: ש'
+    outputs = [convert.xml2string(convert.to_standard(passage, backend=backend), indent)
+               for backend in convert.XML_BACKENDS]
+    assert all(output == outputs[0] for output in outputs), "XML backends should write the same output"
+    assert "<attributes />" in outputs[0]
+
+
+@pytest.mark.parametrize("create", PASSAGES)
+@pytest.mark.parametrize("indent", (True, False), ids=("indent", "compact"))
+def test_write_standard(create, indent):
+    passage = create()
+    passage.extra["remarks"] = 'special "characters" <&>\n\tand non-ASCII: ש'
+    f = io.StringIO()
+    convert.write_standard(passage, f, indent=indent)
+    xml_string = ETree.tostring(convert.to_standard(passage)).decode()
+    assert f.getvalue() == (textutil.indent_xml(xml_string) if indent else xml_string)
+    assert passage.equals(convert.from_standard(ETree.fromstring(f.getvalue())), ordered=True)
+
+
+def _ids(elements):
+    return [x.ID for x in elements]
+
+
+def _assert_same_order(passage, converted):
+    for layer in passage.layers:
+        other = converted.layer(layer.ID)
+        assert _ids(layer.all) == _ids(other.all)
+        assert _ids(layer.heads) == _ids(other.heads)
+        for node in layer.all:
+            other_node = converted.by_id(node.ID)
+            assert _ids(node) == _ids(other_node)
+            assert _ids(node.incoming) == _ids(other_node.incoming)
+    l1, other_l1 = passage.layer(layer1.LAYER_ID), converted.layer(layer1.LAYER_ID)
+    assert _ids(l1.top_scenes) == _ids(other_l1.top_scenes)
+    assert _ids(l1.top_linkages) == _ids(other_l1.top_linkages)
+
+
+@pytest.mark.parametrize("create", PASSAGES)
+def test_from_standard_order(create):
+    passage = create()  # Created without bulk mode, ordering Nodes and Edges on every change
+    _assert_same_order(passage, convert.from_standard(convert.to_standard(passage)))
+
+
+def _load_test_file(filename):
+    if os.path.basename(filename).startswith("site"):
+        return convert.from_site(ETree.parse(filename).getroot())
+    return convert.file2passage(filename)
+
+
+COMPRESSIONS = [pytest.param(c, marks=pytest.mark.skipif(convert.zstandard is None, reason="zstandard not installed"))
+                if c == convert.ZSTD else c for c in convert.COMPRESSIONS]
+
+
+@pytest.mark.parametrize("compression", COMPRESSIONS)
+@pytest.mark.parametrize("create", PASSAGES)
+def test_binary(create, compression):
+    passage = create()
+    passage.extra.update(remarks="non-ASCII: ש", count=-3, score=0.5, flag=False, tokens=["a", "b"], missing=None)
+    converted = convert.from_binary(convert.to_binary(passage, compression=compression))
+    assert passage.equals(converted, ordered=True)
+    assert passage.extra == converted.extra
+    _assert_same_order(passage, converted)
+
+
+@pytest.mark.parametrize("compression", COMPRESSIONS)
+@pytest.mark.parametrize("filename", sorted(glob("test_files/*.xml")))
+def test_binary_files(filename, compression, tmpdir):
+    passage = _load_test_file(filename)
+    binary_filename = str(tmpdir.join(passage.ID + convert.BINARY_SUFFIX))
+    convert.passage2file(passage, binary_filename, compression=compression)
+    converted = convert.file2passage(binary_filename)
+    _assert_same_order(passage, converted)
+    assert ETree.tostring(convert.to_standard(passage)) == ETree.tostring(convert.to_standard(converted))
+
+
+@pytest.mark.parametrize("data", (b"", b"<root/>", convert.to_binary(loaded())[:4] + b"\xff\x00"))
+def test_binary_invalid(data):
+    with pytest.raises(convert.BinaryFormatError):
+        convert.from_binary(data)
+
+
+@pytest.mark.parametrize("compression", COMPRESSIONS)
+def test_binary_truncated(compression):
+    data = convert.to_binary(loaded(), compression=compression)
+    for length in range(len(data)):
+        with pytest.raises(convert.BinaryFormatError):
+            convert.from_binary(data[:length])
+
+
+def test_site_deep():
+    depth = sys.getrecursionlimit() + 100
+    units = "".join('<unit type="Center" id="%d">' % i for i in range(3, 3 + depth))
+    site = ETree.fromstring('<root><units passageID="1"><unit type="To Be Defined" id="0">'
+                            '<unit type="To Be Defined" id="1">%s<unit type="To Be Defined" id="2"><word id="%d">a'
+                            '</word></unit>%s</unit></unit></units></root>' % (units, 3 + depth, depth * "</unit>"))
+    passage = convert.from_site(site)
+    assert len(passage.layer(layer1.LAYER_ID).all) == depth + 1  # Including the layer head
+    assert passage.layer(layer0.LAYER_ID).words[0].text == "a"
+
+
+@pytest.mark.parametrize("create", PASSAGES)
+def test_json(create):
+    passage = create()
+    converted = convert.from_json(convert.to_json(passage))  # Punctuation units are not kept
+    d = convert.to_json(converted, return_dict=True)
+    assert d == convert.to_json(convert.from_json(d), return_dict=True)
+    f = io.StringIO()
+    convert.write_json(passage, f)
+    assert json.loads(f.getvalue()) == convert.to_json(passage, return_dict=True)
@@ -162,6 +162,14 @@ def test_copying(create):
     p2 = p1.copy([l0id])
     assert (p1.layer(l0id).equals(p2.layer(l0id)))
 
+    l1id = layer1.LAYER_ID
+    p2 = p1.copy([l0id, l1id])
+    assert p1.equals(p2, ordered=True)
+    assert sorted(p1.nodes) == sorted(p2.nodes)
+    assert [(e.ID, e.attrib.copy()) for n in p1.layer(l1id).all for e in n] == \
+        [(e.ID, e.attrib.copy()) for n in p2.layer(l1id).all for e in n]
+    assert [n.ID for n in p1.layer(l1id).top_scenes] == [n.ID for n in p2.layer(l1id).top_scenes]
+
 
 def test_iteration():
     p = basic()
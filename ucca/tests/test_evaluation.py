@@ -1,9 +1,11 @@
+import json
+import pickle
 from itertools import repeat
 
 import pytest
 
 from ucca import core, layer0, layer1
-from ucca.evaluation import evaluate, LABELED, UNLABELED, WEAK_LABELED
+from ucca.evaluation import evaluate, Evaluator, Scores, ScoresAccumulator, LABELED, UNLABELED, WEAK_LABELED, EVAL_TYPES
 from .conftest import PASSAGES
 
 PRIMARY = "primary"
@@ -171,3 +173,67 @@ def test_evaluate_self(create, units, errors, normalize):
 def test_evaluate(create1, create2, f1, units, errors):
     scores = evaluate(create1(), create2(), units=units, errors=errors)
     check_primary_remote(scores, f1)
+
+
+@pytest.mark.parametrize("create1, create2", [(passage1, passage2), (passage2, passage1)] + [(c, c) for c in PASSAGES])
+def test_evaluate_single_pass(create1, create2):
+    scores = evaluate(create1(), create2(), errors=True, normalize=False)
+    for eval_type in EVAL_TYPES:
+        expected = Evaluator(False, None, False, True, True).get_scores(create1(), create2(), eval_type)
+        actual = scores[eval_type]
+        assert list(expected.results) == list(actual.results), eval_type
+        for construction, stats in expected.results.items():
+            other = actual[construction]
+            assert (stats.num_matches, stats.num_only_guessed, stats.num_only_ref, stats.errors) == \
+                (other.num_matches, other.num_only_guessed, other.num_only_ref, other.errors), (eval_type, construction)
+
+
+def test_evaluator_mutual():
+    evaluator = Evaluator(False, None, False, True, False)
+    results = evaluator.get_scores(passage1(), passage2(), LABELED)
+    assert list(evaluator.mutual) == list(results.results)  # Construction -> yield -> tags, as before
+    assert all(len(evaluator.mutual[c]) == s.num_matches for c, s in results.results.items())
+    evaluator.get_all_scores(passage1(), passage2())
+    assert list(evaluator.mutual_by_type) == list(EVAL_TYPES)
+    assert evaluator.mutual is evaluator.mutual_by_type[EVAL_TYPES[-1]]
+
+
+@pytest.mark.parametrize("constructions", (("primary", "remote"), ("primary", "remote", "categories")))
+def test_scores_counts(constructions):
+    scores = evaluate(passage1(), passage2(), errors=True, constructions=constructions, ref_yield_tags=passage2())
+    restored = Scores.from_counts(pickle.loads(pickle.dumps(scores.counts())))
+    assert restored.counts() == scores.counts()
+    for eval_type in EVAL_TYPES:
+        assert restored.titles(eval_type) == scores.titles(eval_type)
+        assert restored.fields(eval_type) == scores.fields(eval_type)
+        assert restored[eval_type][PRIMARY].errors == scores[eval_type][PRIMARY].errors
+    assert Scores.aggregate([restored, restored]).counts() == Scores.aggregate([scores, scores]).counts()
+
+
+@pytest.mark.parametrize("create", PASSAGES + (passage1, passage2))
+@pytest.mark.parametrize("copy", (True, False), ids=("copy", ""))
+def test_evaluate_copy(create, copy):
+    guessed, ref = create(), create()
+    scores = evaluate(guessed, ref, copy=copy)
+    assert guessed.equals(create(), ordered=True) or not copy
+    assert ref.equals(create(), ordered=True) or not copy
+    assert scores.counts() == evaluate(create(), create(), copy=not copy).counts()
+
+
+def test_scores_accumulator():
+    scores = [evaluate(create1(), create2(), errors=True, constructions=("primary", "remote", "categories"),
+                       ref_yield_tags=create2())
+              for create1, create2 in ((passage1, passage2), (passage2, passage1), (passage1, passage1))]
+    expected = Scores.aggregate(list(scores)).counts()
+    accumulator = ScoresAccumulator()
+    for s in scores:
+        accumulator.add(s)
+    assert accumulator.num_scores == 3
+    assert accumulator.scores().counts() == expected
+    shards = [ScoresAccumulator().add(s) for s in scores]
+    merged = ScoresAccumulator()
+    for shard in shards:
+        merged.merge(ScoresAccumulator.from_counts(json.loads(json.dumps(shard.counts()))))
+    assert merged.scores().counts() == expected
+    assert ScoresAccumulator.from_counts(pickle.loads(pickle.dumps(merged.counts()))).scores().counts() == expected
+    assert ScoresAccumulator().scores().counts() == Scores.aggregate(()).counts()
@@ -1,9 +1,13 @@
+import json
 import os
 import pytest
 import random
+import threading
+import time
 from glob import glob
+from itertools import count, islice
 
-from ucca import layer0, layer1, convert, ioutil, diffutil
+from ucca import core, layer0, layer1, convert, ioutil, diffutil, textutil
 from .conftest import loaded, multi_sent, discontiguous, l1_passage
 
 """Tests the ioutil module functions and classes."""
@@ -62,6 +66,28 @@ def test_split_join_paragraphs(create):
     assert p.equals(copy)
 
 
+@pytest.mark.parametrize("create", (loaded, multi_sent, discontiguous, l1_passage))
+def test_split_passage_segments(create):
+    p = create()
+    n = len(p.layer(layer0.LAYER_ID).all)
+    ends = list(range(2, n, 2)) + [n]
+    split = convert.split_passage(p, ends, remarks=True)
+    assert len(split) == len(ends)
+    for start, end, segment in zip([0] + ends[:-1], ends, split):  # All segments are split in one pass
+        alone = convert.split_passage(p, [start, end] if start else [end], remarks=True)[-1]
+        assert segment.equals(alone), "Segment %d:%d differs when split alone" % (start, end)
+
+
+@pytest.mark.parametrize("create", (loaded, multi_sent, discontiguous, l1_passage))
+def test_split_join_docs(create):
+    p = create()
+    l0 = p.layer(layer0.LAYER_ID)
+    for terminal in l0.all:  # Fake annotation, unique for each terminal
+        l0.doc(terminal.paragraph).append([terminal.position])
+    copy = convert.join_passages(convert.split2sentences(p))
+    assert copy.layer(layer0.LAYER_ID).extra["doc"] == l0.extra["doc"]
+
+
 def _test_passages(passages):
     for passage in passages:
         assert passage.layer(layer0.LAYER_ID).all, "No terminals in passage " + passage.ID
@@ -88,3 +114,367 @@ def test_shuffle_passages():
     random.shuffle(passages)
     assert len(files) == len(passages)
     _test_passages(passages)
+
+
+@pytest.mark.parametrize("output_format", (None, "pickle", "bin"))
+def test_write_read_passage(output_format, tmpdir):
+    passage = loaded()
+    filename = ioutil.write_passage(passage, output_format=output_format, binary=output_format == "pickle",
+                                    outdir=str(tmpdir), verbose=False)
+    assert filename.endswith(convert.BINARY_SUFFIX if output_format == "bin" else "." + (output_format or "xml"))
+    passages = list(ioutil.read_files_and_dirs(filename))
+    assert len(passages) == 1
+    assert passage.equals(passages[0], ordered=True)
+
+
+def test_archive(tmpdir):
+    passages = [loaded(), multi_sent(), discontiguous(), l1_passage()]
+    for i, passage in enumerate(passages):
+        passage._ID = str(i)
+    filename = str(tmpdir.join("passages" + ioutil.ARCHIVE_SUFFIX))
+    assert ioutil.write_archive(passages, filename) == len(passages)
+    with ioutil.PassageArchive(filename) as archive:
+        assert len(archive) == len(passages)
+        assert archive.ids() == [p.ID for p in passages]
+        assert "1" in archive and "x" not in archive
+        for passage in reversed(passages):  # Random access
+            assert passage.equals(archive[passage.ID], ordered=True)
+        for passage, loaded_passage in zip(passages, archive):  # Sequential access
+            assert passage.equals(loaded_passage, ordered=True)
+        with pytest.raises(KeyError):
+            archive["x"]
+    for passage, loaded_passage in zip(passages, ioutil.get_passages(filename)):
+        assert passage.equals(loaded_passage, ordered=True)
+
+
+def test_archive_invalid(tmpdir):
+    filename = str(tmpdir.join("invalid" + ioutil.ARCHIVE_SUFFIX))
+    with open(filename, "w") as f:
+        f.write("<root/>")
+    with pytest.raises(IOError):
+        ioutil.PassageArchive(filename)
+    open(filename, "w").close()
+    with pytest.raises(IOError, match="Empty"):
+        ioutil.PassageArchive(filename)
+
+
+def test_archive_duplicate_ids(tmpdir):
+    filename = str(tmpdir.join("duplicate" + ioutil.ARCHIVE_SUFFIX))
+    with pytest.raises(ValueError, match="Duplicate"):
+        ioutil.write_archive([loaded(), loaded()], filename)
+    assert not tmpdir.listdir(), "Should not leave a partial archive or temporary file"
+
+
+@pytest.mark.parametrize("sentences", (False, True))
+def test_load_parallel(sentences, tmpdir):
+    files = [ioutil.write_passage(p, outdir=str(tmpdir), basename=str(i), binary=i % 2, verbose=False)
+             for i, p in enumerate((loaded(), multi_sent(), discontiguous(), l1_passage()))]
+    files = 2 * files + [multi_sent()]
+    expected = list(ioutil.LazyLoadedPassages(files, sentences=sentences))
+    passages = ioutil.LazyLoadedPassages(files, sentences=sentences, workers=2)
+    for _ in range(2):  # Iterate twice
+        actual = list(passages)
+        assert [p.ID for p in actual] == [p.ID for p in expected]
+        for passage, loaded_passage in zip(expected, actual):
+            assert passage.equals(loaded_passage, ordered=True)
+    assert next(iter(passages)).equals(expected[0], ordered=True)  # Stop early
+
+
+def _slow_text_to_passages(lines, passage_id, **kwargs):
+    time.sleep(3)
+    return _text_to_passages(lines, passage_id, **kwargs)
+
+
+def test_load_parallel_close(tmpdir):
+    files = []
+    for i, suffix in enumerate(("txt", "slow", "slow", "slow")):
+        files.append(str(tmpdir.join("%d.%s" % (i, suffix))))
+        with open(files[-1], "w", encoding="utf-8") as f:
+            f.write("Hello world .\n")
+    passages = ioutil.LazyLoadedPassages(files, workers=2,
+                                         converters={"txt": _text_to_passages, "slow": _slow_text_to_passages})
+    assert _terminal_texts(next(iter(passages))) == ["Hello", "world", "."]
+    start = time.time()
+    passages.close()
+    assert time.time() - start < 2, "Should not wait for files being loaded when stopping early"
+
+
+def _spacy_loaded(*args, **kwargs):
+    raise AssertionError("Should not load spaCy with the rule-based sentence splitter")
+
+
+@pytest.mark.parametrize("workers", (None, 2))
+def test_load_sentences_splitter(workers, tmpdir, monkeypatch):
+    monkeypatch.setattr(textutil, "get_nlp", _spacy_loaded)
+    monkeypatch.setattr(textutil, "get_blank", _spacy_loaded)
+    text_file = str(tmpdir.join("text.txt"))
+    with open(text_file, "w", encoding="utf-8") as f:
+        f.write("Hello world . Good bye .\n\nOne more sentence .\n")
+    passages = ioutil.get_passages(2 * [text_file], sentences=True, splitter="rules", workers=workers,
+                                   converters={"txt": _text_to_passages})
+    assert [_terminal_texts(p) for p in passages] == 2 * [["Hello", "world", "."], ["Good", "bye", "."],
+                                                          ["One", "more", "sentence", "."]]
+
+
+def test_prefetch():
+    files = 3 * ["test_files/standard3.xml"]
+    passages = list(ioutil.get_passages(files, prefetch=2))
+    assert len(passages) == len(files)
+    _test_passages(passages)
+
+
+def test_prefetched():
+    produced = []
+
+    def _gen():
+        for i in range(10):
+            produced.append(i)
+            yield i
+            if i == 5:
+                raise ValueError(i)
+
+    items = ioutil.prefetched(_gen(), 2)
+    assert next(items) == 0
+    time.sleep(.2)
+    assert len(produced) <= 4, "Should read at most 2 items ahead, plus one waiting to be put"
+    assert list(islice(items, 5)) == [1, 2, 3, 4, 5]
+    with pytest.raises(ValueError):
+        next(items)
+
+
+def test_prefetched_close():
+    closed = threading.Event()
+
+    def _gen():
+        try:
+            yield from count()
+        finally:
+            closed.set()
+
+    items = ioutil.prefetched(_gen(), 3)
+    assert next(items) == 0
+    items.close()
+    assert closed.is_set()
+    assert not any(t.name == "prefetch" for t in threading.enumerate())
+
+
+def test_prefetched_close_busy():
+    release = threading.Event()
+
+    def _gen():
+        yield 0
+        release.wait(10)  # Busy reading the next item, e.g. waiting for a file to appear
+        yield 1
+
+    items = ioutil.prefetched(_gen(), 1)
+    assert next(items) == 0
+    start = time.time()
+    items.close()
+    assert time.time() - start < ioutil.PREFETCH_JOIN_TIMEOUT + 1, "Should not wait for the item being read"
+    release.set()
+
+
+def test_cache(tmpdir):
+    cache = ioutil.PassageCache(str(tmpdir.join("cache")))
+    filenames = [ioutil.write_passage(p, outdir=str(tmpdir), verbose=False) for p in (loaded(), multi_sent())]
+    expected = [convert.file2passage(f) for f in filenames]
+    for _ in range(2):  # Parse and store, then load from the cache
+        passages = list(ioutil.read_files_and_dirs(filenames, cache=cache))
+        assert len(os.listdir(cache.cache_dir)) == len(filenames)
+        for passage, cached in zip(expected, passages):
+            assert passage.equals(cached, ordered=True)
+    os.utime(filenames[0], ns=(0, 0))  # The file changed, so it is parsed again
+    path = cache.path(filenames[0])
+    assert not os.path.exists(path)
+    assert expected[0].equals(cache.load(filenames[0]), ordered=True)
+    assert os.path.exists(path)
+    cache.max_size = os.path.getsize(path)  # Evict all but the most recently used entry
+    os.utime(path, (time.time() + 10,) * 2)
+    cache.evict()
+    assert os.listdir(cache.cache_dir) == [os.path.basename(path)]
+    cache.clear()
+    assert not os.listdir(cache.cache_dir)
+
+
+@pytest.mark.parametrize("output", (None, "passages" + ioutil.JSONL_SUFFIX))
+def test_passage_writer_append(output, tmpdir):
+    kwargs = dict(outdir=str(tmpdir), output_format="txt", output=output and str(tmpdir.join(output)), append=True)
+    passages = [loaded(), multi_sent(), loaded()]
+    for passage in passages:  # A new writer for each passage, each appending to the same file
+        with ioutil.PassageWriter(**kwargs) as writer:
+            filename = writer.write(passage, basename="all")
+    with open(filename, encoding="utf-8") as f:
+        assert len(f.readlines()) == (len(passages) if output else sum(len(convert.to_text(p)) for p in passages))
+    with pytest.raises(ValueError):
+        ioutil.PassageWriter(output=str(tmpdir.join("passages" + ioutil.ARCHIVE_SUFFIX)), append=True)
+
+
+def test_cache_scans(tmpdir, monkeypatch):
+    scandir = os.scandir
+    scans = []
+
+    def _scandir(*args):
+        scans.append(args)
+        return scandir(*args)
+
+    monkeypatch.setattr(ioutil.os, "scandir", _scandir)
+    cache = ioutil.PassageCache(str(tmpdir.join("cache")))
+    data = convert.to_binary(loaded())
+    writes = 2 * ioutil.CACHE_RESCAN_WRITES
+    for i in range(writes):
+        cache._store(os.path.join(cache.cache_dir, str(i) + convert.BINARY_SUFFIX), data)
+    assert len(scans) <= writes // ioutil.CACHE_RESCAN_WRITES + 1, "Should keep a running count of the size"
+    cache.max_size = 100 * len(data)
+    cache._store(os.path.join(cache.cache_dir, "x" + convert.BINARY_SUFFIX), data)
+    assert len(os.listdir(cache.cache_dir)) == int(100 * ioutil.CACHE_EVICT_RATIO)
+    scans.clear()
+    for i in range(100 - int(100 * ioutil.CACHE_EVICT_RATIO)):  # Evicted below the maximum, so no scan for a while
+        cache._store(os.path.join(cache.cache_dir, "y%d%s" % (i, convert.BINARY_SUFFIX)), data)
+    assert not scans
+
+
+def test_cache_read_only(tmpdir, monkeypatch):
+    cache = ioutil.PassageCache(str(tmpdir.join("cache")))
+    filename = ioutil.write_passage(loaded(), outdir=str(tmpdir), verbose=False)
+    cache.load(filename)
+    parsed = []
+    file2passage = ioutil.file2passage
+    monkeypatch.setattr(ioutil, "file2passage", lambda f: parsed.append(f) or file2passage(f))
+
+    def _utime(*args, **kwargs):
+        raise PermissionError(args)
+
+    monkeypatch.setattr(ioutil.os, "utime", _utime)
+    assert loaded().equals(cache.load(filename), ordered=True)
+    assert not parsed, "Should load from the cache even if it cannot be marked as recently used"
+
+
+@pytest.mark.parametrize("workers", (None, 2))
+@pytest.mark.parametrize("output_format", (None, "pickle", "bin", "txt"))
+def test_passage_writer(output_format, workers, tmpdir):
+    passages = [loaded(), multi_sent(), discontiguous()]
+    outdir = str(tmpdir.join("out"))
+    with ioutil.PassageWriter(outdir=outdir, output_format=output_format, binary=output_format == "pickle",
+                              prefix="p", workers=workers, queue_size=1) as writer:
+        filenames = [writer.write(p, basename=str(i)) for i, p in enumerate(passages)]
+    for i, (passage, filename) in enumerate(zip(passages, filenames)):
+        expected = ioutil.write_passage(passage, output_format=output_format, binary=output_format == "pickle",
+                                        outdir=str(tmpdir), prefix="p", verbose=False, basename=str(i))
+        assert os.path.basename(filename) == os.path.basename(expected)
+        if output_format == "pickle":  # Not byte-identical after being pickled to a worker process and back
+            assert passage.equals(convert.file2passage(filename), ordered=True)
+        else:
+            with open(filename, "rb") as f, open(expected, "rb") as f_expected:
+                assert f.read() == f_expected.read()
+
+
+@pytest.mark.parametrize("suffix", (ioutil.ARCHIVE_SUFFIX, ioutil.JSONL_SUFFIX))
+def test_passage_writer_stream(suffix, tmpdir):
+    passages = [loaded(), multi_sent(), discontiguous()]
+    for i, passage in enumerate(passages):
+        passage._ID = str(i)
+    filename = str(tmpdir.join("passages" + suffix))
+    with ioutil.PassageWriter(output=filename) as writer:
+        for passage in passages:
+            writer.write(passage)
+    if suffix == ioutil.ARCHIVE_SUFFIX:
+        with ioutil.PassageArchive(filename) as archive:
+            for passage, loaded_passage in zip(passages, archive):
+                assert passage.equals(loaded_passage, ordered=True)
+    else:
+        with open(filename, encoding="utf-8") as f:
+            assert [json.loads(line) for line in f] == [convert.to_json(p, return_dict=True) for p in passages]
+
+
+def test_passage_writer_errors(tmpdir):
+    writer = ioutil.PassageWriter(outdir=str(tmpdir), output_format="txt", converter=_failing_converter)
+    writer.write(loaded())
+    writer.write(multi_sent())
+    with pytest.raises(IOError):
+        writer.close()
+    assert len(writer.errors) == 2
+    with pytest.raises(ValueError):
+        writer.write(loaded())
+
+
+def _failing_converter(passage):
+    raise ValueError(passage.ID)
+
+
+def _text_to_passages(lines, passage_id, first_index=0, **kwargs):
+    """ Like convert.from_text, but splitting tokens by whitespace """
+    del kwargs
+    i = first_index
+    tokens = []
+    for line in lines:
+        tokens += line.split()
+        if tokens and not line.strip():
+            passage = core.Passage("%s_%d" % (passage_id, i))
+            l0 = layer0.Layer0(passage)
+            layer1.Layer1(passage)
+            for token in tokens:
+                l0.add_terminal(text=token, punct=False)
+            yield passage
+            i += 1
+            tokens = []
+
+
+def _text_to_passages_unnumbered(lines, passage_id, **kwargs):
+    """ Like _text_to_passages, but always numbering passages from 0, so it can only read whole files """
+    return _text_to_passages(lines, passage_id, **kwargs)
+
+
+def _terminal_texts(passage):
+    return [t.text for t in passage.layer(layer0.LAYER_ID).all]
+
+
+@pytest.mark.parametrize("converter", (_text_to_passages, _text_to_passages_unnumbered))
+def test_index(converter, tmpdir):
+    text_file = str(tmpdir.join("text.txt"))
+    with open(text_file, "w", encoding="utf-8") as f:
+        f.write("\n".join("\n".join(["passage %d" % i, "second line"] + i * ["more"]) + "\n" for i in range(5)))
+    archive = str(tmpdir.join("passages" + ioutil.ARCHIVE_SUFFIX))
+    archived = [multi_sent(), discontiguous()]
+    for i, passage in enumerate(archived):
+        passage._ID = str(i)
+    ioutil.write_archive(archived, archive)
+    files = ["test_files/standard3.xml", text_file, archive, l1_passage()]
+    converters = {"txt": converter}
+    expected = list(ioutil.LazyLoadedPassages(files, converters=converters))
+    passages = ioutil.LazyLoadedPassages(files, converters=converters, index=True)
+    assert len(passages) == len(expected) == 9
+    assert [p.ID for p in expected[1:6]] == ["text_%d" % i for i in range(5)]
+    assert [(p.ID, _terminal_texts(p)) for p in passages] == [(p.ID, _terminal_texts(p)) for p in expected]
+    assert [(p.ID, _terminal_texts(p)) for p in map(passages.load, range(len(passages)))] == \
+        [(p.ID, _terminal_texts(p)) for p in expected]
+    shards = [passages.shard(i, 3) for i in range(3)]
+    assert sum(map(len, shards)) == len(passages)
+    assert [(p.ID, _terminal_texts(p)) for p in shards[1]] == [(p.ID, _terminal_texts(p)) for p in expected[1::3]]
+    random.shuffle(passages)
+    assert sorted((p.ID, _terminal_texts(p)) for p in passages) == sorted((p.ID, _terminal_texts(p)) for p in expected)
+    passages.close()
+
+
+def test_gen_files(tmpdir):
+    for path in ("10.xml", "2.xml", "1.txt", "sub/3.xml", "sub/deeper/1.xml", "a/5.xml"):
+        tmpdir.join(path).ensure()
+    root = str(tmpdir)
+
+    def _relative(files):
+        return [os.path.relpath(f, root) for f in files]
+
+    assert _relative(ioutil.gen_files(root)) == ["1.txt", "2.xml", "10.xml"]
+    assert _relative(ioutil.gen_files(root, extensions=".xml")) == ["2.xml", "10.xml"]
+    assert _relative(ioutil.gen_files([root, os.path.join(root, "1.txt")], recursive=True, extensions=[".xml"])) == [
+        "2.xml", "10.xml", os.path.join("a", "5.xml"), os.path.join("sub", "3.xml"),
+        os.path.join("sub", "deeper", "1.xml"), "1.txt"]
+
+
+def test_get_passages_stream(tmpdir):
+    for i, passage in enumerate((loaded(), multi_sent(), l1_passage())):
+        ioutil.write_passage(passage, outdir=str(tmpdir.join("sub")), basename=str(10 - i), verbose=False)
+    passages = list(ioutil.get_passages([str(tmpdir)], recursive=True))
+    assert len(passages) == 3
+    assert passages[0].equals(l1_passage(), ordered=True)
+    assert passages[2].equals(loaded(), ordered=True)
+    assert [p.ID for p in ioutil.get_passages(str(tmpdir.join("sub", "*.xml")))] == [p.ID for p in passages]
@@ -1,4 +1,4 @@
-from ucca import core, layer0
+from ucca import core, layer0, layer1
 
 """Tests module layer0 functionality."""
 
@@ -60,3 +60,33 @@ def test_layer0():
     assert [x[0] for x in l0.pairs] == [1, 2, 3]
     assert [t.para_pos for t in l0.all] == [1, 1, 2]
     assert l0.words == (t1, t3)
+
+
+def test_copy_extra():
+    p = core.Passage("1")
+    l0 = layer0.Layer0(p)
+    terminal = l0.add_terminal("a", False)
+    l0.doc(1).append([1, 2])
+    terminal.extra["tokens"] = ["a"]
+    l1 = layer1.Layer1(p)
+    l1.extra["remarks"] = ["layer"]
+    node = l1.add_fnode(None, layer1.EdgeTags.ParallelScene)
+    node.extra["remarks"] = ["node"]
+    node.incoming[0].extra["remarks"] = ["edge"]
+    p_copy = core.Passage("2")
+    l0.copy(p_copy)
+    l1.copy(p_copy)
+    l1_copy = p_copy.layer(layer1.LAYER_ID)
+    l1_copy.extra["remarks"].append("copy")
+    p_copy.by_id(node.ID).extra["remarks"].append("copy")
+    p_copy.by_id(node.ID).incoming[0].extra["remarks"].append("copy")
+    assert l1.extra["remarks"] == ["layer"]
+    assert node.extra["remarks"] == ["node"]
+    assert node.incoming[0].extra["remarks"] == ["edge"]
+    l0_copy = p_copy.layer(layer0.LAYER_ID)
+    l0_copy.doc(1)[0][0] = 3  # Annotate the copy
+    l0_copy.docs(2)[1] = [[4, 5]]
+    p_copy.by_id(terminal.ID).extra["tokens"].append("b")
+    assert l0.extra["doc"] == [[[1, 2]]]
+    assert terminal.extra["tokens"] == ["a"]
+    assert l0_copy.extra["doc"] == [[[3, 2]], [[4, 5]]]
@@ -1,6 +1,7 @@
+import numpy as np
 import pytest
 
-from ucca import layer0, convert, textutil
+from ucca import core, layer0, layer1, convert, textutil
 from .conftest import crossing, multi_sent, l1_passage, discontiguous, empty, PASSAGES
 
 """Tests the textutil module functions and classes."""
@@ -93,3 +94,156 @@ def test_preannotate_passage(create, as_array, convert_and_back, partial, monkey
             if value:
                 assert (terminal.tok[i] if as_array else terminal.extra.get(attr.key)) == value, \
                     "Terminal %s has wrong %s" % (terminal, attr.name)
+
+
+def test_annotation_cache(tmpdir, monkeypatch):
+    monkeypatch.setattr(textutil, "get_nlp", assert_spacy_not_loaded)
+    cache = textutil.AnnotationCache(str(tmpdir))
+    tokens = [["Hello", "world", "."], ["Good", "bye"], ["Hello", "world", "."]]
+    assert cache.get("en", tokens[0]) is None
+    arrays = [np.arange(len(t) * len(textutil.Attr), dtype=np.uint64).reshape(len(t), -1) + i
+              for i, t in enumerate(tokens[:2])]
+    for t, arr in zip(tokens, arrays):
+        cache.put("en", t, arr)
+    assert (cache.get("en", tokens[2]) == arrays[0]).all()
+    annotated = list(textutil.annotate_arrays(zip(tokens, "abc"), cache=cache))
+    assert [context for _, context in annotated] == list("abc")
+    for (arr, _), expected in zip(annotated, arrays + arrays[:1]):
+        assert (arr == expected).all()
+
+
+def test_annotation_cache_unwritable(tmpdir):
+    not_dir = tmpdir.join("file")
+    not_dir.write("")
+    cache = textutil.AnnotationCache(str(not_dir.join("cache")))  # Cannot be created under a file
+    cache.put("en", ["Hello"], np.zeros((1, len(textutil.Attr)), dtype=np.uint64))
+    assert cache.get("en", ["Hello"]) is None
+
+
+class FakeNLP:
+    def __init__(self):
+        self.parsed = []
+
+    def pipe(self, texts, batch_size=None):
+        for text in texts:
+            self.parsed.append(text)
+            yield text
+
+
+def test_annotation_cache_partial(tmpdir, monkeypatch):
+    fake_nlp = FakeNLP()
+    monkeypatch.setattr(textutil, "get_nlp", lambda *args, **kwargs: fake_nlp)
+    monkeypatch.setattr(textutil, "to_array", lambda tokens: np.array([[len(t)] for t in tokens], dtype=np.uint64))
+    cache = textutil.AnnotationCache(str(tmpdir))
+    tokens = [["a", "bb"], ["ccc"], ["dddd", "e"], ["ccc"]]
+    cache.put("en", tokens[1], np.array([[7]], dtype=np.uint64))
+    annotated = list(textutil.annotate_arrays(zip(tokens, range(len(tokens))), cache=cache))
+    assert fake_nlp.parsed == [tokens[0], tokens[2]]
+    assert [context for _, context in annotated] == list(range(len(tokens)))
+    assert [arr.ravel().tolist() for arr, _ in annotated] == [[1, 2], [7], [4, 1], [7]]
+    assert cache.get("en", tokens[2]).ravel().tolist() == [4, 1]
+
+
+class FakeLexeme:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeVocab:
+    def __init__(self, strings):
+        self.strings = strings
+
+    def __getitem__(self, i):
+        return FakeLexeme(self.strings[i])
+
+
+@pytest.mark.parametrize("as_array", (True, False), ids=("array", "extra"))
+def test_resolve_array(as_array):
+    vocab = FakeVocab({i: "s%d" % i for i in range(10, 30)})
+    arr = np.array([[10 + i + j for j in range(len(textutil.Attr))] for i in range(5)], dtype=np.uint64)
+    arr[:, textutil.Attr.HEAD.value] = np.array([0, 1, -1, 2, -2], dtype=np.int64).view(np.uint64)
+    arr[0, textutil.Attr.LEMMA.value] = 99  # Not in vocab
+    memo = {}
+    columns = textutil.resolve_array(arr, vocab, as_array=as_array, memo=memo)
+    assert columns == [[a(v, vocab, as_array=as_array) for v in column] for a, column in zip(textutil.Attr, arr.T)]
+    assert columns[textutil.Attr.HEAD.value] == [0, 1, -1, 2, -2]
+    assert columns[textutil.Attr.LEMMA.value][0] is None
+    assert memo
+
+
+@pytest.mark.parametrize("as_array", (True, False), ids=("array", "extra"))
+def test_set_docs(as_array, monkeypatch):
+    monkeypatch.setattr(textutil, "get_nlp", lambda *args, **kwargs: FakeNLP())
+    monkeypatch.setattr(textutil, "to_array", lambda tokens: np.array(
+        [[10 + (len(t) + j) % 20 for j in range(len(textutil.Attr))] for t in tokens], dtype=np.uint64))
+    vocab = FakeVocab({i: "s%d" % i for i in range(10, 30)})
+    passage = multi_sent()
+    textutil.annotate(passage, as_array=as_array, vocab=vocab)
+    assert textutil.is_annotated(passage, as_array=as_array)
+    for terminal in passage.layer(layer0.LAYER_ID).all:
+        for j, attr in enumerate(textutil.Attr):
+            expected = attr(10 + (len(terminal.text) + j) % 20, vocab, as_array=as_array)
+            assert (terminal.tok[j] if as_array else terminal.extra[attr.key]) == expected
+
+
+@pytest.mark.parametrize("header", (True, False), ids=("header", "no_header"))
+@pytest.mark.parametrize("dim, size", ((None, None), (2, 3)))
+def test_word_vectors_cache(header, dim, size, tmpdir):
+    filename = str(tmpdir.join("vectors.txt"))
+    words = ["the", "a", "of", "UCCA", "."]
+    with open(filename, "w", encoding="utf-8") as f:
+        if header:
+            print(len(words), 3, file=f)
+        for i, word in enumerate(words):
+            print(word, *(i + j / 10 for j in range(3)), file=f)
+    expected, expected_dim = textutil.get_word_vectors(dim=dim, size=size, filename=filename)
+    assert textutil.load_word_vectors_cache(filename) is None
+    matrix_file, _ = textutil.save_word_vectors_cache(filename)
+    for cached_filename in filename, matrix_file:
+        vectors, nr_dim = textutil.get_word_vectors(dim=dim, size=size, filename=cached_filename)
+        assert isinstance(vectors, textutil.WordVectors)
+        assert nr_dim == expected_dim
+        assert list(vectors) == list(expected)
+        for word, vector in vectors.items():
+            assert np.array_equal(vector, expected[word])
+
+
+@pytest.mark.parametrize("tokenized", (False, True), ids=("text", "tokens"))
+def test_tokenize_without_model(tokenized, monkeypatch):
+    pytest.importorskip("spacy")
+    monkeypatch.setattr(textutil, "get_nlp", assert_spacy_not_loaded)
+    monkeypatch.setattr(textutil, "nlp", {})
+    text = "Hello, world!"
+    passage = next(convert.from_text(text.replace(",", " ,").replace("!", " !").split() if tokenized else text,
+                                     tokenized=tokenized))
+    assert [t.text for t in passage.layer(layer0.LAYER_ID).all] == ["Hello", ",", "world", "!"]
+    assert [t.punct for t in passage.layer(layer0.LAYER_ID).all] == [False, True, False, True]
+
+
+@pytest.mark.parametrize("text, ends", (
+        ("Hello world . Good bye !", [3, 6]),
+        ("Mr. Smith met Dr . Jones . Then he left", [7, 10]),
+        ("He said \" go home ! \" and left .", [10]),
+        ("\" Go home ! \" He left .", [5, 8]),
+        ("Really ?! Yes . J . R . R . Tolkien wrote it", [2, 4, 13]),
+        ("No end mark here", [4]),
+        ("", []),
+))
+def test_split_sentences_by_rules(text, ends):
+    assert textutil.split_sentences_by_rules(text.split()) == ends
+
+
+def test_break2sentences_splitter(monkeypatch):
+    monkeypatch.setattr(textutil, "get_nlp", assert_spacy_not_loaded)
+    passage = core.Passage("1")
+    l0 = layer0.Layer0(passage)
+    layer1.Layer1(passage)
+    for token in "Hello world . Good bye ! And more".split():
+        l0.add_terminal(text=token, punct=token in ".!")
+    assert textutil.break2sentences(passage, splitter="rules") == [3, 6, 8]
+    assert textutil.break2sentences(passage, splitter=lambda tokens, lang: [2, len(tokens)]) == [2, 8]
+    monkeypatch.setitem(textutil.sentence_splitters, "en", "rules")
+    assert [[t.text for t in p.layer(layer0.LAYER_ID).all] for p in convert.split2sentences(passage)] == [
+        ["Hello", "world", "."], ["Good", "bye", "!"], ["And", "more"]]
+    with pytest.raises(ValueError):
+        textutil.break2sentences(passage, splitter="unknown")
@@ -1,9 +1,14 @@
 """Utility functions for UCCA package."""
+import hashlib
+import io
+import json
 import sys
+import tempfile
 import time
 from collections import OrderedDict
 from collections import deque
-from itertools import groupby, islice
+from collections.abc import Mapping
+from itertools import groupby, islice, chain
 
 import numpy as np
 import os
@@ -17,8 +22,10 @@ from ucca import layer0, layer1
 MODEL_ENV_VAR = "SPACY_MODEL"  # Determines the default spaCy model to load
 DEFAULT_MODEL = {"en": "en_core_web_md", "fr": "fr_core_news_md", "de": "de_core_news_sm"}
 
-N_THREADS = 4
+N_PROCESS = 1  # Number of processes for spaCy to annotate in
+N_THREADS = 4  # Ignored, since spaCy no longer takes a number of threads; kept for compatibility, see N_PROCESS
 BATCH_SIZE = 50
+ANNOTATION_CACHE_ENV_VAR = "UCCA_ANNOTATION_CACHE"  # Directory of AnnotationCache to use by default, if set
 
 
 class Attr(Enum):
@@ -62,15 +69,21 @@ class Attr(Enum):
         return self.name.lower()
 
 
+def get_model_name(lang="en"):
+    """Name of spaCy model to load for a given language, determined by `models' dict or by MODEL_ENV_VAR"""
+    model = models.get(lang)
+    if not model:
+        models[lang] = model = os.environ.get("_".join((MODEL_ENV_VAR, lang.upper()))) or \
+                               os.environ.get(MODEL_ENV_VAR) or DEFAULT_MODEL.get(lang, "xx")
+    return model
+
+
 def get_nlp(lang="en"):
     """Load spaCy model for a given language, determined by `models' dict or by MODEL_ENV_VAR"""
     instance = nlp.get(lang)
     if instance is None:
         import spacy
-        model = models.get(lang)
-        if not model:
-            models[lang] = model = os.environ.get("_".join((MODEL_ENV_VAR, lang.upper()))) or \
-                                   os.environ.get(MODEL_ENV_VAR) or DEFAULT_MODEL.get(lang, "xx")
+        model = get_model_name(lang)
         started = time.time()
         with external_write_mode():
             print("Loading spaCy model '%s'... " % model, end="", flush=True)
@@ -89,14 +102,39 @@ def get_nlp(lang="en"):
     return instance
 
 
+def get_blank(lang="en"):
+    """Load spaCy language with only its tokenizer and no pipeline components, which is much faster than a model"""
+    instance = blank.get(lang)
+    if instance is None:
+        import spacy
+        try:
+            instance = spacy.blank(lang)
+        except ImportError:  # No language data for this language
+            instance = spacy.blank("xx")
+        blank[lang] = instance
+    return instance
+
+
 models = {}  # maps language two-letter code to name of spaCy model
 nlp = {}  # maps language two-letter code to actual loaded spaCy model
 tokenizer = {}  # maps language two-letter code to tokenizer of spaCy model
+blank = {}  # maps language two-letter code to spaCy language without a model, used just for tokenization
+# All are loaded on first use and kept for the process, so loading them before forking shares them with the children
 
 
 def get_tokenizer(tokenized=False, lang="en"):
-    instance = get_nlp(lang)
-    return instance.tokenizer if tokenized else tokenizer[lang]
+    """
+    Get a function from text (or from a list of tokens, if tokenized) to a spaCy Doc, without annotation.
+    The full model is not loaded for this: if it is not loaded already, only the language's tokenizer is.
+    """
+    instance = nlp.get(lang)
+    if instance is not None:
+        return instance.tokenizer if tokenized else tokenizer[lang]
+    instance = get_blank(lang)
+    if tokenized:
+        from spacy.tokens import Doc
+        return lambda words: Doc(instance.vocab, words=words)
+    return instance.tokenizer
 
 
 def get_vocab(vocab=None, lang=None):
@@ -108,6 +146,8 @@ def get_vocab(vocab=None, lang=None):
 def get_word_vectors(dim=None, size=None, filename=None, vocab=None):
     """
     Get word vectors from spaCy model or from text file
+    If the text file has a binary cache (see save_word_vectors_cache) at least as new as it, or if the filename is of
+    the cache's matrix file, the vectors are not read to memory: a WordVectors mapping into the cache is returned.
     :param dim: dimension to trim vectors to (default: keep original)
     :param size: maximum number of vectors to load (default: all)
     :param filename: text file to load vectors from (default: from spaCy model)
@@ -127,7 +167,17 @@ def get_word_vectors(dim=None, size=None, filename=None, vocab=None):
         lex = vocab[word]
         return getattr(lex, "orth", lex)
 
-    if filename:
+    cache = filename and load_word_vectors_cache(filename)
+    if cache:
+        matrix, words = cache
+        nr_dim = matrix.shape[1] if dim is None or dim >= matrix.shape[1] else int(dim)
+        if orig_keys:
+            keys, rows = words[:size], None
+        else:
+            keys, rows = list(zip(*islice(((_lookup(w), i) for i, w in enumerate(words) if w in vocab), size))) or \
+                         ((), ())
+        vectors = WordVectors(matrix, keys, rows, dim=nr_dim)
+    elif filename:
         it = read_word_vectors(dim, size, filename)
         nr_row, nr_dim = next(it)
         vectors = OrderedDict(islice(tqdm(((_lookup(w), v) for w, v in it if orig_keys or w in vocab),
@@ -177,6 +227,108 @@ def read_word_vectors(dim, size, filename):
         raise IOError("Failed loading word vectors from '%s'" % filename) from e
 
 
+WORD_VECTORS_MATRIX_SUFFIX = ".npy"
+WORD_VECTORS_WORDS_SUFFIX = ".words"
+
+
+class WordVectors(Mapping):
+    """
+    Read-only dict of word (string or integer) -> vector (NumPy array), for vectors in rows of a matrix, which may be
+    memory-mapped: each vector is a view of its row, trimmed to the dimension, created only when it is looked up
+    """
+    def __init__(self, matrix, keys, rows=None, dim=None):
+        """
+        :param matrix: NumPy array (or memmap) with a row per vector
+        :param keys: key of each vector, in order
+        :param rows: matrix row of each vector (default: the first len(keys) rows)
+        :param dim: dimension to trim vectors to, keeping the last ones, like read_word_vectors (default: keep all)
+        """
+        self.matrix = matrix
+        self.dim = dim or matrix.shape[1]
+        self._keys = keys
+        self._rows = rows
+        self._index = None
+
+    @property
+    def index(self):
+        """
+        Dict of key -> matrix row, created on first access (the last row is used for repeated keys, as in a dict)
+        """
+        if self._index is None:
+            self._index = dict(zip(self._keys, range(len(self._keys)) if self._rows is None else self._rows))
+        return self._index
+
+    def __getitem__(self, key):
+        return self.matrix[self.index[key], -self.dim:]
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+
+def word_vectors_cache_paths(filename):
+    """
+    :param filename: text file of word vectors
+    :return: tuple of file names of the binary cache: (matrix in NumPy format, words with one per line)
+    """
+    base = filename[:-len(WORD_VECTORS_MATRIX_SUFFIX)] if filename.endswith(WORD_VECTORS_MATRIX_SUFFIX) else filename
+    return base + WORD_VECTORS_MATRIX_SUFFIX, base + WORD_VECTORS_WORDS_SUFFIX
+
+
+def save_word_vectors_cache(filename):
+    """
+    Convert text file of word vectors (see read_word_vectors) to a binary cache, loaded much faster by get_word_vectors
+    Vectors are written to a temporary file one by one, so that they need not all be in memory at once.
+    :param filename: text file to load vectors from
+    :return: tuple of file names of the cache, see word_vectors_cache_paths
+    """
+    matrix_file, words_file = word_vectors_cache_paths(filename)
+    it = read_word_vectors(None, None, filename)
+    nr_row, nr_dim = next(it)
+    rows = 0
+    with tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(matrix_file))) as raw, \
+            open(words_file + ".tmp", "w", encoding="utf-8") as words:
+        for word, vector in tqdm(it, desc="Converting '%s'" % filename, postfix=dict(dim=nr_dim), file=sys.stdout,
+                                 total=nr_row, unit=" vectors"):
+            raw.write(vector.tobytes())
+            print(word, file=words)
+            rows += 1
+        raw.flush()
+        matrix = np.lib.format.open_memmap(matrix_file + ".tmp", mode="w+", dtype="f", shape=(rows, nr_dim))
+        if rows:
+            matrix[:] = np.memmap(raw, dtype="f", mode="r", shape=(rows, nr_dim))
+        matrix.flush()
+        del matrix
+    os.replace(words_file + ".tmp", words_file)
+    os.replace(matrix_file + ".tmp", matrix_file)  # Last, as its time is compared to the text file's
+    return matrix_file, words_file
+
+
+def load_word_vectors_cache(filename):
+    """
+    :param filename: text file of word vectors, or the matrix file of its binary cache
+    :return: tuple of (memory-mapped matrix, list of words), or None if there is no cache as new as the text file
+    """
+    matrix_file, words_file = word_vectors_cache_paths(filename)
+    try:
+        if filename != matrix_file and os.path.getmtime(matrix_file) < os.path.getmtime(filename):
+            return None  # Outdated
+        matrix = np.load(matrix_file, mmap_mode="r")
+        with open(words_file, encoding="utf-8") as f:
+            words = f.read().splitlines()
+    except OSError:
+        return None
+    if len(words) != len(matrix):
+        raise IOError("Corrupt word vectors cache: %d words but %d vectors in '%s'" % (
+            len(words), len(matrix), matrix_file))
+    return matrix, words
+
+
 def annotate(passage, *args, **kwargs):
     """
     Run spaCy pipeline on the given passage, unless already annotated
@@ -185,17 +337,23 @@ def annotate(passage, *args, **kwargs):
     list(annotate_all([passage], *args, **kwargs))
 
 
-def annotate_as_tuples(passages, replace=False, as_array=False, lang="en", vocab=None, verbose=False):
+def annotate_as_tuples(passages, replace=False, as_array=False, lang="en", vocab=None, verbose=False, n_process=None,
+                       batch_size=None, cache=None):
+    if cache is None and os.environ.get(ANNOTATION_CACHE_ENV_VAR):
+        cache = AnnotationCache(os.environ[ANNOTATION_CACHE_ENV_VAR])
+    elif cache is True:
+        cache = AnnotationCache()
     for passage_lang, passages_by_lang in groupby(passages, get_lang):
         for need_annotation, stream in groupby(to_annotate(passages_by_lang, replace, as_array), lambda x: bool(x[0])):
-            annotated = get_nlp(passage_lang or lang).pipe(
-                stream, as_tuples=True, n_threads=N_THREADS, batch_size=BATCH_SIZE) if need_annotation else stream
+            annotated = annotate_arrays(stream, passage_lang or lang, n_process=n_process, batch_size=batch_size,
+                                        cache=cache or None) if need_annotation else stream
             annotated = set_docs(annotated, as_array, passage_lang or lang, vocab, replace, verbose)
             for passage, passages in groupby(annotated, itemgetter(0)):
                 yield deque(passages, maxlen=1).pop()  # Wait until all paragraphs have been annotated
 
 
-def annotate_all(passages, replace=False, as_array=False, as_tuples=False, lang="en", vocab=None, verbose=False):
+def annotate_all(passages, replace=False, as_array=False, as_tuples=False, lang="en", vocab=None, verbose=False,
+                 n_process=None, batch_size=None, cache=None):
     """
     Run spaCy pipeline on the given passages, unless already annotated
     :param passages: iterable of Passage objects, whose layer 0 nodes will be added entries in the `extra' dict
@@ -205,14 +363,134 @@ def annotate_all(passages, replace=False, as_array=False, as_tuples=False, lang=
     :param lang: optional two-letter language code, will be overridden if passage has "lang" attrib
     :param vocab: optional dictionary of vocabulary IDs to string values, to avoid loading spaCy model
     :param verbose: whether to print annotated text
+    :param n_process: number of processes for spaCy to annotate in (default: N_PROCESS)
+    :param batch_size: number of paragraphs for spaCy to annotate at a time (default: BATCH_SIZE)
+    :param cache: AnnotationCache to take annotations from and add them to, or True to use one in the default
+                  directory (default: the directory in the ANNOTATION_CACHE_ENV_VAR environment variable, if set)
     :return generator of annotated passages, which are actually modified in-place (same objects as input)
     """
     if not as_tuples:
         passages = ((p,) for p in passages)
-    for t in annotate_as_tuples(passages, replace=replace, as_array=as_array, lang=lang, vocab=vocab, verbose=verbose):
+    for t in annotate_as_tuples(passages, replace=replace, as_array=as_array, lang=lang, vocab=vocab, verbose=verbose,
+                                n_process=n_process, batch_size=batch_size, cache=cache):
         yield t if as_tuples else t[0]
 
 
+def annotate_arrays(stream, lang="en", n_process=None, batch_size=None, cache=None):
+    """
+    Run spaCy pipeline on tokenized paragraphs, unless their annotation is in the cache, keeping the order
+    :param stream: iterable of (list of tokens, context) tuples
+    :param lang: two-letter language code
+    :param n_process: number of processes for spaCy to annotate in (default: N_PROCESS)
+    :param batch_size: number of paragraphs for spaCy to annotate at a time (default: BATCH_SIZE)
+    :param cache: optional AnnotationCache; the spaCy model is loaded only if some paragraph is not in it
+    :return generator of (array of attribute value IDs, with a row per token and a column per Attr, context) tuples
+    """
+    pending = deque()  # (tokens, context, array or None if passed on to spaCy)
+
+    def _to_parse():
+        for tokens, context in stream:
+            arr = None if cache is None else cache.get(lang, tokens)
+            pending.append((tokens, context, arr))
+            if arr is None:
+                yield tokens
+
+    to_parse = _to_parse()
+    first = next(to_parse, None)
+    if first is not None:
+        n_process = N_PROCESS if n_process is None else n_process
+        kwargs = dict(n_process=n_process) if n_process != 1 else {}  # Older spaCy versions do not support n_process
+        for doc in get_nlp(lang).pipe(chain([first], to_parse), batch_size=batch_size or BATCH_SIZE, **kwargs):
+            while pending[0][2] is not None:  # Cached, so not passed on to spaCy
+                _, context, arr = pending.popleft()
+                yield arr, context
+            tokens, context, _ = pending.popleft()
+            arr = to_array(doc)
+            if cache is not None:
+                cache.put(lang, tokens, arr)
+            yield arr, context
+    for _, context, arr in pending:
+        yield arr, context
+
+
+def to_array(doc):
+    """
+    :param doc: spaCy Doc
+    :return: NumPy array of attribute value IDs, with a row per token and a column per Attr
+    """
+    from spacy import attrs
+    return doc.to_array([getattr(attrs, a.name) for a in Attr])
+
+
+class AnnotationCache:
+    """
+    On-disk cache of spaCy annotations of tokenized paragraphs (see to_array), keyed by the tokens and by the name and
+    version of the spaCy model, so that annotating the same text again does not even load the model.
+    Entries are written to a temporary file and renamed, so several processes can use the same cache directory at once.
+    """
+    def __init__(self, cache_dir=None):
+        """
+        :param cache_dir: directory to keep the annotations in, created if it does not exist
+                          (default: "ucca/annotations" in the user cache directory)
+        """
+        self.cache_dir = cache_dir or os.path.join(
+            os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "ucca", "annotations")
+        self._models = {}
+
+    def _model(self, lang):
+        model = self._models.get(lang)
+        if model is None:
+            name = get_model_name(lang)
+            try:
+                from importlib.metadata import version
+                model_version = version(name)
+            except Exception:  # Not installed as a package (or importlib.metadata not available): use name only
+                model_version = None
+            model = self._models[lang] = (name, model_version)
+        return model
+
+    def path(self, lang, tokens):
+        """
+        :param lang: two-letter language code, determining the spaCy model
+        :param tokens: list of token strings
+        :return: path of the cache entry for the annotation of these tokens
+        """
+        key = hashlib.sha1(json.dumps([self._model(lang), [a.name for a in Attr], list(tokens)]).encode("utf-8"))
+        key = key.hexdigest()
+        return os.path.join(self.cache_dir, key[:2], key[2:] + ".npy")
+
+    def get(self, lang, tokens):
+        """
+        :return: array of the annotation of the given tokens (see to_array), or None if it is not in the cache
+        """
+        try:
+            return np.load(self.path(lang, tokens))
+        except (IOError, ValueError):  # Not cached, or written by an incompatible version of NumPy
+            return None
+
+    def put(self, lang, tokens, arr):
+        """
+        Add the annotation of the given tokens to the cache, if the cache directory is writable
+        """
+        path = self.path(lang, tokens)
+        f = io.BytesIO()
+        np.save(f, arr)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, temp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        except OSError:  # Not writable: annotate without caching
+            return
+        try:
+            with os.fdopen(fd, "wb") as h:
+                h.write(f.getvalue())
+            os.replace(temp, path)  # Atomic, so other processes never see a partial entry
+        except IOError:
+            try:
+                os.remove(temp)
+            except IOError:
+                pass
+
+
 def get_lang(passage_context):
     return passage_context[0].attrib.get("lang")
 
@@ -237,21 +515,23 @@ def is_annotated(passage, as_array):
 
 
 def set_docs(annotated, as_array, lang, vocab, replace, verbose):
-    """Given spaCy annotations, set values in layer0.extra per paragraph if as_array=True, or else in Terminal.extra"""
-    for doc, (i, terminals, passage, *context) in annotated:
-        if doc:  # Not empty, so copy values
-            from spacy import attrs
-            arr = doc.to_array([getattr(attrs, a.name) for a in Attr])
+    """Given spaCy annotations as arrays (see to_array), set values in layer0.extra per paragraph if as_array=True,
+    or else in Terminal.extra"""
+    memo = {}  # Shared by all paragraphs, as most values repeat
+    for arr, (i, terminals, passage, *context) in annotated:
+        if len(arr):  # Not empty, so copy values
+            rows = zip(*resolve_array(arr, get_vocab(vocab, lang), as_array=as_array, memo=memo))
             if as_array:
                 docs = passage.layer(layer0.LAYER_ID).docs(i + 1)
                 existing = docs[i] + (len(arr) - len(docs[i])) * [len(Attr) * [None]]
-                docs[i] = [[a(v if e is None or replace else e, get_vocab(vocab, lang), as_array=True)
-                            for a, v, e in zip(Attr, values, es)] for values, es in zip(arr, existing)]
+                docs[i] = [list(values) if replace or not any(e is not None for e in es) else
+                           [v if e is None else a(e, get_vocab(vocab, lang), as_array=True)
+                            for a, v, e in zip(Attr, values, es)] for values, es in zip(rows, existing)]
             else:
-                for terminal, values in zip(terminals, arr):
+                for terminal, values in zip(terminals, rows):
                     for attr, value in zip(Attr, values):
                         if replace or not terminal.extra.get(attr.key):
-                            terminal.extra[attr.key] = attr(value, get_vocab(vocab, lang))
+                            terminal.extra[attr.key] = value
         if verbose:
             data = [[a.key for a in Attr]] + \
                    [[str(a(t.tok[a.value], get_vocab(vocab, lang)) if as_array else t.extra[a.key])
@@ -266,17 +546,133 @@ def set_docs(annotated, as_array, lang, vocab, replace, verbose):
         yield (passage,) + tuple(context)
 
 
+def resolve_array(arr, vocab, as_array=False, memo=None):
+    """
+    Resolve a whole array of attribute value IDs at once, giving the same values as calling each Attr on its column:
+    integer columns are converted together by NumPy, and each distinct string ID is looked up in the vocab only once
+    :param arr: NumPy array with a row per token and a column per Attr (see to_array)
+    :param vocab: spaCy Vocab to look up strings in
+    :param as_array: whether to resolve to int rather than to string, see Attr.__call__
+    :param memo: optional dict of values already looked up, to reuse across arrays with the same vocab and as_array
+    :return: list of columns, each a list with the resolved value for each token
+    """
+    if memo is None:
+        memo = {}
+    columns = []
+    for attr, column in zip(Attr, np.asarray(arr).T):
+        if attr in (Attr.ENT_IOB, Attr.HEAD):  # Signed, e.g. HEAD is the relative position of the head
+            columns.append((column.view(np.int64) if column.dtype == np.uint64 else column.astype(np.int64)).tolist())
+        elif as_array and attr not in (Attr.ORTH, Attr.LEMMA):  # Kept as is
+            columns.append(column.tolist())
+        else:
+            values = column.tolist()
+            for value in set(values).difference(memo):
+                if as_array:  # Check that the string exists
+                    try:
+                        vocab.strings[value]
+                        memo[value] = value
+                    except KeyError:
+                        memo[value] = None
+                else:
+                    try:
+                        memo[value] = vocab[value].text
+                    except KeyError:
+                        memo[value] = None
+            columns.append([memo[value] for value in values])
+    return columns
+
+
 SENTENCE_END_MARKS = ('.', '?', '!')
+SENTENCE_END_CHARS = frozenset(".?!…")  # Tokens consisting only of these end sentences in split_sentences_by_rules
+CLOSING_PUNCT = frozenset(('"', "'", "''", "”", "’", "»", ")", "]", "}"))  # Attached to the preceding sentence end
+ABBREVIATIONS = {  # Lowercase tokens (without the period) after which a period does not end a sentence
+    "en": {"mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "mt", "vs", "etc", "e.g", "i.e", "cf", "al", "no", "vol",
+           "fig", "jan", "feb", "mar", "apr", "jun", "jul", "aug", "sep", "sept", "oct", "nov", "dec", "inc", "ltd",
+           "co", "corp", "gen", "col", "lt", "sgt", "capt", "gov", "sen", "rep", "u.s"},
+    "fr": {"m", "mm", "mme", "mlle", "dr", "pr", "st", "ste", "etc", "cf", "av", "apr", "p", "vol", "no"},
+    "de": {"hr", "fr", "dr", "prof", "st", "bzw", "ca", "usw", "vgl", "z.b", "d.h", "u.a", "nr", "bsp", "jh"},
+}
+DEFAULT_SENTENCE_SPLITTER = "parser"
+sentence_splitters = {}  # maps language two-letter code to the name of the sentence splitter to use by default
+
+
+def split_sentences_by_parser(tokens, lang="en"):
+    """Sentence ends according to the full spaCy pipeline, including the dependency parser"""
+    return [span.end for span in get_nlp(lang=lang)(tokens).sents]
+
+
+def split_sentences_by_sentencizer(tokens, lang="en"):
+    """Sentence ends according to spaCy's rule-based sentencizer, which needs no model beyond the language's vocab"""
+    sentencizer = sentencizers.get(lang)
+    if sentencizer is None:
+        from spacy.pipeline import Sentencizer
+        sentencizer = sentencizers[lang] = Sentencizer()
+    from spacy.tokens import Doc
+    return [span.end for span in sentencizer(Doc(get_blank(lang).vocab, words=tokens)).sents]
+
+
+def split_sentences_by_rules(tokens, lang="en"):
+    """
+    Sentence ends according to punctuation: after a token of sentence-final punctuation, and any more of it or closing
+    quotes or brackets after it, unless it is a period after a known abbreviation or a single letter (an initial), or
+    the next token starts with a lowercase letter. Needs no spaCy at all.
+    """
+    abbreviations = ABBREVIATIONS.get(lang, ())
+    ends = []
+    for i, token in enumerate(tokens):
+        if not token or not SENTENCE_END_CHARS.issuperset(token) or ends and i < ends[-1]:
+            continue
+        if token == "." and i > 0:
+            previous = tokens[i - 1].lower()
+            if previous in abbreviations or len(previous) == 1 and previous.isalpha():
+                continue
+        end = i + 1
+        while end < len(tokens) and (tokens[end] in CLOSING_PUNCT or SENTENCE_END_CHARS.issuperset(tokens[end])):
+            end += 1
+        if end < len(tokens) and tokens[end][:1].islower():
+            continue
+        ends.append(end)
+    if tokens and (not ends or ends[-1] < len(tokens)):
+        ends.append(len(tokens))
+    return ends
+
+
+SENTENCE_SPLITTERS = {
+    "parser": split_sentences_by_parser,
+    "sentencizer": split_sentences_by_sentencizer,
+    "rules": split_sentences_by_rules,
+}
+sentencizers = {}  # maps language two-letter code to spaCy sentencizer
+
+
+def get_sentence_splitter(splitter=None, lang="en"):
+    """
+    :param splitter: name of sentence splitter out of SENTENCE_SPLITTERS, or a function from list of tokens and lang to
+                     list of sentence end positions (default: by `sentence_splitters' dict or DEFAULT_SENTENCE_SPLITTER)
+    :param lang: two-letter language code
+    :return: sentence splitter function
+    """
+    if splitter is None:
+        splitter = sentence_splitters.get(lang, DEFAULT_SENTENCE_SPLITTER)
+    if callable(splitter):
+        return splitter
+    try:
+        return SENTENCE_SPLITTERS[splitter]
+    except KeyError as e:
+        raise ValueError("Unknown sentence splitter '%s', choose from: %s" % (
+            splitter, ", ".join(SENTENCE_SPLITTERS))) from e
 
 
-def break2sentences(passage, lang="en", *args, **kwargs):
+def break2sentences(passage, lang="en", *args, splitter=None, **kwargs):
     """
     Breaks paragraphs into sentences according to the annotation.
 
     A sentence is a list of terminals which ends with a mark from
     SENTENCE_END_MARKS, and is also the end of a paragraph or parallel scene.
+    If the passage is not annotated, a sentence splitter is used instead (see get_sentence_splitter).
     :param passage: the Passage object to operate on
     :param lang: optional two-letter language code
+    :param splitter: sentence splitter to use if the passage is not annotated, see get_sentence_splitter
     :return a list of positions in the Passage, each denotes a closing Terminal of a sentence.
     """
     del args, kwargs
@@ -293,9 +689,8 @@ def break2sentences(passage, lang="en", *args, **kwargs):
         # mark closed the parallel scene, and this mark doesn't open a scene
         # in any way (hence it probably just "hangs" there), it's a sentence end
         marks = [x for x in marks if x in ps_ends or ((x - 1) in ps_ends and x not in ps_starts)]
-    else:  # Not labeled, split using spaCy
-        annotated = get_nlp(lang=lang)([t.text for t in terminals])
-        marks = [span.end for span in annotated.sents]
+    else:  # Not labeled, split using a sentence splitter
+        marks = get_sentence_splitter(splitter, lang)([t.text for t in terminals], lang=lang)
     marks = sorted(set(marks + break2paragraphs(passage)))
     # Avoid punctuation-only sentences
     if len(marks) > 1:
@@ -337,14 +732,14 @@ def indent_xml(xml_as_string):
     """
     tabs = 0
     lines = str(xml_as_string).replace('><', '>\n<').splitlines()
-    s = ''
+    indented = []
     for line in lines:
         if line.startswith('</'):
             tabs -= 1
-        s += ("  " * tabs) + line + '\n'
+        indented.append(("  " * tabs) + line + '\n')
         if not (line.endswith('/>') or line.startswith('</')):
             tabs += 1
-    return s
+    return "".join(indented)
 
 
 @contextmanager